@@ -2,6 +2,13 @@
 REM This script automates the setup and execution of the JustCode server.
 REM It checks for a virtual environment, creates it if missing,
 REM activates it, and installs dependencies if needed.
+REM
+REM Usage: app.bat [--production]
+REM   --production  Use the pooled production server instead of the Flask
+REM                 development server (same as JUSTCODE_SERVER_MODE=production).
+
+REM --- Parse Options ---
+IF "%~1"=="--production" SET JUSTCODE_SERVER_MODE=production
 
 REM --- Create Virtual Environment if it doesn't exist ---
 IF NOT EXIST "venv" (
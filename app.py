@@ -1,123 +1,76 @@
 import os
-import json
-import uuid
-import threading
-from flask import Flask, request, Response
+import sys
+import importlib
+from flask import Flask
 from flask_cors import CORS
-from flask_sock import Sock
 from dotenv import load_dotenv
 
-from server.get_context_endpoint import get_context
-from server.deploy_code_endpoint import deploy_code
-from server.undo_endpoint import undo
-from server.redo_endpoint import redo
-from server.update_endpoint import update_app
-from server.agent_endpoint import agent_execute
+from server.tools.compression import init_compression
+from server.tools.metrics import init_metrics
+from server.tools.sendfile import SendfileMiddleware
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
-sock = Sock(app)
+# Custom response headers must be exposed explicitly so the extension can read them.
+CORS(app, expose_headers=['X-JustCode-Context-Token', 'X-JustCode-Context-Mode', 'X-JustCode-Job-Id', 'Server-Timing'])
+init_compression(app)
+init_metrics(app)
+# File responses (context packs) go from the page cache to the socket with sendfile().
+app.wsgi_app = SendfileMiddleware(app.wsgi_app)
 
-# Register routes from endpoint modules
-app.add_url_rule('/getcontext', 'get_context', get_context, methods=['GET'])
-app.add_url_rule('/deploycode', 'deploy_code', deploy_code, methods=['POST'])
-app.add_url_rule('/undo', 'undo', undo, methods=['GET', 'POST'])
-app.add_url_rule('/redo', 'redo', redo, methods=['GET', 'POST'])
-app.add_url_rule('/update', 'update_app', update_app, methods=['POST'])
-app.add_url_rule('/agent/execute', 'agent_execute', agent_execute, methods=['POST'])
-
-# --- MCP / WebSocket Bridge Logic ---
-
-# Store active WebSocket connections (usually just one, the chrome extension)
-ws_connections = []
-# Store pending requests: { request_id: { 'event': threading.Event(), 'response': None } }
-pending_requests = {}
-
-@sock.route('/ws')
-def websocket_handler(ws):
-    """
-    WebSocket endpoint for the Chrome Extension to connect to.
+def lazy_view(module_name, function_name):
     """
-    ws_connections.append(ws)
-    print(f"MCP: Extension connected. Total clients: {len(ws_connections)}")
-    try:
-        while True:
-            data = ws.receive()
-            if data:
-                try:
-                    msg = json.loads(data)
-                    # Handle response from Extension
-                    if msg.get('type') == 'mcp_response':
-                        req_id = msg.get('id')
-                        if req_id in pending_requests:
-                            pending_requests[req_id]['response'] = msg.get('text')
-                            pending_requests[req_id]['event'].set()
-                except Exception as e:
-                    print(f"MCP: Error parsing WS message: {e}")
-    except Exception:
-        pass
-    finally:
-        if ws in ws_connections:
-            ws_connections.remove(ws)
-        print("MCP: Extension disconnected.")
-
-@app.route('/mcp/prompt', methods=['POST'])
-def mcp_prompt_endpoint():
-    """
-    HTTP Endpoint for external tools (MCP Client / Curl).
-    Sends prompt to Chrome, waits for answer, returns answer.
+    A view that imports its endpoint module on the first request. Endpoint modules (and flask_sock,
+    which the WebSocket bridge needs) are not loaded at startup, so the server is up sooner.
     """
-    if not ws_connections:
-        return Response("Error: JustCode Chrome Extension is not connected via WebSocket.", status=503, mimetype='text/plain')
-
-    try:
-        req_data = request.get_json(force=True)
-        user_prompt = req_data.get('prompt')
-        if not user_prompt:
-            return Response("Error: Missing 'prompt' field in JSON.", status=400, mimetype='text/plain')
+    resolved = []
+    def view(*args, **kwargs):
+        if not resolved:
+            resolved.append(getattr(importlib.import_module(module_name), function_name))
+        return resolved[0](*args, **kwargs)
+    view.__name__ = function_name
+    return view
 
-        req_id = str(uuid.uuid4())
-        event = threading.Event()
-        
-        # Store handle to wait
-        pending_requests[req_id] = {
-            'event': event,
-            'response': None
-        }
-
-        # Broadcast payload to extension
-        payload = json.dumps({
-            'type': 'mcp_request',
-            'id': req_id,
-            'prompt': user_prompt
-        })
-        
-        # Send to latest connection (most likely the active one)
-        try:
-            ws_connections[-1].send(payload)
-        except Exception as e:
-            return Response(f"Error sending to extension: {str(e)}", status=500, mimetype='text/plain')
+# Register routes from endpoint modules
+app.add_url_rule('/getcontext', 'get_context', lazy_view('server.get_context_endpoint', 'get_context'), methods=['GET'])
+app.add_url_rule('/deploycode', 'deploy_code', lazy_view('server.deploy_code_endpoint', 'deploy_code'), methods=['POST'])
+app.add_url_rule('/deploycode/batch', 'deploy_code_batch', lazy_view('server.deploy_code_endpoint', 'deploy_code_batch'), methods=['POST'])
+app.add_url_rule('/undo', 'undo', lazy_view('server.undo_endpoint', 'undo'), methods=['GET', 'POST'])
+app.add_url_rule('/redo', 'redo', lazy_view('server.redo_endpoint', 'redo'), methods=['GET', 'POST'])
+app.add_url_rule('/update', 'update_app', lazy_view('server.update_endpoint', 'update_app'), methods=['POST'])
+app.add_url_rule('/agent/execute', 'agent_execute', lazy_view('server.agent_endpoint', 'agent_execute'), methods=['POST'])
+app.add_url_rule('/jobs', 'list_jobs', lazy_view('server.jobs_endpoint', 'list_jobs'), methods=['GET'])
+app.add_url_rule('/jobs/<job_id>', 'get_job', lazy_view('server.jobs_endpoint', 'get_job'), methods=['GET'])
+app.add_url_rule('/jobs/<job_id>/logs', 'get_job_logs', lazy_view('server.jobs_endpoint', 'get_job_logs'), methods=['GET'])
+app.add_url_rule('/jobs/<job_id>/cancel', 'cancel_job', lazy_view('server.jobs_endpoint', 'cancel_job'), methods=['POST'])
 
-        # Wait for response (timeout 5 minutes for long generations)
-        is_set = event.wait(timeout=300) 
-        
-        result = pending_requests.pop(req_id, None)
-        
-        if not is_set:
-            return Response("Error: Timeout waiting for LLM response.", status=504, mimetype='text/plain')
-        
-        return Response(result['response'], mimetype='text/plain')
+# --- MCP / WebSocket Bridge (server/mcp_endpoint.py) ---
+app.add_url_rule('/ws', 'websocket_handler', lazy_view('server.mcp_endpoint', 'websocket_route'), websocket=True)
+app.add_url_rule('/mcp/prompt', 'mcp_prompt_endpoint', lazy_view('server.mcp_endpoint', 'mcp_prompt'), methods=['POST'])
 
-    except Exception as e:
-        return Response(f"Server Error: {str(e)}", status=500, mimetype='text/plain')
+def close_ws_connections():
+    """Closes open WebSocket connections so their workers can exit during shutdown."""
+    mcp_endpoint = sys.modules.get('server.mcp_endpoint')
+    if mcp_endpoint is not None:  # Never loaded: nobody connected.
+        mcp_endpoint.close_ws_connections()
 
 if __name__ == '__main__':
     # Get host and port from environment variables or use defaults
     host = os.getenv('FLASK_RUN_HOST', '127.0.0.1')
     port = int(os.getenv('FLASK_RUN_PORT', 5010))
+    server_mode = os.getenv('JUSTCODE_SERVER_MODE', 'development').lower()
 
-    # Note: threaded=True is required for threading.Event() to work with Flask dev server
-    app.run(host=host, port=port, use_reloader=True, reloader_type="watchdog", threaded=True)
\ No newline at end of file
+    if server_mode == 'production':
+        from server.tools.production_server import run_production_server
+        run_production_server(
+            app, host, port,
+            workers=int(os.getenv('JUSTCODE_WORKERS', 16)),
+            keepalive_timeout=float(os.getenv('JUSTCODE_KEEPALIVE_TIMEOUT', 15)),
+            shutdown_timeout=float(os.getenv('JUSTCODE_SHUTDOWN_TIMEOUT', 10)),
+            on_shutdown=close_ws_connections
+        )
+    else:
+        # Note: threaded=True is required for threading.Event() to work with Flask dev server
+        app.run(host=host, port=port, use_reloader=True, reloader_type="watchdog", threaded=True)
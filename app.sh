@@ -2,6 +2,15 @@
 # This script automates the setup and execution of the JustCode server.
 # It checks for a virtual environment, creates it if missing,
 # activates it, and installs dependencies if needed.
+#
+# Usage: ./app.sh [--production]
+#   --production  Use the pooled production server instead of the Flask
+#                 development server (same as JUSTCODE_SERVER_MODE=production).
+
+# --- Parse Options ---
+if [ "$1" = "--production" ]; then
+    export JUSTCODE_SERVER_MODE=production
+fi
 
 # --- Create Virtual Environment if it doesn't exist ---
 if [ ! -d "venv" ]; then
@@ -0,0 +1,283 @@
+"""
+End-to-end benchmarks for context generation and deployment.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --files 2000 --iterations 10 --output bench_output.txt
+    python -m benchmarks.run_benchmarks --scenario context_from_path --scenario http_deploy
+
+Every scenario runs in its own subprocess (unless --in-process), so its peak RSS is its own.
+Results are printed (or written to --output) as JSON, to compare runs across versions.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_project import generate_project, generate_patterns, list_text_files
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile.
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def _build_deploy_script(project_root, files_to_overwrite, files_to_create, iteration):
+    """A deploy script overwriting existing files and creating new ones, like a typical LLM answer."""
+    parts = []
+    for rel_path in list_text_files(project_root, limit=files_to_overwrite):
+        with open(os.path.join(project_root, rel_path), 'r', encoding='utf-8') as f:
+            content = f.read().rstrip('\n')
+        parts.append(f"cat > ./{rel_path} << 'EOPROJECTFILE'\n{content}\n# edit {iteration}\nEOPROJECTFILE")
+    parts.append("mkdir -p ./bench_new")
+    for n in range(files_to_create):
+        parts.append(f"cat > ./bench_new/new{n}.py << 'EOPROJECTFILE'\ndef generated_{n}():\n    return {iteration}\nEOPROJECTFILE")
+    return "\n".join(parts) + "\n"
+
+def _copy_project(project_root):
+    scratch_root = tempfile.mkdtemp(prefix='justcode-bench-scratch-')
+    copy_root = os.path.join(scratch_root, 'project')
+    shutil.copytree(project_root, copy_root)
+    return copy_root
+
+def _cleanup_justcode_state(project_root):
+    """Removes everything the server keeps for a temporary project under .justcode/: history, snapshots, context packs, manifests."""
+    from server.tools.utils import get_justcode_root, get_project_id
+    shutil.rmtree(os.path.join(get_justcode_root(), '.justcode', get_project_id([project_root])), ignore_errors=True)
+
+def _flask_client():
+    try:
+        import app as justcode_app
+    except ImportError as e:
+        return None, f"Flask app could not be imported: {e}"
+    return justcode_app.app.test_client(), None
+
+# --- Scenarios ---
+# Each scenario gets (project_root, patterns, args) and returns (op, cleanup, skip_reason).
+# op() runs one iteration and returns the number of bytes it produced or consumed.
+
+def scenario_context_from_path(project_root, patterns, args):
+    from server.tools.context_generator import generate_context_from_path
+    def op():
+        return len(generate_context_from_path(project_root, [], patterns))
+    return op, None, None
+
+def scenario_tree_with_char_counts(project_root, patterns, args):
+    from server.tools.context_generator import generate_tree_with_char_counts
+    def op():
+        tree, total_chars, _ = generate_tree_with_char_counts(project_root, [], patterns)
+        return total_chars
+    return op, None, None
+
+def scenario_execute_script(project_root, patterns, args):
+    from server.tools.script_executor import execute_script
+    copy_root = _copy_project(project_root)
+    script = _build_deploy_script(copy_root, args.deploy_overwrite, args.deploy_create, 0)
+    def op():
+        execute_script(script, [copy_root], tolerate_errors=False)
+        return len(script)
+    return op, lambda: shutil.rmtree(os.path.dirname(copy_root), ignore_errors=True), None
+
+def scenario_http_getcontext(project_root, patterns, args):
+    client, error = _flask_client()
+    if client is None: return None, None, error
+    query = {'path': project_root, 'exclude': ','.join(patterns), 'limit': str(10 ** 12)}
+    def op():
+        response = client.get('/getcontext', query_string=query)
+        if response.status_code != 200: raise RuntimeError(response.get_data(as_text=True)[:500])
+        return len(response.get_data())
+    return op, None, None
+
+def scenario_http_deploy(project_root, patterns, args):
+    """Full /deploycode: rollback pass (snapshots), history bookkeeping and execution."""
+    client, error = _flask_client()
+    if client is None: return None, None, error
+    copy_root = _copy_project(project_root)
+    counter = [0]
+    def op():
+        counter[0] += 1
+        script = _build_deploy_script(copy_root, args.deploy_overwrite, args.deploy_create, counter[0])
+        response = client.post('/deploycode', query_string={'path': copy_root, 'tolerateErrors': 'false'}, data=script)
+        if response.status_code != 200: raise RuntimeError(response.get_data(as_text=True)[:500])
+        return len(script)
+    def cleanup():
+        _cleanup_justcode_state(copy_root)
+        shutil.rmtree(os.path.dirname(copy_root), ignore_errors=True)
+    return op, cleanup, None
+
+def scenario_http_undo_redo(project_root, patterns, args):
+    """One iteration is an /undo followed by a /redo of the same deploy."""
+    client, error = _flask_client()
+    if client is None: return None, None, error
+    copy_root = _copy_project(project_root)
+    script = _build_deploy_script(copy_root, args.deploy_overwrite, args.deploy_create, 1)
+    response = client.post('/deploycode', query_string={'path': copy_root, 'tolerateErrors': 'false'}, data=script)
+    if response.status_code != 200: raise RuntimeError(response.get_data(as_text=True)[:500])
+    def op():
+        for endpoint in ('/undo', '/redo'):
+            response = client.post(endpoint, query_string={'path': copy_root, 'tolerateErrors': 'false'})
+            if response.status_code != 200: raise RuntimeError(response.get_data(as_text=True)[:500])
+        return len(script)
+    def cleanup():
+        _cleanup_justcode_state(copy_root)
+        shutil.rmtree(os.path.dirname(copy_root), ignore_errors=True)
+    return op, cleanup, None
+
+SCENARIOS = {
+    'context_from_path': scenario_context_from_path,
+    'tree_with_char_counts': scenario_tree_with_char_counts,
+    'execute_script': scenario_execute_script,
+    'http_getcontext': scenario_http_getcontext,
+    'http_deploy': scenario_http_deploy,
+    'http_undo_redo': scenario_http_undo_redo,
+}
+
+def run_scenario(name, project_root, patterns, args):
+    op, cleanup, skip_reason = SCENARIOS[name](project_root, patterns, args)
+    if op is None:
+        return {'skipped': skip_reason}
+    try:
+        for _ in range(args.warmup):
+            op()
+        latencies = []
+        total_bytes = 0
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            total_bytes += op()
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+    finally:
+        if cleanup: cleanup()
+
+    latencies.sort()
+    return {
+        'iterations': len(latencies),
+        'meanMs': round(sum(latencies) / len(latencies) * 1000, 3),
+        'p50Ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p99Ms': round(_percentile(latencies, 99) * 1000, 3),
+        'minMs': round(latencies[0] * 1000, 3),
+        'maxMs': round(latencies[-1] * 1000, 3),
+        'opsPerSec': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'mbPerSec': round(total_bytes / elapsed / (1024 * 1024), 3) if elapsed else None,
+        'bytesPerOp': total_bytes // len(latencies),
+        'peakRssMb': _peak_rss_mb(),
+    }
+
+def _run_scenario_in_subprocess(name, project_root, args):
+    command = [
+        sys.executable, '-m', 'benchmarks.run_benchmarks', '--child', '--scenario', name,
+        '--project-dir', project_root, '--iterations', str(args.iterations), '--warmup', str(args.warmup),
+        '--patterns', str(args.patterns), '--seed', str(args.seed),
+        '--deploy-overwrite', str(args.deploy_overwrite), '--deploy-create', str(args.deploy_create),
+    ]
+    result = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {'error': (result.stderr or result.stdout).strip()[-2000:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def _git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=False)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="JustCode context/deploy benchmarks.")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Scenario to run (repeatable). Default: all.")
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--files', type=int, default=1000, help="Files in the synthetic project.")
+    parser.add_argument('--depth', type=int, default=4, help="Maximum directory depth.")
+    parser.add_argument('--median-size', type=int, default=2000, help="Median file size in bytes.")
+    parser.add_argument('--size-sigma', type=float, default=1.0, help="Spread of the log-normal file size distribution.")
+    parser.add_argument('--binary-ratio', type=float, default=0.05)
+    parser.add_argument('--patterns', type=int, default=10, help="Number of exclude patterns.")
+    parser.add_argument('--deploy-overwrite', type=int, default=20, help="Existing files rewritten per deploy.")
+    parser.add_argument('--deploy-create', type=int, default=20, help="New files created per deploy.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--project-dir', help="Use (or generate into) this directory instead of a temporary one.")
+    parser.add_argument('--in-process', action='store_true', help="Run all scenarios in this process (peak RSS is then cumulative).")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenario_names = args.scenario or list(SCENARIOS)
+    patterns = generate_patterns(args.patterns, seed=args.seed)
+
+    if args.child:
+        print(json.dumps(run_scenario(scenario_names[0], args.project_dir, patterns, args)))
+        return 0
+
+    temp_dir = None
+    project_root = args.project_dir
+    if not project_root:
+        temp_dir = tempfile.mkdtemp(prefix='justcode-bench-')
+        project_root = os.path.join(temp_dir, 'project')
+    project_root = os.path.abspath(project_root)
+
+    try:
+        project_summary = generate_project(
+            project_root, files=args.files, depth=args.depth, median_size=args.median_size,
+            size_sigma=args.size_sigma, binary_ratio=args.binary_ratio, seed=args.seed
+        )
+        results = {}
+        for name in scenario_names:
+            print(f"Running {name}...", file=sys.stderr)
+            if args.in_process:
+                results[name] = run_scenario(name, project_root, patterns, args)
+            else:
+                results[name] = _run_scenario_in_subprocess(name, project_root, args)
+    finally:
+        if temp_dir:
+            # The context scenarios leave context packs and manifests of the generated project in <repo>/.justcode/.
+            _cleanup_justcode_state(project_root)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    report = {
+        'revision': _git_revision(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'project': {k: v for k, v in project_summary.items() if k != 'root'},
+        'config': {
+            'iterations': args.iterations, 'warmup': args.warmup, 'patterns': args.patterns,
+            'depth': args.depth, 'medianSize': args.median_size, 'sizeSigma': args.size_sigma,
+            'binaryRatio': args.binary_ratio, 'deployOverwrite': args.deploy_overwrite, 'deployCreate': args.deploy_create,
+        },
+        'scenarios': results,
+    }
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: f.write(report_json + "\n")
+    else:
+        print(report_json)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
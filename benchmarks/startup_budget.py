@@ -0,0 +1,102 @@
+"""
+Startup budget check: measures import time of the server, the headless CLI and the MCP bridge
+with 'python -X importtime' and fails if one is over budget or loads a module it should defer.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_budget
+    python -m benchmarks.startup_budget --budget app=300 --repeat 9 --output startup.json
+
+Exit code 1 if a budget is exceeded or a deferred module is imported at startup.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# module -> (default budget in ms of cumulative import time, modules it must not import at startup)
+TARGETS = {
+    'app': (400, (
+        'flask_sock', 'simple_websocket', 'requests', 'server.mcp_endpoint',
+        'server.get_context_endpoint', 'server.deploy_code_endpoint', 'server.undo_endpoint', 'server.redo_endpoint',
+        'server.update_endpoint', 'server.agent_endpoint', 'server.jobs_endpoint',
+    )),
+    'server.cli': (150, ('flask', 'werkzeug', 'mcp', 'requests', 'tiktoken')),
+    'server.mcp_bridge': (1500, ('requests', 'flask')),
+}
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def measure_import(module, timeout=60):
+    """
+    Imports 'module' in a fresh interpreter. Returns (cumulative_ms, {imported module names}),
+    or raises RuntimeError with the interpreter's error output.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, timeout=timeout
+    )
+    imported = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            imported[match.group(4)] = int(match.group(2))
+    if result.returncode != 0 or module not in imported:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}")
+    return imported[module] / 1000.0, set(imported)
+
+def check_target(module, budget_ms, deferred, repeat):
+    try:
+        measure_import(module)  # Warm-up: writes .pyc files, fills the OS file cache.
+        runs = [measure_import(module) for _ in range(repeat)]
+    except RuntimeError as e:
+        return {'skipped': str(e)}
+    times = sorted(ms for ms, _ in runs)
+    imported = runs[-1][1]
+    loaded_deferred = sorted(name for name in imported if any(name == d or name.startswith(d + '.') for d in deferred))
+    median_ms = statistics.median(times)
+    return {
+        'medianMs': round(median_ms, 1),
+        'minMs': round(times[0], 1),
+        'maxMs': round(times[-1], 1),
+        'budgetMs': budget_ms,
+        'modules': len(imported),
+        'deferredModulesLoaded': loaded_deferred,
+        'ok': median_ms <= budget_ms and not loaded_deferred,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time budget check for the JustCode entry points.")
+    parser.add_argument('--target', action='append', choices=sorted(TARGETS), help="Entry point to check (repeatable). Default: all.")
+    parser.add_argument('--budget', action='append', default=[], metavar='MODULE=MS', help="Override a budget, e.g. app=300.")
+    parser.add_argument('--repeat', type=int, default=5, help="Measurements per entry point; the median is compared.")
+    parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    budgets = {module: budget for module, (budget, _) in TARGETS.items()}
+    for override in args.budget:
+        module, _, value = override.partition('=')
+        if module not in TARGETS or not value:
+            raise SystemExit(f"Invalid --budget '{override}', expected one of {sorted(TARGETS)}=<ms>.")
+        budgets[module] = float(value)
+
+    results = {}
+    for module in args.target or list(TARGETS):
+        print(f"Measuring {module}...", file=sys.stderr)
+        results[module] = check_target(module, budgets[module], TARGETS[module][1], args.repeat)
+
+    report_json = json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: f.write(report_json + "\n")
+    else:
+        print(report_json)
+    return 0 if all(r.get('ok', True) for r in results.values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
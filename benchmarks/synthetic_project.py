@@ -0,0 +1,109 @@
+import os
+import random
+import shutil
+
+# Extensions used for generated text files, roughly in the mix of a typical web/python repo.
+TEXT_EXTENSIONS = ['.py', '.js', '.ts', '.md', '.json', '.css', '.html', '.txt']
+BINARY_EXTENSIONS = ['.png', '.bin', '.woff2', '.zip']
+_WORDS = (
+    "def class return import from self value result context project path file script "
+    "config request response error data items index count name args kwargs none true false"
+).split()
+
+def _text_content(rng, size):
+    lines = []
+    length = 0
+    indent = 0
+    while length < size:
+        words = rng.choices(_WORDS, k=rng.randint(2, 10))
+        line = "    " * indent + " ".join(words)
+        lines.append(line)
+        length += len(line) + 1
+        indent = max(0, min(4, indent + rng.choice((-1, 0, 0, 1))))
+    return "\n".join(lines)[:size] + "\n"
+
+def _binary_content(rng, size):
+    # A NUL byte up front, so is_binary() classifies the file the same way real binaries are.
+    return b"\x00" + rng.randbytes(max(0, size - 1))
+
+def generate_project(root, files=1000, depth=4, median_size=2000, size_sigma=1.0, binary_ratio=0.05, dirs_per_level=4, seed=0):
+    """
+    Writes a synthetic project under 'root' (recreated if it exists) and returns a summary dict.
+
+    files: number of files. depth: maximum directory nesting. dirs_per_level: sub-directories per directory.
+    File sizes follow a log-normal distribution around median_size (bytes) with spread size_sigma,
+    so a few files are much larger than the rest, as in real repos.
+    binary_ratio: fraction of files written as binary (they end up in the tree but not in the context).
+    The same seed always produces the same project.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+
+    directories = ['']
+    frontier = ['']
+    for _ in range(depth):
+        next_frontier = []
+        for parent in frontier:
+            for i in range(dirs_per_level):
+                child = f"{parent}/dir{i}" if parent else f"dir{i}"
+                next_frontier.append(child)
+        directories.extend(next_frontier)
+        frontier = next_frontier
+        if len(directories) > files: break
+
+    total_bytes = 0
+    binary_files = 0
+    created_dirs = set()
+    for n in range(files):
+        directory = rng.choice(directories)
+        size = max(1, int(rng.lognormvariate(0, size_sigma) * median_size))
+        is_binary = rng.random() < binary_ratio
+        extension = rng.choice(BINARY_EXTENSIONS if is_binary else TEXT_EXTENSIONS)
+        rel_path = f"{directory}/file{n}{extension}" if directory else f"file{n}{extension}"
+        full_path = os.path.join(root, rel_path.replace('/', os.sep))
+        if directory not in created_dirs:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            created_dirs.add(directory)
+        if is_binary:
+            with open(full_path, 'wb') as f: f.write(_binary_content(rng, size))
+            binary_files += 1
+        else:
+            with open(full_path, 'w', encoding='utf-8', newline='\n') as f: f.write(_text_content(rng, size))
+        total_bytes += size
+
+    return {
+        'root': root,
+        'files': files,
+        'binaryFiles': binary_files,
+        'directories': len(created_dirs),
+        'totalBytes': total_bytes,
+        'seed': seed,
+    }
+
+def generate_patterns(count, seed=0):
+    """Returns 'count' exclude patterns in the style users put in profiles (dirs, extensions, globs)."""
+    rng = random.Random(seed)
+    base = ['.git/', 'node_modules/', '__pycache__/', '*.pyc', '*.min.js', 'dist/', 'build/', '.venv/', '*.log', '*.lock']
+    patterns = base[:count]
+    while len(patterns) < count:
+        kind = rng.random()
+        n = len(patterns)
+        if kind < 0.4:
+            patterns.append(f"vendor{n}/")
+        elif kind < 0.8:
+            patterns.append(f"*.gen{n}")
+        else:
+            patterns.append(f"dir{n % 4}/skip{n}_*")
+    return patterns
+
+def list_text_files(root, limit=None):
+    """Relative paths (with '/') of generated text files, sorted; used to build deploy scripts."""
+    rel_paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if os.path.splitext(filename)[1] in TEXT_EXTENSIONS:
+                rel_paths.append(os.path.relpath(os.path.join(dirpath, filename), root).replace(os.sep, '/'))
+    rel_paths.sort()
+    return rel_paths[:limit] if limit else rel_paths
@@ -6,6 +6,7 @@ import { applyReplacementsAndPaste } from './apply_replacements.js';
 import { injectShortcutListener } from './background/shortcuts.js';
 import { extractCodeWithFallback } from './deploy_code/robust_fallback.js';
 import { handleMcpRequest } from './mcp_handler.js';
+import { generateFileDelimiter } from './get_context/server_strategy.js';
 
 // --- Default settings ---
 const AppSettings = {
@@ -82,6 +83,31 @@ async function initializeAllTabs() {
 // --- WebSocket / MCP Logic ---
 let mcpSocket = null;
 
+// Tells the server which projects this profile works on, so it can prewarm their caches
+// (file list, stats, context pack) before the next "Get Context".
+async function announceProfile(socket, profileId) {
+    const profile = await new Promise(resolve => loadData(profiles => resolve(profiles.find(p => p.id === profileId))));
+    if (!profile || !profile.projectPaths) return;
+
+    // The context pack is keyed by the delimiter, so use (or create) the one "Get Context" will send.
+    const storageKey = `session_state_${profile.id}`;
+    const sessionState = (await chrome.storage.local.get(storageKey))[storageKey] || {};
+    if (!sessionState.fileDelimiter) {
+        sessionState.fileDelimiter = generateFileDelimiter();
+        await chrome.storage.local.set({ [storageKey]: sessionState });
+    }
+
+    if (socket.readyState !== WebSocket.OPEN) return;
+    socket.send(JSON.stringify({
+        type: 'profile',
+        paths: profile.projectPaths.filter(p => p && p.trim()),
+        exclude: profile.excludePatterns || '',
+        include: profile.includePatterns || '',
+        delimiter: sessionState.fileDelimiter,
+        useNumericPrefixes: !!profile.useNumericPrefixesForMultiProject
+    }));
+}
+
 function connectMcpSocket(serverUrl, profileId) {
     if (mcpSocket) {
         mcpSocket.close();
@@ -97,6 +123,7 @@ function connectMcpSocket(serverUrl, profileId) {
         mcpSocket.onopen = () => {
             console.log("MCP: WebSocket Connected.");
             updateProfileStatus(profileId, "MCP Connected", "success");
+            announceProfile(mcpSocket, profileId).catch(e => console.error("MCP: Profile announcement failed", e));
         };
 
         mcpSocket.onmessage = async (event) => {
@@ -149,6 +176,15 @@ function connectMcpSocket(serverUrl, profileId) {
     }
 }
 
+// Profile switch: prewarm the newly active profile instead.
+chrome.storage.onChanged.addListener((changes, namespace) => {
+    if (namespace !== 'local' || !changes.activeProfileId) return;
+    const { oldValue, newValue } = changes.activeProfileId;
+    if (mcpSocket && newValue && newValue !== oldValue) {
+        announceProfile(mcpSocket, newValue).catch(e => console.error("MCP: Profile announcement failed", e));
+    }
+});
+
 function disconnectMcpSocket() {
     if (mcpSocket) {
         mcpSocket.close();
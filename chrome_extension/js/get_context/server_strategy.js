@@ -20,7 +20,7 @@ function generateAgentDelimiter() {
     return `EOBASH${randomNum}`;
 }
 
-function generateFileDelimiter() {
+export function generateFileDelimiter() {
     const randomNum = Math.floor(Math.random() * 900) + 100;
     return `EOFILE${randomNum}`;
 }
@@ -1,7 +1,7 @@
 import os
 from flask import request, Response
 from .tools.agent_executor import execute_shell_command
-from .tools.script_executor import resolve_path
+from .tools.path_resolver import PathResolver
 
 def agent_execute():
     paths = request.args.getlist('path')
@@ -28,9 +28,7 @@ def agent_execute():
         # Default to the first project path.
         # If the user provided a specific path context in the command logic (not implemented here), we could use it.
         # For now, we execute in the root of the first project.
-        cwd = project_paths[0]
-        if os.path.isfile(cwd):
-            cwd = os.path.dirname(cwd)
+        cwd = PathResolver(project_paths, use_numeric_prefixes).main_dir
 
         output = execute_shell_command(command, cwd)
         return Response(output, mimetype='text/plain')
@@ -0,0 +1,208 @@
+"""
+Headless command line interface: builds contexts and applies deploy scripts without the Flask server.
+
+Usage (from the repository root):
+    python -m server context ~/proj --exclude '.git/,node_modules/' > context.txt
+    python -m server tree ~/proj --count-tokens
+    llm-tool ... | python -m server deploy ~/proj
+    python -m server deploy ~/proj --script answer.sh --tolerate-errors
+
+Only server.tools is imported (never Flask, the MCP bridge or the endpoint modules), so it starts fast.
+Deploys are recorded in the same undo history the server and the extension use.
+"""
+import os
+import sys
+import argparse
+import itertools
+from .tools.utils import here_doc_value
+from .tools.context_generator import (
+    filter_patterns_for_prefix, get_project_prefixes, generate_context_entries, format_context_entry,
+    generate_tree_with_char_counts, get_file_stats
+)
+from .tools.outline import DEFAULT_OUTLINE_THRESHOLD
+from .tools.large_files import get_max_file_size, tree_note
+
+def _split_patterns(value):
+    return [p.strip() for p in (value or '').split(',') if p.strip()]
+
+def _project_paths(paths, use_numeric_prefixes=False):
+    project_paths = [os.path.abspath(p.strip()) for p in paths if p.strip()]
+    for p_path in project_paths:
+        if not os.path.exists(p_path):
+            raise SystemExit(f"Error: Provided path '{p_path}' is not a valid directory or file.")
+    prefixes = []
+    if len(project_paths) > 1:
+        prefixes = get_project_prefixes(project_paths, use_numeric_prefixes)
+        if len(prefixes) != len(set(prefixes)):
+            raise SystemExit("Error: Multiple project paths result in the same name. Use --numeric-prefixes.")
+    return project_paths, prefixes
+
+def _open_output(path):
+    if not path or path == '-':
+        return sys.stdout
+    return open(path, 'w', encoding='utf-8', newline='')
+
+def cmd_context(args):
+    project_paths, all_prefixes = _project_paths(args.paths, args.numeric_prefixes)
+    exclude_patterns = _split_patterns(args.exclude)
+    include_patterns = _split_patterns(args.include)
+    outline_patterns = _split_patterns(args.outline)
+    full_patterns = _split_patterns(args.full)
+
+    trees = []
+    entries = []
+    for i, p_path in enumerate(project_paths):
+        prefix = all_prefixes[i] if all_prefixes else None
+        display_prefix = f"./{prefix}" if prefix else None
+        if os.path.isdir(p_path):
+            tree_part, project_entries = generate_context_entries(
+                p_path, filter_patterns_for_prefix(include_patterns, prefix, all_prefixes),
+                filter_patterns_for_prefix(exclude_patterns, prefix, all_prefixes),
+                path_prefix=display_prefix, use_git=args.use_git, mode=args.mode, outline_threshold=args.outline_threshold,
+                outline_patterns=filter_patterns_for_prefix(outline_patterns, prefix, all_prefixes),
+                full_patterns=filter_patterns_for_prefix(full_patterns, prefix, all_prefixes),
+                max_file_size=args.max_file_size
+            )
+            trees.append(tree_part)
+            entries.extend(project_entries)
+        else:
+            content, size, lines, truncated_size = get_file_stats(p_path, args.max_file_size)
+            if content is None: continue
+            filename = os.path.basename(p_path)
+            note = f" {tree_note(truncated_size)}" if truncated_size is not None else ""
+            trees.append(f"{display_prefix or './' + filename} ({size:,} chars, {lines:,} lines){note}")
+            entries.append((display_prefix or f"./{filename}", content))
+
+    total_size = sum(len(content) for _, content in entries)
+    if args.limit and total_size > args.limit:
+        print(f"Context size (~{total_size:,}) exceeds limit ({args.limit:,}).", file=sys.stderr)
+        return 2
+
+    out = _open_output(args.output)
+    try:
+        out.write("\n\n".join(trees) + "\n\n")
+        # Written entry by entry, so a consumer reading the pipe can start before the last file is formatted.
+        for path_in_script, content in entries:
+            out.write(format_context_entry(path_in_script, content, args.delimiter))
+        out.flush()
+    finally:
+        if out is not sys.stdout: out.close()
+    return 0
+
+def cmd_tree(args):
+    project_paths, all_prefixes = _project_paths(args.paths, args.numeric_prefixes)
+    exclude_patterns = _split_patterns(args.exclude)
+    include_patterns = _split_patterns(args.include)
+
+    trees = []
+    total_size = 0
+    total_tokens = 0
+    for i, p_path in enumerate(project_paths):
+        if not os.path.isdir(p_path): continue
+        prefix = all_prefixes[i] if all_prefixes else None
+        tree, size, tokens = generate_tree_with_char_counts(
+            p_path, filter_patterns_for_prefix(include_patterns, prefix, all_prefixes),
+            filter_patterns_for_prefix(exclude_patterns, prefix, all_prefixes),
+            path_prefix=f"./{prefix}" if prefix else None, count_tokens=args.count_tokens, use_git=args.use_git,
+            max_file_size=args.max_file_size
+        )
+        trees.append(tree)
+        total_size += size
+        total_tokens += tokens
+
+    print("\n\n".join(trees))
+    summary = f"Total: {total_size:,} chars" + (f", ~{total_tokens:,} tokens" if args.count_tokens else "")
+    print(summary, file=sys.stderr)
+    return 0
+
+def cmd_deploy(args):
+    from .tools.script_executor import iter_script_lines
+    from .tools.path_resolver import PathResolver
+    from .tools.deploy_history import run_deploy
+    from .tools.project_locks import project_write_lock
+
+    project_paths, _ = _project_paths(args.paths, args.numeric_prefixes)
+    script_file = sys.stdin if args.script == '-' else open(args.script, 'r', encoding='utf-8', newline='\n')
+    try:
+        # Executed while it is read (see run_deploy()); only leading blank lines are looked at first.
+        script_lines = iter_script_lines(script_file)
+        leading_lines = []
+        for line in script_lines:
+            leading_lines.append(line)
+            if line.strip(): break
+        else:
+            print("Error: No deploy script provided.", file=sys.stderr)
+            return 1
+
+        resolver = PathResolver(project_paths, args.numeric_prefixes)
+        with project_write_lock(project_paths):
+            try:
+                output_log, error_log = run_deploy(
+                    project_paths, itertools.chain(leading_lines, script_lines), resolver, args.delimiter,
+                    args.tolerate_errors, not args.no_empty_line, record_history=not args.no_history
+                )
+            except Exception as e:
+                print(f"Error during deployment: {e}", file=sys.stderr)
+                return 1
+    finally:
+        if script_file is not sys.stdin: script_file.close()
+
+    if not args.quiet:
+        for line in output_log: print(line)
+    for error in error_log: print(error, file=sys.stderr)
+    if error_log:
+        print(f"Deployment completed with {len(error_log)} ignored error(s).", file=sys.stderr)
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m server', description="JustCode context generation and deployment without the server.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_project_args(subparser):
+        subparser.add_argument('paths', nargs='+', help="Project directories (or single files).")
+        subparser.add_argument('--numeric-prefixes', action='store_true', help="Name multiple projects 0, 1, ... instead of by directory name.")
+
+    def add_filter_args(subparser):
+        subparser.add_argument('--exclude', default='', help="Comma-separated exclude patterns, as in a profile.")
+        subparser.add_argument('--include', default='', help="Comma-separated include patterns.")
+        subparser.add_argument('--use-git', action='store_true', help="List files from the git index instead of walking the tree.")
+        subparser.add_argument('--max-file-size', type=int, default=get_max_file_size(),
+                               help="Files larger than this many bytes are cut to their head and tail (0: no limit).")
+
+    context = subparsers.add_parser('context', help="Write the context (tree and file contents) to stdout or --output.")
+    add_project_args(context)
+    add_filter_args(context)
+    context.add_argument('--mode', choices=('full', 'outline'), default='full')
+    context.add_argument('--outline-threshold', type=int, default=DEFAULT_OUTLINE_THRESHOLD)
+    context.add_argument('--outline', default='', help="Comma-separated patterns of files to always outline (outline mode).")
+    context.add_argument('--full', default='', help="Comma-separated patterns of files never outlined (outline mode).")
+    context.add_argument('--delimiter', default=here_doc_value)
+    context.add_argument('--limit', type=int, default=0, help="Fail (exit code 2) if the context exceeds this many chars.")
+    context.add_argument('-o', '--output', help="Output file (default: stdout).")
+    context.set_defaults(handler=cmd_context)
+
+    tree = subparsers.add_parser('tree', help="Print the file tree with char/line counts; the total goes to stderr.")
+    add_project_args(tree)
+    add_filter_args(tree)
+    tree.add_argument('--count-tokens', action='store_true')
+    tree.set_defaults(handler=cmd_tree)
+
+    deploy = subparsers.add_parser('deploy', help="Apply a deploy script from --script or stdin.")
+    add_project_args(deploy)
+    deploy.add_argument('--script', default='-', help="Deploy script file ('-' for stdin, the default).")
+    deploy.add_argument('--tolerate-errors', action='store_true', help="Skip failing commands instead of stopping at the first one.")
+    deploy.add_argument('--no-empty-line', action='store_true', help="Don't add a trailing empty line to written files.")
+    deploy.add_argument('--delimiter', default=here_doc_value)
+    deploy.add_argument('--no-history', action='store_true', help="Don't record the deploy in the undo history.")
+    deploy.add_argument('-q', '--quiet', action='store_true', help="Don't print the action log.")
+    deploy.set_defaults(handler=cmd_deploy)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except BrokenPipeError:
+        # The reader (e.g. 'head') went away; not an error for a pipeline.
+        sys.stderr.close()
+        return 0
@@ -1,14 +1,28 @@
+import io
 import os
-import re
-import shlex
-import traceback
-import stat
-import time
-import subprocess
+import itertools
+from contextlib import ExitStack
 from flask import request, Response
-from .tools.utils import is_safe_path, here_doc_value
-from .tools.script_executor import execute_script, resolve_path
-from .tools.history_manager import get_history_dir, clear_stack, get_sorted_stack_timestamps
+from .tools.utils import here_doc_value
+from .tools.script_executor import iter_script_lines
+from .tools.path_resolver import PathResolver
+from .tools.deploy_history import run_deploy, run_batch_deploy
+from .tools.job_queue import get_job_queue, run_shell_job
+from .tools.project_locks import project_write_lock
+from .tools import metrics
+
+def _deployment_message(output_log, error_log, verbose_log, hide_errors_on_success):
+    deployment_message = ""
+    if error_log:
+        deployment_message = f"Deployment completed with {len(error_log)} ignored error(s)."
+        if verbose_log and not hide_errors_on_success:
+             deployment_message += "\n\n" + "\n---\n".join(error_log) + "\n\n--- SUCCESSFUL ACTIONS LOG ---\n"
+    else:
+        deployment_message = "Code deployed successfully."
+
+    if verbose_log:
+        deployment_message += "\n--- LOG ---\n" + "\n".join(output_log)
+    return deployment_message
 
 def deploy_code():
     paths = request.args.getlist('path')
@@ -20,6 +34,9 @@ def deploy_code():
     use_numeric_prefixes = request.args.get('useNumericPrefixes', 'false').lower() == 'true'
     add_empty_line = request.args.get('addEmptyLine', 'true').lower() == 'true'
     delimiter = request.args.get('delimiter', here_doc_value)
+    # Post-deploy script: 'scriptInBackground=true' returns right away with a job id (see /jobs/<id>).
+    script_in_background = request.args.get('scriptInBackground', 'false').lower() == 'true'
+    script_timeout = float(request.args.get('scriptTimeout', 0)) or None
 
     if not paths or not any(p.strip() for p in paths):
         return Response("Error: 'path' parameter is missing.", status=400, mimetype='text/plain')
@@ -31,140 +48,94 @@ def deploy_code():
         if not os.path.exists(p_path):
             return Response(f"Error: Provided path '{p_path}' is not a valid directory or file.", status=400, mimetype='text/plain')
     
-    script_content = request.get_data(as_text=True)
-    if not script_content:
+    # The script is read from the request body as it arrives and executed operation by operation (see run_deploy()).
+    script_stream = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8', errors='replace', newline='\n')
+    first_line = script_stream.readline()
+    if not first_line:
         return Response("Error: No deploy script provided in the request body.", status=400, mimetype='text/plain')
+    script_lines = iter_script_lines(itertools.chain([first_line], script_stream))
     
-    # --- Pass 1: Generate Undo Script (Updated with delimiter) ---
-    rollback_commands = []
-    lines = script_content.splitlines()
-    i = 0
+    # Deploys to a project are serialized and wait for running context reads (see project_locks.py).
+    with ExitStack() as held_lock:
+        with metrics.stage('lock_wait'):
+            held_lock.enter_context(project_write_lock(project_paths))
+        resolver = PathResolver(project_paths, use_numeric_prefixes)
     
-    delim_pattern = re.escape(delimiter)
-    
-    try:
-        while i < len(lines):
-            line = lines[i].strip()
-            i += 1
-            if not line: continue
-
-            def check_safety_and_get_path(raw_path):
-                full_path, owning_path = resolve_path(raw_path, project_paths, use_numeric_prefixes)
-                base_dir = os.path.dirname(owning_path) if os.path.isfile(owning_path) else owning_path
-                if not os.path.abspath(full_path).startswith(os.path.abspath(base_dir)):
-                    raise PermissionError(f"Path traversal attempt detected: {raw_path}")
-                return full_path
-
-            if line.startswith('cat >'):
-                match = re.match(r"cat >\s+(?P<path>.*?)\s+<<\s+'" + delim_pattern + r"'", line)
-                if not match: 
-                    # If mismatch, skip it (will be caught in execute pass if invalid)
-                    continue 
-                
-                raw_path = match.group('path').strip("'\"")
-                full_path = check_safety_and_get_path(raw_path)
-
-                quoted_rel_path = shlex.quote(raw_path)
-                if os.path.isfile(full_path):
-                    with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        original_content = f.read()
-                    rollback_cmd = f"cat > {quoted_rel_path} << '{delimiter}'\n{original_content}\n{delimiter}"
-                else:
-                    rollback_cmd = f"rm -f {quoted_rel_path}"
-                rollback_commands.insert(0, rollback_cmd)
-
-                while i < len(lines) and not lines[i].startswith(delimiter):
-                    i += 1
-                if i < len(lines):
-                    i += 1
-                continue
-
-            try:
-                parts = shlex.split(line)
-            except ValueError: continue # Skip malformed lines
-
-            if not parts: continue
-            command, args = parts[0], parts[1:]
-
-            if command == 'mkdir':
-                paths_to_create = [arg for arg in args if arg != '-p']
-                for arg in paths_to_create:
-                    full_path = check_safety_and_get_path(arg)
-                    if not os.path.isdir(full_path):
-                        rollback_commands.insert(0, f"rmdir {shlex.quote(arg)}")
-            elif command == 'rm':
-                file_paths = [arg for arg in args if not arg.startswith('-')]
-                for relative_path_arg in file_paths:
-                    full_path = check_safety_and_get_path(relative_path_arg)
-                    if os.path.isfile(full_path):
-                        with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            original_content = f.read()
-                        rollback_cmd = f"cat > {shlex.quote(relative_path_arg)} << '{delimiter}'\n{original_content}\n{delimiter}"
-                        rollback_commands.insert(0, rollback_cmd)
-            elif command == 'rmdir':
-                for arg in args:
-                    full_path = check_safety_and_get_path(arg)
-                    if os.path.isdir(full_path):
-                        rollback_commands.insert(0, f"mkdir {shlex.quote(arg)}")
-            elif command == 'mv':
-                if len(args) == 2:
-                    src, dest = args[0], args[1]
-                    rollback_commands.insert(0, f"mv {shlex.quote(dest)} {shlex.quote(src)}")
-            
-    except (ValueError, PermissionError, OSError) as e:
-        return Response(f"Error during undo script generation: {str(e)}", status=500, mimetype='text/plain')
-
-    # ... (Rest of history logic matches previous implementation, just passing args) ...
-    clear_stack(project_paths, 'redo')
-    timestamp = str(int(time.time() * 1000))
-    undo_stack_dir = get_history_dir(project_paths, 'undo')
-    undo_script_content = "\n".join(rollback_commands)
-    undo_filepath = os.path.join(undo_stack_dir, f"{timestamp}.sh")
-    redo_filepath = os.path.join(undo_stack_dir, f"{timestamp}.redo")
-
-    with open(undo_filepath, 'w', encoding='utf-8') as f: f.write(undo_script_content)
-    with open(redo_filepath, 'w', encoding='utf-8') as f: f.write(script_content)
-
-    all_undo_timestamps = get_sorted_stack_timestamps(project_paths, 'undo')
-    if len(all_undo_timestamps) > 10:
-        for old_ts in all_undo_timestamps[:-10]:
-            try:
-                os.remove(os.path.join(undo_stack_dir, f"{old_ts}.sh"))
-                os.remove(os.path.join(undo_stack_dir, f"{old_ts}.redo"))
-            except OSError: pass
-    
-    try:
-        output_log, error_log = execute_script(script_content, project_paths, tolerate_errors, use_numeric_prefixes, add_empty_line, delimiter)
+        try:
+            output_log, error_log = run_deploy(project_paths, script_lines, resolver, delimiter, tolerate_errors, add_empty_line)
         
-        deployment_message = ""
-        if error_log:
-            deployment_message = f"Deployment completed with {len(error_log)} ignored error(s)."
-            if verbose_log and not hide_errors_on_success:
-                 deployment_message += "\n\n" + "\n---\n".join(error_log) + "\n\n--- SUCCESSFUL ACTIONS LOG ---\n"
-        else:
-            deployment_message = "Code deployed successfully."
-
-        if verbose_log:
-            deployment_message += "\n--- LOG ---\n" + "\n".join(output_log)
-
-        if run_script_on_deploy and post_deploy_script:
-            # (Post script logic unchanged)
-            main_project_path = project_paths[0]
-            if os.path.isfile(main_project_path): main_project_path = os.path.dirname(main_project_path)
-            try:
-                post_script_result = subprocess.run(post_deploy_script, shell=True, cwd=main_project_path, capture_output=True, text=True, check=False)
-                if post_script_result.returncode != 0:
-                    return Response(deployment_message + f"\nPost-deploy failed: {post_script_result.stderr}", status=400, mimetype='text/plain')
+            deployment_message = _deployment_message(output_log, error_log, verbose_log, hide_errors_on_success)
+
+            if run_script_on_deploy and post_deploy_script:
+                # The script runs on the job pool, not on the request thread.
+                try:
+                    job = get_job_queue().submit(
+                        'post_deploy', run_shell_job, post_deploy_script, resolver.main_dir, script_timeout,
+                        description=post_deploy_script, project=project_paths[0]
+                    )
+                except Exception as e:
+                     return Response(f"Failed to execute post-deploy script: {str(e)}", status=500, mimetype='text/plain')
+                job_headers = {'X-JustCode-Job-Id': job.id}
+
+                if script_in_background:
+                    deployment_message += f"\nPost-deploy script started as job {job.id} (GET /jobs/{job.id}/logs)."
+                    return Response(deployment_message, mimetype='text/plain', headers=job_headers)
+
+                held_lock.close()  # The files are written; don't block context reads while the script runs.
+                job.wait()
+                if job.status != 'succeeded':
+                    post_script_output, _ = job.get_logs()
+                    return Response(deployment_message + f"\nPost-deploy failed: {job.error}\n{post_script_output}", status=400, mimetype='text/plain', headers=job_headers)
                 if verbose_log:
                     deployment_message += "\nPost-deploy succeeded."
-            except Exception as e:
-                 return Response(f"Failed to execute post-deploy script: {str(e)}", status=500, mimetype='text/plain')
+                return Response(deployment_message, mimetype='text/plain', headers=job_headers)
         
-        return Response(deployment_message, mimetype='text/plain')
+            return Response(deployment_message, mimetype='text/plain')
+
+        except Exception as e:
+            return Response(f"Error during deployment: {str(e)}", status=500, mimetype='text/plain')
+
+def deploy_code_batch():
+    """
+    Applies an ordered list of deploy scripts in one go: JSON body {"scripts": ["...", ...]} (or just the list).
+    Query parameters as for /deploycode; 'historyPerScript=true' records one undo entry per script instead
+    of one for the whole batch. An error that is not tolerated rolls the whole batch back.
+    """
+    paths = request.args.getlist('path')
+    tolerate_errors = request.args.get('tolerateErrors', 'true').lower() == 'true'
+    verbose_log = request.args.get('verbose', 'true').lower() == 'true'
+    hide_errors_on_success = request.args.get('hideErrorsOnSuccess', 'false').lower() == 'true'
+    use_numeric_prefixes = request.args.get('useNumericPrefixes', 'false').lower() == 'true'
+    add_empty_line = request.args.get('addEmptyLine', 'true').lower() == 'true'
+    delimiter = request.args.get('delimiter', here_doc_value)
+    entry_per_script = request.args.get('historyPerScript', 'false').lower() == 'true'
+
+    if not paths or not any(p.strip() for p in paths):
+        return Response("Error: 'path' parameter is missing.", status=400, mimetype='text/plain')
+
+    project_paths = [os.path.abspath(p.strip()) for p in paths if p.strip()]
+    for p_path in project_paths:
+        if not os.path.exists(p_path):
+            return Response(f"Error: Provided path '{p_path}' is not a valid directory or file.", status=400, mimetype='text/plain')
 
-    except Exception as e:
+    data = request.get_json(force=True, silent=True)
+    scripts = data.get('scripts') if isinstance(data, dict) else data
+    if not isinstance(scripts, list) or not all(isinstance(script, str) for script in scripts):
+        return Response("Error: Expected a JSON list of scripts, or {\"scripts\": [...]}.", status=400, mimetype='text/plain')
+    scripts = [script for script in scripts if script.strip()]
+    if not scripts:
+        return Response("Error: No deploy scripts provided in the request body.", status=400, mimetype='text/plain')
+
+    with ExitStack() as held_lock:
+        with metrics.stage('lock_wait'):
+            held_lock.enter_context(project_write_lock(project_paths))
+        resolver = PathResolver(project_paths, use_numeric_prefixes)
         try:
-            if os.path.exists(undo_filepath): os.remove(undo_filepath)
-            if os.path.exists(redo_filepath): os.remove(redo_filepath)
-        except OSError: pass
-        return Response(f"Error during deployment: {str(e)}", status=500, mimetype='text/plain')
\ No newline at end of file
+            output_log, error_log, coalesced = run_batch_deploy(project_paths, scripts, resolver, delimiter, tolerate_errors, add_empty_line, entry_per_script)
+        except Exception as e:
+            return Response(f"Error during deployment: {str(e)}", status=500, mimetype='text/plain')
+
+    deployment_message = _deployment_message(output_log, error_log, verbose_log, hide_errors_on_success)
+    if verbose_log and coalesced:
+        deployment_message += f"\nSkipped {coalesced} write(s) replaced by a later write to the same file."
+    return Response(deployment_message, mimetype='text/plain')
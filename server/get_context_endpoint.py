@@ -1,54 +1,134 @@
 import os
 import traceback
 import json
-import subprocess
 import shlex
-import re
-from flask import request, Response
-from .tools.context_generator import generate_context_from_path, generate_tree_with_char_counts, get_file_stats, get_all_file_stats
+from flask import request, Response, send_file
+from .tools.context_generator import filter_patterns_for_prefix, get_project_prefixes, generate_context_entries, format_context_entry, generate_tree_with_char_counts, collect_file_stats, get_file_stats
+from .tools.exclusion_planner import plan_exclusions
+from .tools.outline import DEFAULT_OUTLINE_THRESHOLD, is_outline
+from .tools.dependency_graph import select_entries_within_budget
+from .tools.context_manifest import build_manifest, load_manifest, save_manifest, diff_manifests, get_manifest_scope
 from .tools.utils import here_doc_value
+from .tools.token_estimator import get_estimator, count_file_tokens
+from .tools.context_script import start_context_script, DEFAULT_MAX_WORKERS, DEFAULT_COMMAND_TIMEOUT, DEFAULT_WAIT_TIMEOUT
+from .tools.project_locks import locked_endpoint
+from .tools.context_pack import get_context_pack, get_pack_projects
+from .tools.file_stats_index import get_stats_index, list_file_stats, aggregate_directory, DEFAULT_PAGE_SIZE
+from .tools.compression import will_compress
+from .tools.large_files import get_max_file_size, tree_note
+from .tools import metrics
 
-def _filter_patterns(patterns, current_prefix, all_prefixes):
+def _context_script_output(context_script_job, context_script_background, response_headers, wait_timeout=DEFAULT_WAIT_TIMEOUT):
     """
-    Filters patterns to be relevant for a specific project prefix.
+    Text appended to the context for the additional context script ('' if there is none).
+    A script still running after wait_timeout seconds is left to finish as a background job.
     """
-    if not current_prefix or not all_prefixes:
-        return patterns
+    if context_script_job is None:
+        return ""
+    response_headers['X-JustCode-Job-Id'] = context_script_job.id
+    if context_script_background:
+        return f"\n\n# Additional context script is running as job {context_script_job.id} (GET /jobs/{context_script_job.id}).\n"
+    # Only the part of the script's run time that was not overlapped by the scan.
+    with metrics.stage('context_script_wait'):
+        finished = context_script_job.wait(wait_timeout)
+    if not finished:
+        return (f"\n\n# Additional context script did not finish within {wait_timeout:g} seconds. "
+                f"It keeps running as job {context_script_job.id} (GET /jobs/{context_script_job.id}).\n")
+    if context_script_job.status == 'succeeded':
+        return context_script_job.result
+    return f"\n\n# --- ERROR EXECUTING ADDITIONAL CONTEXT SCRIPT ---\n# {context_script_job.error or context_script_job.status}\n# ---\n"
 
-    other_prefixes = [p for p in all_prefixes if p != current_prefix]
-    filtered_patterns = []
+def _pack_response(pack, context_script_job, context_script_background, context_script_wait):
+    """Serves a context pack: zero-copy from the file when it is sent as-is, otherwise read through mmap."""
+    response_headers = {}
+    script_output = _context_script_output(context_script_job, context_script_background, response_headers, context_script_wait)
+    if not script_output and not will_compress(pack.size):
+        response = send_file(pack.file, mimetype='text/plain', conditional=False, etag=False)
+        response.content_length = pack.size
+        response.headers.update(response_headers)
+        return response
+    try:
+        body = pack.read()
+    finally:
+        pack.file.close()
+    return Response(body + script_output.encode('utf-8'), mimetype='text/plain', headers=response_headers)
 
-    for pattern in patterns:
-        # Check if the pattern is explicitly for another project
-        is_for_other = any(pattern == p or pattern.startswith(p + '/') for p in other_prefixes)
-        if is_for_other:
-            continue
-        
-        # If the pattern is exactly the current project prefix, wildcard it
-        if pattern == current_prefix or pattern == current_prefix + '/':
-            filtered_patterns.append('*')
-        # If it's inside the current project, strip the prefix
-        elif pattern.startswith(current_prefix + '/'):
-            stripped = pattern[len(current_prefix)+1:]
-            filtered_patterns.append('*' if stripped == '' else stripped)
-        else:
-            # If it's not prefixed for any known project, it's global
-            filtered_patterns.append(pattern)
-    
-    return filtered_patterns
+def _file_stats_response(project_paths, is_single_path, all_prefixes, include_patterns, exclude_patterns, count_tokens):
+    """
+    Stats of every text file, from the cached stats index (see file_stats_index.py).
+    Without paging arguments this is the plain JSON array the extension has always received. With any of
+    'page_size', 'cursor', 'dir' or 'aggregate' it is {"items", "nextCursor", "totalFiles", "totalChars"}:
+    one page of the files under 'dir', or with aggregate=true its direct children, directories summed up.
+    'apply_patterns=true' drops files excluded by the include/exclude patterns, without walking pruned directories.
+    """
+    apply_patterns = request.args.get('apply_patterns', 'false').lower() == 'true'
+    aggregate = request.args.get('aggregate', 'false').lower() == 'true'
+    directory = request.args.get('dir', '')
+    cursor = request.args.get('cursor', '')
+    page_size_str = request.args.get('page_size', '')
+    paged = aggregate or any(arg in request.args for arg in ('page_size', 'cursor', 'dir'))
+    if page_size_str and not page_size_str.isdigit():
+        return Response("Error: 'page_size' must be a positive integer.", status=400, mimetype='text/plain')
+    page_size = int(page_size_str) if page_size_str else (DEFAULT_PAGE_SIZE if paged else None)
 
+    projects = []
+    for i, p_path in enumerate(project_paths):
+        if not os.path.isdir(p_path): continue
+        prefix = None if is_single_path else all_prefixes[i]
+        include, exclude = (), ()
+        if apply_patterns:
+            include = filter_patterns_for_prefix(include_patterns, prefix, all_prefixes)
+            exclude = filter_patterns_for_prefix(exclude_patterns, prefix, all_prefixes)
+        projects.append((get_stats_index(p_path, include, exclude), prefix))
 
+    try:
+        query = aggregate_directory if aggregate else list_file_stats
+        result = query(projects, directory, cursor=cursor or None, page_size=page_size, count_tokens=count_tokens)
+    except ValueError as e:
+        return Response(f"Error: {e}", status=400, mimetype='text/plain')
+    body = result if paged else result['items']
+    return Response(json.dumps(body), mimetype='application/json')
+
+@locked_endpoint()
 def get_context():
     action = request.args.get('action', '')
     paths = request.args.getlist('path')
     exclude_str = request.args.get('exclude', '')
     include_str = request.args.get('include', '')
     context_size_limit = int(request.args.get('limit', 3000000))
+    token_limit_str = request.args.get('limit_tokens', '')
+    token_limit = int(token_limit_str) if token_limit_str else None
+    count_tokens = token_limit is not None or request.args.get('count_tokens', 'false').lower() == 'true'
     suggest_exclusions = request.args.get('suggest_exclusions', 'false').lower() == 'true'
+    # Relevance selection: when over budget, pack the files most related to the seeds/query instead of failing with 413.
+    seeds = request.args.getlist('seed')
+    query = request.args.get('query', '')
+    select_by_relevance = request.args.get('select', '') == 'relevance' or bool(seeds) or bool(query)
+    plan_exclusions_requested = request.args.get('plan_exclusions', 'false').lower() == 'true'
     gather_context = request.args.get('gather_context', 'false').lower() == 'true'
     context_script = request.args.get('context_script', '')
+    # Script lines run one at a time unless parallel workers are requested (only for independent commands).
+    context_script_workers = int(request.args.get('context_script_workers', os.getenv('JUSTCODE_CONTEXT_SCRIPT_WORKERS', DEFAULT_MAX_WORKERS)))
+    context_script_timeout = float(request.args.get('context_script_timeout', DEFAULT_COMMAND_TIMEOUT))
+    context_script_cache = request.args.get('context_script_cache', 'false').lower() == 'true'
+    # Return the context without waiting for the script; its output is available at /jobs/<id>.
+    context_script_background = request.args.get('context_script_background', 'false').lower() == 'true'
+    # Longest wait for the script's output; a slower script is left running as a job.
+    context_script_wait = float(request.args.get('context_script_wait', os.getenv('JUSTCODE_CONTEXT_SCRIPT_WAIT', DEFAULT_WAIT_TIMEOUT)))
     use_numeric_prefixes = request.args.get('useNumericPrefixes', 'false').lower() == 'true'
+    use_git = request.args.get('use_git', os.getenv('JUSTCODE_USE_GIT_INDEX', 'false')).lower() == 'true'
+    use_context_pack = request.args.get('pack', os.getenv('JUSTCODE_CONTEXT_PACK', 'true')).lower() == 'true'
     delimiter = request.args.get('delimiter', here_doc_value)
+    context_mode = request.args.get('mode', 'full').lower()
+    outline_threshold = int(request.args.get('outline_threshold', DEFAULT_OUTLINE_THRESHOLD))
+    # Files larger than this (bytes) are sent as their head and tail only; 0 sends every file whole.
+    max_file_size = int(request.args.get('max_file_size', get_max_file_size()))
+    outline_str = request.args.get('outline', '')
+    full_str = request.args.get('full', '')
+    # 'since' turns on change tracking: an empty value requests a full context plus a token,
+    # a token from a previous response requests only what changed since then.
+    track_changes = 'since' in request.args
+    since_token = request.args.get('since', '')
 
     if not paths or not any(p.strip() for p in paths):
         return Response("Error: 'path' parameter is missing.", status=400, mimetype='text/plain')
@@ -58,36 +138,55 @@ def get_context():
 
     all_prefixes = []
     if not is_single_path:
-        for i, p_path in enumerate(project_paths):
-            if use_numeric_prefixes:
-                all_prefixes.append(str(i))
-            else:
-                if os.path.isdir(p_path):
-                    all_prefixes.append(os.path.basename(p_path))
-                elif os.path.isfile(p_path):
-                    all_prefixes.append(f"{os.path.basename(os.path.dirname(p_path))}/{os.path.basename(p_path)}")
+        all_prefixes = get_project_prefixes(project_paths, use_numeric_prefixes)
         if len(all_prefixes) != len(set(all_prefixes)):
              return Response("Error: Multiple project paths result in the same name. Enable 'Name by order number' in profile settings.", status=400)
 
 
     exclude_patterns = [p.strip() for p in exclude_str.split(',') if p.strip()]
     include_patterns = [p.strip() for p in include_str.split(',') if p.strip()]
+    outline_patterns = [p.strip() for p in outline_str.split(',') if p.strip()]
+    full_patterns = [p.strip() for p in full_str.split(',') if p.strip()]
 
+    # Set once a response that carries the script's output is returned; every other return cancels the script.
+    context_script_job = None
+    context_script_consumed = False
     try:
         if action == 'get_all_file_stats':
-            all_stats = []
-            for i, p_path in enumerate(project_paths):
-                if os.path.isdir(p_path):
-                    prefix = None
-                    if not is_single_path:
-                        prefix = all_prefixes[i]
-                    all_stats.extend(get_all_file_stats(p_path, path_prefix=prefix))
-            return Response(json.dumps(all_stats), mimetype='application/json')
+            return _file_stats_response(project_paths, is_single_path, all_prefixes, include_patterns, exclude_patterns, count_tokens)
+
+        # Start the additional context script right away so it runs while the project is scanned.
+        if gather_context and context_script and not suggest_exclusions:
+            main_project_path = project_paths[0]
+            if os.path.isfile(main_project_path): main_project_path = os.path.dirname(main_project_path)
+            context_script_job = start_context_script(
+                context_script, main_project_path,
+                max_workers=context_script_workers,
+                timeout=context_script_timeout,
+                use_cache=context_script_cache
+            )
+
+        # A plain full context of directories is served from its prebuilt pack (see context_pack.py).
+        # Stats, delta and token-budgeted requests, and over-budget contexts with relevance selection, are built below.
+        if use_context_pack and not suggest_exclusions and not track_changes and token_limit is None and all(os.path.isdir(p) for p in project_paths):
+            projects = get_pack_projects(project_paths, all_prefixes, include_patterns, exclude_patterns, outline_patterns, full_patterns)
+            pack = get_context_pack(project_paths, projects, delimiter, use_git, context_mode, outline_threshold, max_file_size)
+            if pack.total_chars <= context_size_limit:
+                context_script_consumed = True
+                return _pack_response(pack, context_script_job, context_script_background, context_script_wait)
+            pack.file.close()
+            if not select_by_relevance:
+                return Response(f"Context size (~{pack.total_chars:,}) exceeds limit ({context_size_limit:,}).", status=413, mimetype='text/plain')
 
         all_trees_with_counts = []
         all_trees_for_context = []
-        all_contents_for_script = []
+        all_context_entries = []
         total_size = 0
+        total_tokens = 0
+        # Stats of every project merged under their exclude-pattern prefixes, for the exclusion planner.
+        planner_file_stats = {}
+        # The file behind each context entry, so a token budget can reuse the per-file token cache.
+        entry_full_paths = {}
 
         for i, p_path in enumerate(project_paths):
             prefix = None
@@ -97,41 +196,56 @@ def get_context():
                 prefix = all_prefixes[i]
                 display_prefix = f"./{prefix}"
             
-            local_exclude_patterns = _filter_patterns(exclude_patterns, prefix, all_prefixes)
-            local_include_patterns = _filter_patterns(include_patterns, prefix, all_prefixes)
+            local_exclude_patterns = filter_patterns_for_prefix(exclude_patterns, prefix, all_prefixes)
+            local_include_patterns = filter_patterns_for_prefix(include_patterns, prefix, all_prefixes)
 
             if os.path.isdir(p_path):
-                tree_with_stats, size = generate_tree_with_char_counts(p_path, local_include_patterns, local_exclude_patterns, path_prefix=display_prefix)
+                file_stats = collect_file_stats(p_path, local_include_patterns, local_exclude_patterns, count_tokens=count_tokens, use_git=use_git, max_file_size=max_file_size)
+                tree_with_stats, size, tokens = generate_tree_with_char_counts(p_path, local_include_patterns, local_exclude_patterns, path_prefix=display_prefix, count_tokens=count_tokens, file_stats=file_stats)
                 all_trees_with_counts.append(tree_with_stats)
                 total_size += size
+                total_tokens += tokens
+
+                if plan_exclusions_requested:
+                    for rel_path, stats in file_stats.items():
+                        planner_file_stats[f"{prefix}/{rel_path}" if prefix else rel_path] = stats
+                if suggest_exclusions: continue
                 
-                full_context_for_path = generate_context_from_path(p_path, local_include_patterns, local_exclude_patterns, path_prefix=display_prefix, delimiter=delimiter)
-                
-                parts = re.split(r'\n\n(?=cat >)', full_context_for_path, 1)
-                if len(parts) == 2:
-                    tree_part, content_part = parts
-                    all_trees_for_context.append(tree_part)
-                    all_contents_for_script.append(content_part)
-                elif parts:
-                    all_trees_for_context.append(parts[0])
+                tree_part, entries = generate_context_entries(
+                    p_path, local_include_patterns, local_exclude_patterns, path_prefix=display_prefix, use_git=use_git,
+                    mode=context_mode, outline_threshold=outline_threshold,
+                    outline_patterns=filter_patterns_for_prefix(outline_patterns, prefix, all_prefixes),
+                    full_patterns=filter_patterns_for_prefix(full_patterns, prefix, all_prefixes),
+                    max_file_size=max_file_size
+                )
+                all_trees_for_context.append(tree_part)
+                all_context_entries.extend(entries)
+                for path_in_script, _ in entries:
+                    rel_path = path_in_script[len(display_prefix) + 1:] if display_prefix else path_in_script[2:]
+                    entry_full_paths[path_in_script] = os.path.join(p_path, rel_path.replace('/', os.sep))
 
             elif os.path.isfile(p_path):
-                content, size, lines = get_file_stats(p_path)
+                content, size, lines, truncated_size = get_file_stats(p_path, max_file_size)
                 if content is None: continue
                 
                 total_size += size
+                tokens = count_file_tokens(p_path, content, get_estimator(), max_file_size) if count_tokens else 0
+                total_tokens += tokens
+                if plan_exclusions_requested:
+                    planner_file_stats[prefix or os.path.basename(p_path)] = {'chars': size, 'lines': lines, 'tokens': tokens}
                 filename = os.path.basename(p_path)
-                def format_stats(s_chars, s_lines): return f"({s_chars:,} chars, {s_lines:,} lines)"
+                def format_stats(s_chars, s_lines, s_tokens):
+                    if count_tokens: return f"({s_chars:,} chars, {s_lines:,} lines, ~{s_tokens:,} tokens)"
+                    return f"({s_chars:,} chars, {s_lines:,} lines)"
                 
-                tree_line = f"{display_prefix or './' + filename} {format_stats(size, lines)}"
+                tree_line = f"{display_prefix or './' + filename} {format_stats(size, lines, tokens)}"
                 path_in_script = display_prefix or f"./{filename}"
+                if truncated_size is not None: tree_line += f" {tree_note(truncated_size)}"
                 
                 all_trees_with_counts.append(tree_line)
                 all_trees_for_context.append(tree_line)
-                
-                quoted_path = shlex.quote(path_in_script)
-                content_string = f"cat > {quoted_path} << '{delimiter}'\n{content}\n{delimiter}\n\n"
-                all_contents_for_script.append(content_string)
+                all_context_entries.append((path_in_script, content))
+                entry_full_paths[path_in_script] = p_path
 
             else:
                  return Response(f"Error: Provided path '{p_path}' is not a valid directory or file.", status=400, mimetype='text/plain')
@@ -140,55 +254,87 @@ def get_context():
 
         if suggest_exclusions:
             response_data = {"treeString": tree_with_counts, "totalChars": total_size}
+            if count_tokens: response_data["totalTokens"] = total_tokens
+            if plan_exclusions_requested:
+                metric, budget = ('tokens', token_limit) if token_limit is not None else ('chars', context_size_limit)
+                protected = [all_prefixes[i] for i, p_path in enumerate(project_paths) if os.path.isdir(p_path)] if not is_single_path else []
+                with metrics.stage('exclusion_planner'):
+                    plan, planned_total = plan_exclusions(planner_file_stats, budget, metric=metric, protected_paths=protected)
+                planned_patterns = [entry['pattern'] for entry in plan]
+                response_data["plannedExclusions"] = plan
+                response_data["plannedTotal"] = planned_total
+                response_data["plannedMetric"] = metric
+                response_data["suggestedExclude"] = ",".join(exclude_patterns + [p for p in planned_patterns if p not in exclude_patterns])
             return Response(json.dumps(response_data), mimetype='application/json')
 
-        if total_size > context_size_limit:
+        if context_mode == 'outline':
+            # Outlined files are much smaller than the sizes in the stats tree, so check the budget against what is actually sent.
+            total_size = sum(len(content) for _, content in all_context_entries)
+            if token_limit is not None:
+                _, estimate_tokens = get_estimator()
+                total_tokens = sum(estimate_tokens(content) for _, content in all_context_entries)
+
+        over_char_limit = total_size > context_size_limit
+        over_token_limit = token_limit is not None and total_tokens > token_limit
+        selection_summary = None
+        omitted_paths = []
+
+        if (over_char_limit or over_token_limit) and select_by_relevance:
+            file_count = len(all_context_entries)
+            candidate_paths = [path_in_script for path_in_script, _ in all_context_entries]
+            with metrics.stage('relevance_select'):
+                if over_char_limit:
+                    all_context_entries, _ = select_entries_within_budget(all_context_entries, context_size_limit, seeds=seeds, query=query)
+                if over_token_limit:
+                    estimator = get_estimator()
+                    # Outlines are not the file's content, so only entries sent as-is are looked up in the cache.
+                    token_sizes = {
+                        path_in_script: count_file_tokens(entry_full_paths[path_in_script], content, estimator, max_file_size)
+                        for path_in_script, content in all_context_entries if not is_outline(content)
+                    }
+                    all_context_entries, _ = select_entries_within_budget(all_context_entries, token_limit, size_fn=estimator[1], seeds=seeds, query=query, sizes=token_sizes)
+            selected_paths = {path_in_script for path_in_script, _ in all_context_entries}
+            omitted_paths = [path for path in candidate_paths if path not in selected_paths]
+            selection_summary = f"# Context budget exceeded: only the {len(all_context_entries)} of {file_count} files most relevant to the task are included below. The tree lists every file."
+        elif over_char_limit:
             return Response(f"Context size (~{total_size:,}) exceeds limit ({context_size_limit:,}).", status=413, mimetype='text/plain')
+        elif over_token_limit:
+            return Response(f"Context size (~{total_tokens:,} tokens) exceeds token limit ({token_limit:,}).", status=413, mimetype='text/plain')
         
         final_tree = "\n\n".join(all_trees_for_context)
-        final_content = "".join(all_contents_for_script)
+        if selection_summary:
+            final_tree += "\n\n" + selection_summary
+        response_headers = {}
+        delta_summary = None
+        deleted_paths = []
+
+        if track_changes:
+            with metrics.stage('manifest'):
+                # Files left out for the budget still exist; a delta must not tell the model to delete them.
+                manifest = build_manifest(all_context_entries, omitted_paths)
+                manifest_scope = get_manifest_scope(include_patterns, exclude_patterns, use_git)
+                previous_manifest = load_manifest(project_paths, since_token, manifest_scope)
+                response_headers['X-JustCode-Context-Token'] = save_manifest(project_paths, manifest, manifest_scope)
+            response_headers['X-JustCode-Context-Mode'] = 'full' if previous_manifest is None else 'delta'
+            if previous_manifest is not None:
+                changed_paths, deleted_paths = diff_manifests(previous_manifest, manifest)
+                changed_paths = set(changed_paths)
+                all_context_entries = [entry for entry in all_context_entries if entry[0] in changed_paths]
+                delta_summary = f"# Only files changed since the previous context are included below ({len(changed_paths)} added/modified, {len(deleted_paths)} deleted)."
+
+        final_content = "".join(format_context_entry(path_in_script, content, delimiter) for path_in_script, content in all_context_entries)
+        final_content += "".join(f"rm -f {shlex.quote(path)}\n" for path in deleted_paths)
+        if delta_summary:
+            final_tree += "\n\n" + delta_summary
         file_contents = (final_tree + "\n\n" + final_content) if final_content else final_tree
         
-        if gather_context and context_script:
-            main_project_path = project_paths[0]
-            if os.path.isfile(main_project_path): main_project_path = os.path.dirname(main_project_path)
-            try:
-                script_for_display = context_script.replace('\r\n', '\n')
-                commands = [cmd for cmd in script_for_display.split('\n') if cmd.strip()]
-                
-                output_parts = [
-                    "\n\n# Additional context from script:\n",
-                    f"# CWD: {main_project_path}\n",
-                    f"# SCRIPT:\n# ---\n",
-                ]
-                for s_line in script_for_display.split('\n'):
-                    output_parts.append(f"# {s_line}\n")
-                output_parts.append("# ---\n")
-                
-                for command in commands:
-                    output_parts.append("\n")
-                    output_parts.append(f"$ {command}\n")
-
-                    result = subprocess.run(
-                        command, shell=True, cwd=main_project_path,
-                        capture_output=True, text=True, check=False
-                    )
-                    
-                    if result.stdout:
-                        output_parts.append(result.stdout)
-                        if not result.stdout.endswith('\n'): output_parts.append('\n')
-                    if result.stderr:
-                        output_parts.append(result.stderr)
-                        if not result.stderr.endswith('\n'): output_parts.append('\n')
-                
-                additional_context_output = "".join(output_parts)
-                file_contents += additional_context_output
-                
-            except Exception as e:
-                error_output = f"\n\n# --- ERROR EXECUTING ADDITIONAL CONTEXT SCRIPT ---\n# {e}\n# ---\n"
-                file_contents += error_output
-        
-        return Response(file_contents, mimetype='text/plain')
+        context_script_consumed = True
+        file_contents += _context_script_output(context_script_job, context_script_background, response_headers, context_script_wait)
+        return Response(file_contents, mimetype='text/plain', headers=response_headers)
         
     except Exception as e:
-        return Response(f"An unexpected error occurred: {e}\n{traceback.format_exc()}", status=500, mimetype='text/plain')
\ No newline at end of file
+        return Response(f"An unexpected error occurred: {e}\n{traceback.format_exc()}", status=500, mimetype='text/plain')
+    finally:
+        # A 413, a 400 or an error: nobody will read the script's output, so don't leave it running on the job pool.
+        if context_script_job is not None and not context_script_consumed:
+            context_script_job.cancel()
\ No newline at end of file
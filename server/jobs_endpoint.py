@@ -0,0 +1,51 @@
+import json
+from flask import request, Response, stream_with_context
+from .tools.job_queue import get_job_queue
+
+# How long a streaming log request waits for new output before re-checking the job.
+LOG_POLL_INTERVAL = 1.0
+
+def list_jobs():
+    jobs = [job.to_dict() for job in get_job_queue().list()]
+    return Response(json.dumps(jobs), mimetype='application/json')
+
+def get_job(job_id):
+    """Job status as JSON. '?logs=true&offset=N' adds the log output produced after offset N."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return Response(f"Error: Unknown job '{job_id}'.", status=404, mimetype='text/plain')
+    include_logs = request.args.get('logs', 'false').lower() == 'true'
+    log_offset = int(request.args.get('offset', 0))
+    return Response(json.dumps(job.to_dict(include_logs, log_offset)), mimetype='application/json')
+
+def get_job_logs(job_id):
+    """Streams the job log as plain text until the job finishes ('?follow=false' returns what is there now)."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return Response(f"Error: Unknown job '{job_id}'.", status=404, mimetype='text/plain')
+    follow = request.args.get('follow', 'true').lower() == 'true'
+
+    if not follow:
+        logs, _ = job.get_logs()
+        return Response(logs, mimetype='text/plain')
+
+    def generate():
+        offset = 0
+        while True:
+            finished = job.finished
+            logs, offset = job.get_logs(offset)
+            if logs: yield logs
+            if finished: break
+            job.wait_for_change(offset, LOG_POLL_INTERVAL)
+        yield f"\n# Job {job.status}." + (f" {job.error}" if job.error else "") + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/plain')
+
+def cancel_job(job_id):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return Response(f"Error: Unknown job '{job_id}'.", status=404, mimetype='text/plain')
+    if not job.finished:
+        job.cancel()
+        job.wait(timeout=5)
+    return Response(json.dumps(job.to_dict()), mimetype='application/json')
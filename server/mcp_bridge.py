@@ -1,10 +1,13 @@
-import requests
 import os
 from mcp.server.fastmcp import FastMCP
-from dotenv import load_dotenv
 
-# Load env to get host/port if customized, otherwise default
-load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+# The MCP client waits for the handshake while this module loads, so only FastMCP is imported up front:
+# python-dotenv only when there is a .env file, and 'requests' on the first tool call.
+_env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+if os.path.exists(_env_path):
+    from dotenv import load_dotenv
+    # Load env to get host/port if customized, otherwise default
+    load_dotenv(_env_path)
 
 HOST = os.getenv('FLASK_RUN_HOST', '127.0.0.1')
 PORT = os.getenv('FLASK_RUN_PORT', '5010')
@@ -26,6 +29,7 @@ def ask_justcode_agent(task: str) -> str:
     Args:
         task: The specific instruction or question for the browser agent.
     """
+    import requests
     try:
         # Forward the prompt to the running Flask server
         response = requests.post(
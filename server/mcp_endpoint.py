@@ -0,0 +1,130 @@
+import os
+import json
+import uuid
+import threading
+from flask import request, Response
+from flask_sock import Sock
+from .tools.prewarm import start_prewarm, cancel_prewarm
+
+# --- MCP / WebSocket Bridge Logic ---
+# This module (and flask_sock with it) is loaded on the first /ws or /mcp/prompt request, see app.py.
+
+# Store active WebSocket connections (usually just one, the chrome extension)
+ws_connections = []
+# Store pending requests: { request_id: { 'event': threading.Event(), 'response': None } }
+pending_requests = {}
+
+def websocket_handler(ws):
+    """
+    WebSocket endpoint for the Chrome Extension to connect to.
+    """
+    ws_connections.append(ws)
+    print(f"MCP: Extension connected. Total clients: {len(ws_connections)}")
+    try:
+        while True:
+            data = ws.receive()
+            if data:
+                try:
+                    msg = json.loads(data)
+                    # Handle response from Extension
+                    if msg.get('type') == 'mcp_response':
+                        req_id = msg.get('id')
+                        if req_id in pending_requests:
+                            pending_requests[req_id]['response'] = msg.get('text')
+                            pending_requests[req_id]['event'].set()
+                    # Active profile announced on connect: warm its caches for the next Get Context
+                    elif msg.get('type') == 'profile':
+                        _handle_profile(msg)
+                except Exception as e:
+                    print(f"MCP: Error parsing WS message: {e}")
+    except Exception:
+        pass
+    finally:
+        if ws in ws_connections:
+            ws_connections.remove(ws)
+        if not ws_connections:
+            cancel_prewarm()
+        print("MCP: Extension disconnected.")
+
+def _handle_profile(msg):
+    """
+    Starts a background prewarm for the announced profile:
+    { type: 'profile', paths: [...], exclude: 'a,b', include: 'c', delimiter: 'EOFILE123', useNumericPrefixes: bool }
+    """
+    if os.getenv('JUSTCODE_PREWARM', 'true').lower() != 'true':
+        return
+    paths = [p.strip() for p in msg.get('paths') or [] if isinstance(p, str) and p.strip()]
+    exclude_patterns = [p.strip() for p in (msg.get('exclude') or '').split(',') if p.strip()]
+    include_patterns = [p.strip() for p in (msg.get('include') or '').split(',') if p.strip()]
+    job = start_prewarm(paths, include_patterns, exclude_patterns, msg.get('delimiter') or None, bool(msg.get('useNumericPrefixes')))
+    if job is not None:
+        print(f"MCP: Prewarming caches for {len(paths)} project(s) (job {job.id}).")
+
+class _ViewCapture:
+    """Stands in for a blueprint, so Sock.route() hands over its wrapped view instead of registering it."""
+    def route(self, rule, **options):
+        def capture(view):
+            self.view = view
+        return capture
+
+_capture = _ViewCapture()
+Sock().route('/ws', bp=_capture)(websocket_handler)
+# The view app.py routes /ws to: accepts the WebSocket handshake and runs websocket_handler.
+websocket_route = _capture.view
+
+def mcp_prompt():
+    """
+    HTTP Endpoint for external tools (MCP Client / Curl).
+    Sends prompt to Chrome, waits for answer, returns answer.
+    """
+    if not ws_connections:
+        return Response("Error: JustCode Chrome Extension is not connected via WebSocket.", status=503, mimetype='text/plain')
+
+    try:
+        req_data = request.get_json(force=True)
+        user_prompt = req_data.get('prompt')
+        if not user_prompt:
+            return Response("Error: Missing 'prompt' field in JSON.", status=400, mimetype='text/plain')
+
+        req_id = str(uuid.uuid4())
+        event = threading.Event()
+
+        # Store handle to wait
+        pending_requests[req_id] = {
+            'event': event,
+            'response': None
+        }
+
+        # Broadcast payload to extension
+        payload = json.dumps({
+            'type': 'mcp_request',
+            'id': req_id,
+            'prompt': user_prompt
+        })
+
+        # Send to latest connection (most likely the active one)
+        try:
+            ws_connections[-1].send(payload)
+        except Exception as e:
+            return Response(f"Error sending to extension: {str(e)}", status=500, mimetype='text/plain')
+
+        # Wait for response (timeout 5 minutes for long generations)
+        is_set = event.wait(timeout=300)
+
+        result = pending_requests.pop(req_id, None)
+
+        if not is_set:
+            return Response("Error: Timeout waiting for LLM response.", status=504, mimetype='text/plain')
+
+        return Response(result['response'], mimetype='text/plain')
+
+    except Exception as e:
+        return Response(f"Server Error: {str(e)}", status=500, mimetype='text/plain')
+
+def close_ws_connections():
+    """Closes open WebSocket connections so their workers can exit during shutdown."""
+    for ws in list(ws_connections):
+        try:
+            ws.close()
+        except Exception:
+            pass
@@ -0,0 +1,111 @@
+import os
+import zlib
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MIN_SIZE = 1024
+# Large bodies are compressed slice by slice so the compressor never needs a second full copy.
+_CHUNK_SIZE = 256 * 1024
+_COMPRESSIBLE_MIMETYPES = ('text/plain', 'text/html', 'application/json')
+_LOOPBACK_ADDRESSES = ('127.0.0.1', '::1', 'localhost')
+
+def _get_available_encodings():
+    """Encodings in server preference order, limited to the libraries that are installed."""
+    encodings = []
+    if brotli is not None: encodings.append('br')
+    if zstandard is not None: encodings.append('zstd')
+    encodings.extend(['gzip', 'deflate'])
+    return encodings
+
+def _make_compressor(encoding):
+    """Returns (compress, flush) callables for a streaming compressor."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=4)
+        return (lambda data: compressor.process(bytes(data))), compressor.finish
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        return compressor.compress, compressor.flush
+    # wbits: 16+ selects the gzip container, a positive value selects zlib (HTTP 'deflate').
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+    return compressor.compress, compressor.flush
+
+def _compress_stream(chunks, encoding):
+    compress, flush = _make_compressor(encoding)
+    for chunk in chunks:
+        view = memoryview(chunk)
+        for start in range(0, len(view), _CHUNK_SIZE):
+            data = compress(view[start:start + _CHUNK_SIZE])
+            if data: yield data
+    data = flush()
+    if data: yield data
+
+def _should_compress(response, mode, min_size):
+    if mode == 'off':
+        return False
+    if mode == 'auto' and request.remote_addr in _LOOPBACK_ADDRESSES:
+        # Compression only costs CPU time when client and server share a machine.
+        return False
+    if request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.is_streamed:
+        # Live streams (e.g. job logs) would be held back in the compressor's buffer.
+        return False
+    if response.mimetype not in _COMPRESSIBLE_MIMETYPES:
+        return False
+    length = response.calculate_content_length()
+    if length is not None and length < min_size:
+        return False
+    return True
+
+def will_compress(length, mimetype='text/plain'):
+    """
+    Whether compress_response() would compress a response of this size and type to the current request.
+    Endpoints use it to choose between a zero-copy file response and a body the compressor can work on.
+    """
+    settings = current_app.extensions.get('justcode_compression')
+    if settings is None:
+        return False
+    mode, min_size, available_encodings = settings
+    if mode == 'off' or (mode == 'auto' and request.remote_addr in _LOOPBACK_ADDRESSES):
+        return False
+    if request.method == 'HEAD' or mimetype not in _COMPRESSIBLE_MIMETYPES or length < min_size:
+        return False
+    return request.accept_encodings.best_match(available_encodings) is not None
+
+def init_compression(app):
+    """
+    Registers negotiated response compression (gzip/deflate, plus br/zstd when installed).
+    Controlled by JUSTCODE_COMPRESSION ('auto' compresses only for non-loopback clients,
+    'on' always, 'off' never) and JUSTCODE_COMPRESSION_MIN_SIZE (bytes).
+    """
+    mode = os.getenv('JUSTCODE_COMPRESSION', 'auto').lower()
+    min_size = int(os.getenv('JUSTCODE_COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE))
+    available_encodings = _get_available_encodings()
+    app.extensions['justcode_compression'] = (mode, min_size, available_encodings)
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not _should_compress(response, mode, min_size):
+            return response
+
+        encoding = request.accept_encodings.best_match(available_encodings)
+        if not encoding:
+            return response
+
+        response.response = _compress_stream(response.iter_encoded(), encoding)
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Content-Length', None)
+        return response
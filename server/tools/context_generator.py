@@ -1,7 +1,13 @@
 import os
+import time
 import fnmatch
 import shlex
+import subprocess
 from .utils import here_doc_value
+from .token_estimator import get_estimator, count_file_tokens
+from .outline import get_outline, should_outline, is_outline, DEFAULT_OUTLINE_THRESHOLD
+from .large_files import read_text_file, is_truncated, tree_note
+from . import metrics
 
 def is_binary(file_path):
     try:
@@ -11,75 +17,210 @@ def is_binary(file_path):
     except OSError:
         return True 
 
-def get_file_stats(file_path):
+def get_file_stats(file_path, max_file_size=0):
+    """
+    Returns (content, content_length, line_count, truncated_size) of a text file, or (None, 0, 0, None).
+    truncated_size is the file size when the file is over max_file_size and content is only its head and tail.
+    """
     if is_binary(file_path):
-        return None, 0, 0
+        return None, 0, 0, None
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-        content_length = len(content)
-        line_count = len(content.split('\n'))
-        return content, content_length, line_count
+        content, size, truncated = read_text_file(file_path, max_file_size)
+        return content, len(content), content.count('\n') + 1, size if truncated else None
     except OSError:
-        return None, 0, 0
+        return None, 0, 0, None
+
+def _is_dir_pruned(dir_rel_path_norm, processed_exclude_patterns, processed_include_patterns, include_patterns):
+    """Checks if a directory ('a/b/', with trailing slash) is excluded and has nothing included inside it."""
+    is_excluded = any(fnmatch.fnmatch(dir_rel_path_norm, pat) or fnmatch.fnmatch(dir_rel_path_norm.rstrip('/'), pat) for pat in processed_exclude_patterns)
+    is_included = any(fnmatch.fnmatch(dir_rel_path_norm, pat) or fnmatch.fnmatch(dir_rel_path_norm.rstrip('/'), pat) for pat in processed_include_patterns)
+    
+    if not is_excluded or is_included:
+        return False
 
-def generate_context_from_path(project_path, include_patterns, exclude_patterns, path_prefix=None, delimiter=None):
+    for p in include_patterns:
+        # If pattern starts with wildcard, it can match anywhere.
+        if p.startswith('*'):
+            return False
+        
+        # Check if the folder is a prefix of the include pattern, or vice versa
+        prefix = p.split('*')[0]
+        if dir_rel_path_norm.startswith(prefix) or prefix.startswith(dir_rel_path_norm):
+            return False
+    return True
+
+def _is_file_excluded(file_rel_path_norm, filename, processed_exclude_patterns, processed_include_patterns):
+    is_excluded = any(fnmatch.fnmatch(file_rel_path_norm, pat) for pat in processed_exclude_patterns)
+    if not is_excluded:
+        return False
+    is_included = any(fnmatch.fnmatch(file_rel_path_norm, pat) or fnmatch.fnmatch(filename, pat) for pat in processed_include_patterns)
+    return not is_included
+
+def _list_git_files(project_path):
     """
-    Generates a project context string including a file tree and file contents.
+    Lists tracked and untracked-but-not-ignored files under project_path using the git index.
+    Returns relative '/'-separated paths, or None if project_path is not inside a git work tree.
     """
-    if delimiter is None:
-        delimiter = here_doc_value
-
-    matching_files = []
-    processed_exclude_patterns = [p + '*' if p.endswith('/') else p for p in exclude_patterns]
-    processed_include_patterns = [p + '*' if p.endswith('/') else p for p in include_patterns]
+    try:
+        result = subprocess.run(
+            ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+            cwd=project_path, capture_output=True, check=False
+        )
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    # Deduplicate: a file with merge conflicts is listed once per stage.
+    rel_paths = dict.fromkeys(p for p in result.stdout.decode('utf-8', errors='surrogateescape').split('\0') if p)
+    return list(rel_paths)
 
+def _walk_files(project_path, processed_exclude_patterns, processed_include_patterns, include_patterns):
+    """Yields (rel_path_norm, full_path) for files reached by os.walk, pruning excluded directories."""
     for dirpath, dirnames, filenames in os.walk(project_path, topdown=True):
         excluded_dirs = []
         for d in dirnames:
             dir_rel_path = os.path.relpath(os.path.join(dirpath, d), project_path)
             dir_rel_path_norm = dir_rel_path.replace('\\', '/') + '/'
-            
-            is_excluded = any(fnmatch.fnmatch(dir_rel_path_norm, pat) or fnmatch.fnmatch(dir_rel_path_norm.rstrip('/'), pat) for pat in processed_exclude_patterns)
-            is_included = any(fnmatch.fnmatch(dir_rel_path_norm, pat) or fnmatch.fnmatch(dir_rel_path_norm.rstrip('/'), pat) for pat in processed_include_patterns)
-            
-            if is_excluded and not is_included:
-                has_include_inside = False
-                for p in include_patterns:
-                    # If pattern starts with wildcard, it can match anywhere.
-                    if p.startswith('*'):
-                        has_include_inside = True
-                        break
-                    
-                    # Check if the folder is a prefix of the include pattern, or vice versa
-                    prefix = p.split('*')[0]
-                    if dir_rel_path_norm.startswith(prefix) or prefix.startswith(dir_rel_path_norm):
-                        has_include_inside = True
-                        break
-                        
-                if not has_include_inside:
-                    excluded_dirs.append(d)
+            if _is_dir_pruned(dir_rel_path_norm, processed_exclude_patterns, processed_include_patterns, include_patterns):
+                excluded_dirs.append(d)
                     
         for d in excluded_dirs: dirnames.remove(d)
 
         for filename in filenames:
             file_full_path = os.path.join(dirpath, filename)
-            if is_binary(file_full_path): continue
-
             file_rel_path = os.path.relpath(file_full_path, project_path)
-            file_rel_path_norm = file_rel_path.replace('\\', '/')
-            
-            is_excluded = any(fnmatch.fnmatch(file_rel_path_norm, pat) for pat in processed_exclude_patterns)
-            is_included = any(fnmatch.fnmatch(file_rel_path_norm, pat) or fnmatch.fnmatch(filename, pat) for pat in processed_include_patterns)
-            
-            if is_excluded and not is_included: continue
-            
-            matching_files.append(file_rel_path_norm)
+            yield file_rel_path.replace('\\', '/'), file_full_path
+
+def _git_files(project_path, git_rel_paths, processed_exclude_patterns, processed_include_patterns, include_patterns):
+    """Yields (rel_path_norm, full_path) for files from the git index, applying the same directory pruning as the walk."""
+    pruned_cache = {}
+    def is_under_pruned_dir(rel_path):
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)):
+            dir_rel_path_norm = '/'.join(parts[:i]) + '/'
+            if dir_rel_path_norm not in pruned_cache:
+                pruned_cache[dir_rel_path_norm] = _is_dir_pruned(dir_rel_path_norm, processed_exclude_patterns, processed_include_patterns, include_patterns)
+            if pruned_cache[dir_rel_path_norm]:
+                return True
+        return False
+
+    for rel_path in git_rel_paths:
+        if is_under_pruned_dir(rel_path): continue
+        full_path = os.path.join(project_path, rel_path.replace('/', os.sep))
+        # Tracked files deleted from the work tree and submodule entries are not regular files.
+        if not os.path.isfile(full_path): continue
+        yield rel_path, full_path
+
+def find_matching_files(project_path, include_patterns, exclude_patterns, use_git=False):
+    """
+    Returns a sorted list of (rel_path_norm, full_path) for every non-binary file that passes the
+    include/exclude patterns.
+    With use_git=True and a project inside a git work tree, files come from the git index
+    (so .gitignore is respected and ignored trees are never walked); otherwise os.walk is used.
+    """
+    processed_exclude_patterns = [p + '*' if p.endswith('/') else p for p in exclude_patterns]
+    processed_include_patterns = [p + '*' if p.endswith('/') else p for p in include_patterns]
+
+    git_rel_paths = _list_git_files(project_path) if use_git else None
+    if git_rel_paths is not None:
+        candidates = _git_files(project_path, git_rel_paths, processed_exclude_patterns, processed_include_patterns, include_patterns)
+    else:
+        candidates = _walk_files(project_path, processed_exclude_patterns, processed_include_patterns, include_patterns)
+
+    # Stage timings: 'walk' is listing time, excluding pattern matching ('filter') and binary sniffing.
+    started = time.perf_counter()
+    filter_time = sniff_time = 0.0
+    scanned = 0
+    matching_files = []
+    for file_rel_path_norm, file_full_path in candidates:
+        scanned += 1
+        t0 = time.perf_counter()
+        filename = file_rel_path_norm.rsplit('/', 1)[-1]
+        excluded = _is_file_excluded(file_rel_path_norm, filename, processed_exclude_patterns, processed_include_patterns)
+        t1 = time.perf_counter()
+        filter_time += t1 - t0
+        if excluded: continue
+        binary = is_binary(file_full_path)
+        sniff_time += time.perf_counter() - t1
+        if binary: continue
+        matching_files.append((file_rel_path_norm, file_full_path))
 
     matching_files.sort()
+    metrics.record_stage('git_ls_files' if git_rel_paths is not None else 'walk', time.perf_counter() - started - filter_time - sniff_time)
+    metrics.record_stage('filter', filter_time)
+    metrics.record_stage('binary_sniff', sniff_time)
+    metrics.count('files_scanned', scanned)
+    metrics.count('files_matched', len(matching_files))
+    return matching_files
+
+def get_project_prefixes(project_paths, use_numeric_prefixes=False):
+    """
+    Names that identify each of several projects in the tree and in script paths:
+    their order numbers, or the directory name (parent/filename for single files).
+    """
+    prefixes = []
+    for i, p_path in enumerate(project_paths):
+        if use_numeric_prefixes:
+            prefixes.append(str(i))
+        elif os.path.isdir(p_path):
+            prefixes.append(os.path.basename(p_path))
+        elif os.path.isfile(p_path):
+            prefixes.append(f"{os.path.basename(os.path.dirname(p_path))}/{os.path.basename(p_path)}")
+    return prefixes
 
+def filter_patterns_for_prefix(patterns, current_prefix, all_prefixes):
+    """
+    Filters patterns to be relevant for a specific project prefix.
+    """
+    if not current_prefix or not all_prefixes:
+        return patterns
+
+    other_prefixes = [p for p in all_prefixes if p != current_prefix]
+    filtered_patterns = []
+
+    for pattern in patterns:
+        # Check if the pattern is explicitly for another project
+        is_for_other = any(pattern == p or pattern.startswith(p + '/') for p in other_prefixes)
+        if is_for_other:
+            continue
+        
+        # If the pattern is exactly the current project prefix, wildcard it
+        if pattern == current_prefix or pattern == current_prefix + '/':
+            filtered_patterns.append('*')
+        # If it's inside the current project, strip the prefix
+        elif pattern.startswith(current_prefix + '/'):
+            stripped = pattern[len(current_prefix)+1:]
+            filtered_patterns.append('*' if stripped == '' else stripped)
+        else:
+            # If it's not prefixed for any known project, it's global
+            filtered_patterns.append(pattern)
+    
+    return filtered_patterns
+
+def _commented_section(label, quoted_path, content):
+    lines = "\n".join(f"#| {line}" if line else "#|" for line in content.split('\n'))
+    return f"# {label}: {quoted_path} (not deployable; ask for the full file before editing it)\n{lines}\n# END {label}\n\n"
+
+def format_context_entry(path_in_script, content, delimiter):
+    """
+    Formats one file as a heredoc block of the context script. An outline or a head/tail excerpt is not the
+    file's content, so it is emitted as a commented section instead: echoed back in a deploy script, every
+    line of it is skipped and the file is left alone.
+    """
+    quoted_path = shlex.quote(path_in_script)
+    if is_outline(content):
+        return _commented_section('OUTLINE', quoted_path, content)
+    if is_truncated(content):
+        return _commented_section('TRUNCATED', quoted_path, content)
+    return f"cat > {quoted_path} << '{delimiter}'\n{content}\n{delimiter}\n\n"
+
+def format_tree(rel_paths, path_prefix=None, notes=None):
+    """
+    The plain file tree (no stats) that heads the context, for '/'-separated relative paths.
+    notes: optional { rel_path: text } appended to those files' lines (e.g. truncated files).
+    """
     tree_dict = {}
-    for f in matching_files:
+    for f in rel_paths:
         parts = f.split('/')
         d = tree_dict
         for part in parts[:-1]:
@@ -88,94 +229,134 @@ def generate_context_from_path(project_path, include_patterns, exclude_patterns,
 
     root_label = path_prefix if path_prefix else "."
     tree_lines = [root_label]
-    def build_tree_str(d, prefix=""):
+    def build_tree_str(d, current_dir_path="", prefix=""):
         items = sorted(d.keys(), key=lambda k: (d[k] is None, k))
         pointers = ['├── '] * (len(items) - 1) + ['└── ']
         for i, name in enumerate(items):
             pointer = pointers[i]
             is_dir = d[name] is not None
-            tree_lines.append(f"{prefix}{pointer}{name}{'/' if is_dir else ''}")
+            rel_path = f"{current_dir_path}/{name}" if current_dir_path else name
+            note = notes.get(rel_path) if notes and not is_dir else None
+            tree_lines.append(f"{prefix}{pointer}{name}{'/' if is_dir else ''}{' ' + note if note else ''}")
             if is_dir:
                 extension = '│   ' if pointer == '├── ' else '    '
-                build_tree_str(d[name], prefix + extension)
+                build_tree_str(d[name], rel_path, prefix + extension)
     
     build_tree_str(tree_dict)
-    tree_str = "\n".join(tree_lines)
-    
-    output_parts = [tree_str, "\n\n"]
+    return "\n".join(tree_lines)
+
+def generate_context_entries(project_path, include_patterns, exclude_patterns, path_prefix=None, use_git=False,
+                             mode='full', outline_threshold=DEFAULT_OUTLINE_THRESHOLD, outline_patterns=(), full_patterns=(),
+                             max_file_size=0):
+    """
+    Builds the plain file tree and reads every matching file.
+    With mode='outline', Python and JS/TS files that match outline_patterns or exceed outline_threshold chars
+    are replaced by an outline of their signatures, unless they match full_patterns.
+    Files over max_file_size bytes are cut to their head and tail and marked in the tree (see large_files.py).
+    Returns (tree_string, [(path_in_script, content), ...]).
+    """
+    matching_files = [rel_path for rel_path, _ in find_matching_files(project_path, include_patterns, exclude_patterns, use_git)]
+
+    read_started = time.perf_counter()
+    bytes_read = 0
+    outline_time = 0.0
+    entries = []
+    read_files = []
+    truncated_notes = {}
     for rel_path in matching_files:
         full_path = os.path.join(project_path, rel_path.replace('/', os.sep))
         try:
-            with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            content, size, truncated = read_text_file(full_path, max_file_size)
+            if truncated: truncated_notes[rel_path] = tree_note(size)
+            bytes_read += len(content)
             
+            if mode == 'outline' and should_outline(rel_path, content, outline_threshold, outline_patterns, full_patterns):
+                outline_started = time.perf_counter()
+                content = get_outline(rel_path, content) or content
+                outline_time += time.perf_counter() - outline_started
+
             final_path_in_script = f"{path_prefix}/{rel_path}" if path_prefix else './' + rel_path
-            quoted_path = shlex.quote(final_path_in_script)
-            
-            output_parts.append(f"cat > {quoted_path} << '{delimiter}'\n")
-            output_parts.append(content)
-            output_parts.append(f"\n{delimiter}\n\n")
+            entries.append((final_path_in_script, content))
+            read_files.append(rel_path)
 
         except Exception as e:
             print(f"Warning: Could not read file '{full_path}': {e}")
             continue
             
-    return "".join(output_parts)
+    metrics.record_stage('read', time.perf_counter() - read_started - outline_time)
+    if outline_time: metrics.record_stage('outline', outline_time)
+    metrics.count('bytes_read', bytes_read)
+    if truncated_notes: metrics.count('files_truncated', len(truncated_notes))
 
-def generate_tree_with_char_counts(project_path, include_patterns, exclude_patterns, path_prefix=None):
-    matching_files_data = []
-    processed_exclude_patterns = [p + '*' if p.endswith('/') else p for p in exclude_patterns]
-    processed_include_patterns = [p + '*' if p.endswith('/') else p for p in include_patterns]
+    tree_started = time.perf_counter()
+    # Files that could not be read are not listed: the tree shows what the context contains.
+    tree_str = format_tree(read_files, path_prefix, truncated_notes)
+    metrics.record_stage('tree', time.perf_counter() - tree_started)
+    return tree_str, entries
 
-    for dirpath, dirnames, filenames in os.walk(project_path, topdown=True):
-        excluded_dirs = []
-        for d in dirnames:
-            dir_rel_path = os.path.relpath(os.path.join(dirpath, d), project_path)
-            dir_rel_path_norm = dir_rel_path.replace('\\', '/') + '/'
-            
-            is_excluded = any(fnmatch.fnmatch(dir_rel_path_norm, pat) or fnmatch.fnmatch(dir_rel_path_norm.rstrip('/'), pat) for pat in processed_exclude_patterns)
-            is_included = any(fnmatch.fnmatch(dir_rel_path_norm, pat) or fnmatch.fnmatch(dir_rel_path_norm.rstrip('/'), pat) for pat in processed_include_patterns)
-            
-            if is_excluded and not is_included:
-                has_include_inside = False
-                for p in include_patterns:
-                    # If pattern starts with wildcard, it can match anywhere.
-                    if p.startswith('*'):
-                        has_include_inside = True
-                        break
-                    
-                    # Check if the folder is a prefix of the include pattern, or vice versa
-                    prefix = p.split('*')[0]
-                    if dir_rel_path_norm.startswith(prefix) or prefix.startswith(dir_rel_path_norm):
-                        has_include_inside = True
-                        break
-                        
-                if not has_include_inside:
-                    excluded_dirs.append(d)
-                    
-        for d in excluded_dirs: dirnames.remove(d)
+def generate_context_from_path(project_path, include_patterns, exclude_patterns, path_prefix=None, delimiter=None, use_git=False,
+                               mode='full', outline_threshold=DEFAULT_OUTLINE_THRESHOLD, outline_patterns=(), full_patterns=(),
+                               max_file_size=0):
+    """
+    Generates a project context string including a file tree and file contents.
+    See generate_context_entries() for the outline mode options.
+    """
+    if delimiter is None:
+        delimiter = here_doc_value
 
-        for filename in filenames:
-            file_full_path = os.path.join(dirpath, filename)
-            if is_binary(file_full_path): continue
-            
-            file_rel_path = os.path.relpath(file_full_path, project_path)
-            file_rel_path_norm = file_rel_path.replace('\\', '/')
-            
-            is_excluded = any(fnmatch.fnmatch(file_rel_path_norm, pat) for pat in processed_exclude_patterns)
-            is_included = any(fnmatch.fnmatch(file_rel_path_norm, pat) or fnmatch.fnmatch(filename, pat) for pat in processed_include_patterns)
-            
-            if is_excluded and not is_included: continue
-            
-            try:
-                with open(file_full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                matching_files_data.append((file_rel_path_norm, len(content), len(content.split('\n'))))
-            except OSError: continue
+    tree_str, entries = generate_context_entries(project_path, include_patterns, exclude_patterns, path_prefix, use_git,
+                                                 mode, outline_threshold, outline_patterns, full_patterns, max_file_size)
+    output_parts = [tree_str, "\n\n"]
+    for path_in_script, content in entries:
+        output_parts.append(format_context_entry(path_in_script, content, delimiter))
+    return "".join(output_parts)
+
+def collect_file_stats(project_path, include_patterns, exclude_patterns, count_tokens=False, use_git=False, max_file_size=0):
+    """
+    Scans the project and returns { rel_path: {'chars', 'lines', 'tokens'} } for every matching text file.
+    'tokens' is 0 unless count_tokens is set. Files over max_file_size are counted as the excerpt the context
+    holds, and also get 'full_size' (bytes).
+    """
+    estimator = get_estimator() if count_tokens else None
+    matching_files_data = []
+    matching_files = find_matching_files(project_path, include_patterns, exclude_patterns, use_git)
+    started = time.perf_counter()
+    token_time = 0.0
+    bytes_read = 0
+    truncated = {}
+    for file_rel_path_norm, file_full_path in matching_files:
+        try:
+            content, size, truncated_excerpt = read_text_file(file_full_path, max_file_size)
+            if truncated_excerpt: truncated[file_rel_path_norm] = size
+            bytes_read += len(content)
+            tokens = 0
+            if count_tokens:
+                token_started = time.perf_counter()
+                tokens = count_file_tokens(file_full_path, content, estimator, max_file_size)
+                token_time += time.perf_counter() - token_started
+            matching_files_data.append((file_rel_path_norm, len(content), content.count('\n') + 1, tokens))
+        except OSError: continue
+    metrics.record_stage('stats_read', time.perf_counter() - started - token_time)
+    if count_tokens: metrics.record_stage('tokens', token_time)
+    metrics.count('bytes_read', bytes_read)
     
-    file_stats = {path: {'chars': chars, 'lines': lines} for path, chars, lines in matching_files_data}
+    file_stats = {path: {'chars': chars, 'lines': lines, 'tokens': tokens} for path, chars, lines, tokens in matching_files_data}
+    for path, size in truncated.items():
+        file_stats[path]['full_size'] = size
+    return file_stats
+
+def generate_tree_with_char_counts(project_path, include_patterns, exclude_patterns, path_prefix=None, count_tokens=False, file_stats=None, use_git=False, max_file_size=0):
+    """
+    Generates a file tree annotated with char and line counts (and estimated tokens if count_tokens is set).
+    Pass file_stats from collect_file_stats() to reuse an existing scan.
+    Returns (tree_string, total_chars, total_tokens); total_tokens is 0 when tokens are not counted.
+    """
+    if file_stats is None:
+        file_stats = collect_file_stats(project_path, include_patterns, exclude_patterns, count_tokens, use_git, max_file_size)
+    started = time.perf_counter()
     total_chars = sum(stats['chars'] for stats in file_stats.values())
     total_lines = sum(stats['lines'] for stats in file_stats.values())
+    total_tokens = sum(stats['tokens'] for stats in file_stats.values())
     
     tree_dict = {}
     dir_stats = {}
@@ -184,17 +365,20 @@ def generate_tree_with_char_counts(project_path, include_patterns, exclude_patte
         parts = path.split('/')
         for i, part in enumerate(parts[:-1]):
             current_path_prefix = '/'.join(parts[:i+1])
-            current_dir_stat = dir_stats.get(current_path_prefix, {'chars': 0, 'lines': 0})
+            current_dir_stat = dir_stats.get(current_path_prefix, {'chars': 0, 'lines': 0, 'tokens': 0})
             current_dir_stat['chars'] += stats['chars']
             current_dir_stat['lines'] += stats['lines']
+            current_dir_stat['tokens'] += stats['tokens']
             dir_stats[current_path_prefix] = current_dir_stat
         d = tree_dict
         for part in parts[:-1]: d = d.setdefault(part, {})
         d[parts[-1]] = None
 
-    def format_stats(s_chars, s_lines): return f"({s_chars:,} chars, {s_lines:,} lines)"
+    def format_stats(stats):
+        if count_tokens: return f"({stats['chars']:,} chars, {stats['lines']:,} lines, ~{stats['tokens']:,} tokens)"
+        return f"({stats['chars']:,} chars, {stats['lines']:,} lines)"
     root_label = path_prefix if path_prefix else "."
-    tree_lines = [f"{root_label} {format_stats(total_chars, total_lines)}"]
+    tree_lines = [f"{root_label} {format_stats({'chars': total_chars, 'lines': total_lines, 'tokens': total_tokens})}"]
 
     def build_tree_str(d, current_dir_path="", prefix=""):
         items = sorted(d.keys(), key=lambda k: (d[k] is None, k))
@@ -203,31 +387,15 @@ def generate_tree_with_char_counts(project_path, include_patterns, exclude_patte
             pointer = pointers[i]
             rel_path = f"{current_dir_path}/{name}" if current_dir_path else name
             if d[name] is not None:
-                stats = dir_stats.get(rel_path, {'chars': 0, 'lines': 0})
-                tree_lines.append(f"{prefix}{pointer}{name}/ {format_stats(stats['chars'], stats['lines'])}")
+                stats = dir_stats.get(rel_path, {'chars': 0, 'lines': 0, 'tokens': 0})
+                tree_lines.append(f"{prefix}{pointer}{name}/ {format_stats(stats)}")
                 extension = '│   ' if pointer == '├── ' else '    '
                 build_tree_str(d[name], rel_path, prefix + extension)
             else:
-                stats = file_stats.get(rel_path, {'chars': 0, 'lines': 0})
-                tree_lines.append(f"{prefix}{pointer}{name} {format_stats(stats['chars'], stats['lines'])}")
+                stats = file_stats.get(rel_path, {'chars': 0, 'lines': 0, 'tokens': 0})
+                note = f" {tree_note(stats['full_size'])}" if 'full_size' in stats else ""
+                tree_lines.append(f"{prefix}{pointer}{name} {format_stats(stats)}{note}")
                 
     build_tree_str(tree_dict)
-    return "\n".join(tree_lines), total_chars
-
-def get_all_file_stats(project_path, path_prefix=None):
-    stats = []
-    for dirpath, dirnames, filenames in os.walk(project_path):
-        for filename in filenames:
-            full_path = os.path.join(dirpath, filename)
-            if is_binary(full_path): continue
-            
-            rel_path = os.path.relpath(full_path, project_path).replace('\\', '/')
-            if path_prefix: rel_path = f"{path_prefix}/{rel_path}"
-            
-            try:
-                size = os.path.getsize(full_path)
-                # Ensure math matches JS: Math.ceil(size / 35)
-                lines = (size + 34) // 35 if size > 0 else 0
-                stats.append({"path": rel_path, "chars": size, "lines": lines})
-            except OSError: pass
-    return stats
\ No newline at end of file
+    metrics.record_stage('stats_tree', time.perf_counter() - started)
+    return "\n".join(tree_lines), total_chars, total_tokens
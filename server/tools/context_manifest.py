@@ -0,0 +1,75 @@
+import os
+import json
+import time
+import hashlib
+from .utils import get_justcode_root, get_project_id
+
+MAX_STORED_MANIFESTS = 20
+# Stands in for the hash of a file that exists but was left out of the context (e.g. over the budget).
+OMITTED = 'omitted'
+
+def get_manifest_dir(project_path):
+    """Gets the directory holding context manifests for a specific project."""
+    justcode_root = get_justcode_root()
+    project_id = get_project_id(project_path)
+    manifest_dir = os.path.join(justcode_root, ".justcode", project_id, "context_manifests")
+    os.makedirs(manifest_dir, exist_ok=True)
+    return manifest_dir
+
+def hash_content(content):
+    return hashlib.sha1(content.encode('utf-8', errors='surrogateescape')).hexdigest()
+
+def build_manifest(entries, omitted_paths=()):
+    """
+    Maps every path_in_script of the context entries to a hash of its content. omitted_paths are files that
+    exist but were not sent: they are never reported as deleted, and a later delta sends them.
+    """
+    manifest = {path_in_script: OMITTED for path_in_script in omitted_paths}
+    manifest.update((path_in_script, hash_content(content)) for path_in_script, content in entries)
+    return manifest
+
+def get_manifest_scope(include_patterns, exclude_patterns, use_git=False):
+    """
+    Identifies the file set a manifest describes. Tokens only work for requests with the same scope; with other
+    patterns a file missing from the context may still exist, so it must not be reported as deleted.
+    """
+    return hash_content(json.dumps([list(include_patterns), list(exclude_patterns), bool(use_git)]))
+
+def load_manifest(project_path, token, scope):
+    """Returns the manifest stored under 'token', or None if it is unknown, expired or was saved for another scope."""
+    if not token or not token.isdigit():
+        return None
+    manifest_path = os.path.join(get_manifest_dir(project_path), f"{token}.json")
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(stored, dict) or stored.get('scope') != scope:
+        return None
+    return stored.get('files')
+
+def save_manifest(project_path, manifest, scope):
+    """Stores a manifest for a scope (see get_manifest_scope()) and returns its token. Only the newest manifests are kept."""
+    manifest_dir = get_manifest_dir(project_path)
+    token = str(int(time.time() * 1000))
+    while os.path.exists(os.path.join(manifest_dir, f"{token}.json")):
+        token = str(int(token) + 1)
+
+    temp_path = os.path.join(manifest_dir, f"{token}.json.tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'scope': scope, 'files': manifest}, f)
+    os.replace(temp_path, os.path.join(manifest_dir, f"{token}.json"))
+
+    stored_tokens = sorted((name[:-len('.json')] for name in os.listdir(manifest_dir) if name.endswith('.json') and name[:-len('.json')].isdigit()), key=int)
+    for old_token in stored_tokens[:-MAX_STORED_MANIFESTS]:
+        try:
+            os.remove(os.path.join(manifest_dir, f"{old_token}.json"))
+        except OSError: pass
+    return token
+
+def diff_manifests(old_manifest, new_manifest):
+    """Returns (changed_paths, deleted_paths): paths added or modified in new_manifest, and paths that disappeared."""
+    changed = [path for path, digest in new_manifest.items() if digest != OMITTED and old_manifest.get(path) != digest]
+    deleted = [path for path in old_manifest if path not in new_manifest]
+    return changed, deleted
@@ -0,0 +1,293 @@
+import os
+import json
+import mmap
+import time
+import hashlib
+import threading
+from .utils import get_justcode_root, get_project_id
+from .context_generator import find_matching_files, format_tree, format_context_entry, filter_patterns_for_prefix
+from .outline import get_outline, should_outline, DEFAULT_OUTLINE_THRESHOLD
+from .large_files import read_text_file, is_oversized, tree_note
+from . import metrics
+
+# Bumped whenever the pack or index layout changes; older packs are rebuilt.
+PACK_FORMAT_VERSION = 4
+# Packs kept per project (one per distinct set of patterns/options).
+MAX_CONTEXT_PACKS = 5
+# Unchanged entries are copied from the previous pack in runs of at most this many bytes.
+_COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# One lock per pack key, so concurrent requests for the same context build it once.
+_pack_locks = {}
+_pack_locks_guard = threading.Lock()
+
+class ContextPack:
+    """
+    A built context on disk: 'file' is an open binary file positioned at 0 holding exactly the
+    response body, 'size' its length in bytes and 'total_chars' the size the context budget is checked against.
+    The caller owns 'file' and must close it.
+    """
+
+    def __init__(self, path, file, size, total_chars, rebuilt_entries):
+        self.path = path
+        self.file = file
+        self.size = size
+        self.total_chars = total_chars
+        self.rebuilt_entries = rebuilt_entries
+
+    def read(self):
+        """The whole pack as bytes, read through a memory map."""
+        if not self.size:
+            return b""
+        with mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return mapped[:]
+
+def get_pack_dir(project_paths):
+    """Gets the directory holding the context packs of a project."""
+    pack_dir = os.path.join(get_justcode_root(), ".justcode", get_project_id(project_paths), "context_packs")
+    os.makedirs(pack_dir, exist_ok=True)
+    return pack_dir
+
+def get_pack_key(projects, delimiter, use_git=False, mode='full', outline_threshold=DEFAULT_OUTLINE_THRESHOLD, max_file_size=0):
+    """A stable name for the pack of one combination of projects, patterns and formatting options."""
+    options = [PACK_FORMAT_VERSION, projects, delimiter, use_git, mode, outline_threshold, max_file_size]
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()[:20]
+
+def get_pack_projects(project_paths, all_prefixes, include_patterns, exclude_patterns, outline_patterns=(), full_patterns=()):
+    """
+    The 'projects' argument of get_context_pack(): one dict per project with its display prefix and the
+    patterns that apply to it. all_prefixes is empty for a single project (see get_project_prefixes()).
+    """
+    projects = []
+    for i, p_path in enumerate(project_paths):
+        prefix = all_prefixes[i] if all_prefixes else None
+        projects.append({
+            'path': p_path,
+            'display_prefix': f"./{prefix}" if prefix else None,
+            'include': filter_patterns_for_prefix(include_patterns, prefix, all_prefixes),
+            'exclude': filter_patterns_for_prefix(exclude_patterns, prefix, all_prefixes),
+            'outline': filter_patterns_for_prefix(list(outline_patterns), prefix, all_prefixes),
+            'full': filter_patterns_for_prefix(list(full_patterns), prefix, all_prefixes),
+        })
+    return projects
+
+def _get_pack_lock(key):
+    with _pack_locks_guard:
+        lock = _pack_locks.get(key)
+        if lock is None:
+            lock = _pack_locks[key] = threading.Lock()
+        return lock
+
+def _scan(projects, use_git, check_cancelled=None):
+    """Returns [(project_index, rel_path, full_path, (size, mtime_ns, inode)), ...] in context order."""
+    files = []
+    for project_index, project in enumerate(projects):
+        for rel_path, full_path in find_matching_files(project['path'], project['include'], project['exclude'], use_git):
+            if check_cancelled is not None: check_cancelled()
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            files.append((project_index, rel_path, full_path, (st.st_size, st.st_mtime_ns, st.st_ino)))
+    return files
+
+def _load_index(index_path, pack_path):
+    """The index of an existing pack, or None if it is missing, unreadable or does not belong to the pack file."""
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        st = os.stat(pack_path)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != PACK_FORMAT_VERSION or index.get('packSize') != st.st_size or index.get('packMtimeNs') != st.st_mtime_ns:
+        return None
+    return index
+
+def _is_readable(full_path):
+    try:
+        with open(full_path, 'rb'):
+            return True
+    except OSError:
+        return False
+
+def _any_became_readable(skipped, files):
+    """Skipped files keep their fingerprint when only their permissions are fixed, so they are checked again."""
+    if not skipped:
+        return False
+    full_paths = {(project_index, rel_path): full_path for project_index, rel_path, full_path, _ in files}
+    return any(_is_readable(full_paths[(project_index, rel_path)]) for project_index, rel_path in skipped if (project_index, rel_path) in full_paths)
+
+def _read_entry_content(project, rel_path, full_path, mode, outline_threshold, max_file_size):
+    content, _, _ = read_text_file(full_path, max_file_size)
+    if mode == 'outline' and should_outline(rel_path, content, outline_threshold, project['outline'], project['full']):
+        content = get_outline(rel_path, content) or content
+    return content
+
+def _copy_range(src, dest, offset, length):
+    """Appends src[offset:offset+length] to dest; in-kernel with copy_file_range() where available."""
+    src_fd, dest_fd = src.fileno(), dest.fileno()
+    while length > 0:
+        chunk = min(length, _COPY_CHUNK_SIZE)
+        copied = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copied = os.copy_file_range(src_fd, dest_fd, chunk, offset)
+            except OSError:
+                copied = 0
+        if not copied:
+            data = os.pread(src_fd, chunk, offset)
+            if not data:
+                raise OSError("context pack is shorter than its index")
+            copied = os.write(dest_fd, data)
+        offset += copied
+        length -= copied
+
+def _prune_packs(pack_dir, keep_key):
+    indexes = []
+    for name in os.listdir(pack_dir):
+        if name.endswith('.json') and name[:-len('.json')] != keep_key:
+            try:
+                indexes.append((os.path.getmtime(os.path.join(pack_dir, name)), name[:-len('.json')]))
+            except OSError: pass
+    indexes.sort()
+    for _, key in indexes[:max(0, len(indexes) - (MAX_CONTEXT_PACKS - 1))]:
+        for extension in ('json', 'pack'):
+            try:
+                os.remove(os.path.join(pack_dir, f"{key}.{extension}"))
+            except OSError: pass
+
+def _build_pack(pack_dir, key, projects, files, old_index, delimiter, mode, outline_threshold, max_file_size, check_cancelled=None):
+    """
+    Writes a new pack for 'files' next to the old one and swaps it in. Entries whose file has the same
+    stat fingerprint as in old_index are copied from the old pack instead of being read and formatted again.
+    Returns (index, number of entries that had to be read).
+    """
+    pack_path = os.path.join(pack_dir, f"{key}.pack")
+    index_path = os.path.join(pack_dir, f"{key}.json")
+    old_entries = {}
+    if old_index is not None:
+        old_entries = {(e[0], e[1]): e for e in old_index['entries']}
+
+    # Files that cannot be opened are left out of the tree and the entries, like in generate_context_entries().
+    skipped = set()
+    for project_index, rel_path, full_path, fingerprint in files:
+        old = old_entries.get((project_index, rel_path))
+        if old is not None and tuple(old[2:5]) == fingerprint:
+            continue
+        if not _is_readable(full_path):
+            skipped.add((project_index, rel_path))
+
+    trees = []
+    for project_index, project in enumerate(projects):
+        project_files = [(rel_path, fingerprint[0]) for p_index, rel_path, _, fingerprint in files if p_index == project_index and (p_index, rel_path) not in skipped]
+        notes = {rel_path: tree_note(size) for rel_path, size in project_files if is_oversized(size, max_file_size)}
+        trees.append(format_tree([rel_path for rel_path, _ in project_files], project['display_prefix'], notes))
+    head = "\n\n".join(trees).encode('utf-8')
+
+    entries = []
+    rebuilt = 0
+    temp_path = f"{pack_path}.{threading.get_ident()}.tmp"
+    old_file = open(pack_path, 'rb') if old_entries else None
+    try:
+        with open(temp_path, 'wb') as out:
+            out.write(head)
+            offset = len(head)
+            separator_written = False
+            for project_index, rel_path, full_path, fingerprint in files:
+                if check_cancelled is not None: check_cancelled()
+                if (project_index, rel_path) in skipped:
+                    continue
+                project = projects[project_index]
+                path_in_script = f"{project['display_prefix']}/{rel_path}" if project['display_prefix'] else './' + rel_path
+                old = old_entries.get((project_index, rel_path))
+                reuse = old is not None and tuple(old[2:5]) == fingerprint
+                if not reuse:
+                    try:
+                        content = _read_entry_content(project, rel_path, full_path, mode, outline_threshold, max_file_size)
+                    except OSError as e:
+                        # Became unreadable after the check above: listed in the tree, but recorded as skipped.
+                        print(f"Warning: Could not read file '{full_path}': {e}")
+                        skipped.add((project_index, rel_path))
+                        continue
+                if not separator_written:
+                    out.write(b"\n\n")
+                    offset += 2
+                    separator_written = True
+                if reuse:
+                    out.flush()
+                    _copy_range(old_file, out, old[5], old[6])
+                    out.seek(0, os.SEEK_END)
+                    length, chars = old[6], old[7]
+                else:
+                    data = format_context_entry(path_in_script, content, delimiter).encode('utf-8')
+                    out.write(data)
+                    length, chars = len(data), len(content)
+                    rebuilt += 1
+                entries.append([project_index, rel_path, *fingerprint, offset, length, chars])
+                offset += length
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError: pass
+        raise
+    finally:
+        if old_file is not None: old_file.close()
+
+    os.replace(temp_path, pack_path)
+    st = os.stat(pack_path)
+    index = {
+        'version': PACK_FORMAT_VERSION,
+        'builtAt': int(time.time()),
+        'packSize': st.st_size,
+        'packMtimeNs': st.st_mtime_ns,
+        'totalChars': sum(e[7] for e in entries),
+        'entries': entries,
+        # What the pack was built from: the validity check compares the next scan against 'scanned', not 'entries',
+        # so files that could not be read don't make every later request rebuild the pack.
+        'scanned': [[project_index, rel_path, *fingerprint] for project_index, rel_path, _, fingerprint in files],
+        'skipped': sorted([project_index, rel_path] for project_index, rel_path in skipped),
+    }
+    temp_index_path = f"{index_path}.{threading.get_ident()}.tmp"
+    with open(temp_index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_index_path, index_path)
+    _prune_packs(pack_dir, key)
+    return index, rebuilt
+
+def get_context_pack(project_paths, projects, delimiter, use_git=False, mode='full', outline_threshold=DEFAULT_OUTLINE_THRESHOLD,
+                     max_file_size=0, check_cancelled=None):
+    """
+    Returns a ContextPack holding the context of directory projects, (re)building it when needed.
+    projects: one dict per project with 'path', 'display_prefix', and the pattern lists 'include', 'exclude',
+    'outline' and 'full' already filtered for that project.
+    The project is always walked and every matching file stat'ed; only files whose size, mtime or inode
+    changed since the last build are read again.
+    Files over max_file_size bytes are packed as their head and tail (see large_files.py).
+    check_cancelled, if given, is called once per file and may raise to abandon the scan or build
+    (the previous pack is left in place).
+    """
+    key = get_pack_key(projects, delimiter, use_git, mode, outline_threshold, max_file_size)
+    pack_dir = get_pack_dir(project_paths)
+    pack_path = os.path.join(pack_dir, f"{key}.pack")
+    index_path = os.path.join(pack_dir, f"{key}.json")
+
+    with _get_pack_lock(key):
+        with metrics.stage('pack_check'):
+            files = _scan(projects, use_git, check_cancelled)
+            index = _load_index(index_path, pack_path)
+            current = [[project_index, rel_path, *fingerprint] for project_index, rel_path, _, fingerprint in files]
+            is_valid = index is not None and index['scanned'] == current and not _any_became_readable(index['skipped'], files)
+
+        rebuilt = 0
+        if not is_valid:
+            with metrics.stage('pack_build'):
+                index, rebuilt = _build_pack(pack_dir, key, projects, files, index, delimiter, mode, outline_threshold, max_file_size, check_cancelled)
+            metrics.count('pack_entries_read', rebuilt)
+            metrics.count('pack_entries_reused', len(index['entries']) - rebuilt)
+        else:
+            metrics.count('pack_hits')
+        # Opened under the lock: a later rebuild replaces the path, but this handle keeps the version read here.
+        pack_file = open(pack_path, 'rb')
+    return ContextPack(pack_path, pack_file, index['packSize'], index['totalChars'], rebuilt)
@@ -0,0 +1,150 @@
+import os
+import hashlib
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .job_queue import get_job_queue
+from .project_locks import register_write_listener
+from . import metrics
+
+# Commands of a script run one after another, in order, unless the caller opts in to more workers:
+# lines may depend on each other (files generated by an earlier line, ordered side effects).
+DEFAULT_MAX_WORKERS = 1
+DEFAULT_COMMAND_TIMEOUT = 60
+# Seconds /getcontext waits for the whole script; after that the context is returned without its output.
+DEFAULT_WAIT_TIMEOUT = 120
+
+# Cached command outputs: { (cwd, command, fingerprint): output_text }
+_output_cache = {}
+_output_cache_lock = threading.Lock()
+_OUTPUT_CACHE_MAX_ENTRIES = 256
+
+def get_project_fingerprint(project_path):
+    """
+    Computes a cheap stat-based fingerprint of a project tree.
+    Only metadata is read (names, sizes, mtimes), never file contents.
+    The '.git' directory is not walked, but its HEAD and index are included
+    so that commands like 'git log' or 'git status' are invalidated correctly.
+    """
+    hasher = hashlib.md5()
+    for dirpath, dirnames, filenames in os.walk(project_path, topdown=True):
+        if '.git' in dirnames: dirnames.remove('.git')
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(full_path)
+            except OSError: continue
+            rel_path = os.path.relpath(full_path, project_path)
+            hasher.update(f"{rel_path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+
+    for git_file in ('HEAD', 'index'):
+        try:
+            st = os.stat(os.path.join(project_path, '.git', git_file))
+            hasher.update(f".git/{git_file}\0{st.st_size}\0{st.st_mtime_ns}\n".encode('utf-8'))
+        except OSError: pass
+    return hasher.hexdigest()
+
+def _run_command(command, cwd, timeout):
+    """Runs a single script line and returns its combined output text."""
+    parts = []
+    try:
+        result = subprocess.run(
+            command, shell=True, cwd=cwd,
+            capture_output=True, text=True, check=False, timeout=timeout
+        )
+        stdout, stderr = result.stdout, result.stderr
+    except subprocess.TimeoutExpired as e:
+        stdout = e.stdout.decode('utf-8', errors='ignore') if isinstance(e.stdout, bytes) else (e.stdout or '')
+        stderr = e.stderr.decode('utf-8', errors='ignore') if isinstance(e.stderr, bytes) else (e.stderr or '')
+        stderr += f"# Command timed out after {timeout} seconds.\n"
+
+    if stdout:
+        parts.append(stdout)
+        if not stdout.endswith('\n'): parts.append('\n')
+    if stderr:
+        parts.append(stderr)
+        if not stderr.endswith('\n'): parts.append('\n')
+    return "".join(parts)
+
+def _run_command_cached(command, cwd, timeout, fingerprint):
+    if fingerprint is None:
+        return _run_command(command, cwd, timeout)
+
+    key = (cwd, command, fingerprint)
+    with _output_cache_lock:
+        if key in _output_cache:
+            metrics.count('context_script_cache_hits')
+            return _output_cache[key]
+
+    output = _run_command(command, cwd, timeout)
+    with _output_cache_lock:
+        if len(_output_cache) >= _OUTPUT_CACHE_MAX_ENTRIES:
+            # Drop the oldest entry (dicts keep insertion order).
+            _output_cache.pop(next(iter(_output_cache)))
+        _output_cache[key] = output
+    return output
+
+def _invalidate_outputs(project_paths):
+    """Drops cached outputs for commands run inside projects that were just written to."""
+    with _output_cache_lock:
+        for key in [k for k in _output_cache if any(k[0] == p or k[0].startswith(p + os.sep) or p.startswith(k[0] + os.sep) for p in project_paths)]:
+            del _output_cache[key]
+
+register_write_listener(_invalidate_outputs)
+
+def run_context_script(context_script, cwd, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_COMMAND_TIMEOUT, use_cache=False, job=None):
+    """
+    Runs every non-empty line of an additional-context script as its own shell command.
+    Commands run one at a time in script order, or with max_workers > 1 (opt-in, for independent commands)
+    concurrently, each limited to 'timeout' seconds; their output is always assembled in script order.
+    With use_cache=True a command's output is reused while the project fingerprint is unchanged.
+    When run as a job, each command's output is logged as it completes and commands
+    that have not started yet are skipped after a cancel.
+    Returns the formatted block that is appended to the context.
+    """
+    script_for_display = context_script.replace('\r\n', '\n')
+    commands = [cmd for cmd in script_for_display.split('\n') if cmd.strip()]
+
+    output_parts = [
+        "\n\n# Additional context from script:\n",
+        f"# CWD: {cwd}\n",
+        f"# SCRIPT:\n# ---\n",
+    ]
+    for s_line in script_for_display.split('\n'):
+        output_parts.append(f"# {s_line}\n")
+    output_parts.append("# ---\n")
+
+    if not commands:
+        return "".join(output_parts)
+
+    fingerprint = get_project_fingerprint(cwd) if use_cache else None
+    worker_count = max(1, min(max_workers, len(commands)))
+
+    def run_one(command):
+        if job is not None: job.check_cancelled()
+        return _run_command_cached(command, cwd, timeout, fingerprint)
+
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = [executor.submit(run_one, command) for command in commands]
+        for command, future in zip(commands, futures):
+            output = future.result()
+            output_parts.append("\n")
+            output_parts.append(f"$ {command}\n")
+            output_parts.append(output)
+            if job is not None: job.log(f"$ {command}\n{output}")
+
+    return "".join(output_parts)
+
+def _context_script_job(job, context_script, cwd, max_workers, timeout, use_cache):
+    return run_context_script(context_script, cwd, max_workers, timeout, use_cache, job=job)
+
+def start_context_script(context_script, cwd, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_COMMAND_TIMEOUT, use_cache=False):
+    """
+    Starts run_context_script() as a background job and returns the Job; its result is the script output.
+    Lets the caller scan the project while the script commands are running, or not wait at all.
+    """
+    return get_job_queue().submit(
+        'context_script', _context_script_job, context_script, cwd, max_workers, timeout, use_cache,
+        description=context_script.strip().split('\n')[0], project=cwd
+    )
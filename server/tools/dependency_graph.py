@@ -0,0 +1,195 @@
+import re
+import ast
+import hashlib
+import threading
+import posixpath
+from collections import deque
+
+_JS_EXTENSIONS = ('.js', '.mjs', '.cjs', '.jsx', '.ts', '.tsx', '.vue', '.svelte')
+_JS_RESOLVE_SUFFIXES = ('', '.js', '.ts', '.jsx', '.tsx', '.mjs', '.cjs', '.json', '/index.js', '/index.ts', '/index.jsx', '/index.tsx')
+_JS_IMPORT_RE = re.compile(
+    r"""(?:\bimport\s+(?:[\w*{}\s,$]+\s+from\s+)?|\bexport\s+[\w*{}\s,$]+\s+from\s+|\brequire\s*\(\s*|\bimport\s*\(\s*)['"]([^'"\n]+)['"]"""
+)
+_QUERY_WORD_RE = re.compile(r'[A-Za-z0-9_]{3,}')
+
+# Parsed import specifiers per file: { (path_in_script, content_hash): [specifier, ...] }
+_import_cache = {}
+_import_cache_lock = threading.Lock()
+_IMPORT_CACHE_MAX_ENTRIES = 100000
+
+def _normalize(path_in_script):
+    return path_in_script[2:] if path_in_script.startswith('./') else path_in_script
+
+def _parse_python_imports(content):
+    """Returns import specifiers as ('py', level, dotted_name) tuples."""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return []
+    specs = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                specs.append(('py', 0, alias.name))
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            specs.append(('py', node.level, base))
+            # 'from pkg import mod' may refer to a submodule.
+            for alias in node.names:
+                if alias.name != '*':
+                    specs.append(('py', node.level, f"{base}.{alias.name}" if base else alias.name))
+    return specs
+
+def _parse_js_imports(content):
+    return [('js', 0, spec) for spec in _JS_IMPORT_RE.findall(content) if spec.startswith('.')]
+
+def _get_imports(path, content):
+    key = (path, hashlib.sha1(content.encode('utf-8', errors='surrogateescape')).hexdigest())
+    with _import_cache_lock:
+        cached = _import_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if path.endswith('.py'):
+        specs = _parse_python_imports(content)
+    elif path.endswith(_JS_EXTENSIONS):
+        specs = _parse_js_imports(content)
+    else:
+        specs = []
+
+    with _import_cache_lock:
+        if len(_import_cache) >= _IMPORT_CACHE_MAX_ENTRIES:
+            _import_cache.clear()
+        _import_cache[key] = specs
+    return specs
+
+def _build_python_module_index(paths):
+    """Maps every dotted-name suffix of each Python file to the files it may refer to."""
+    index = {}
+    for path in paths:
+        if not path.endswith('.py'): continue
+        parts = path[:-3].split('/')
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+        for i in range(len(parts)):
+            index.setdefault('.'.join(parts[i:]), []).append(path)
+    return index
+
+def build_dependency_graph(entries):
+    """
+    Builds an import graph for context entries [(path_in_script, content), ...].
+    Returns { path: set(paths it imports) } using normalized paths (without './').
+    Python imports are resolved via 'ast', JS/TS 'import'/'require' via a regex;
+    imports of modules outside the project are ignored.
+    """
+    paths = {_normalize(p) for p, _ in entries}
+    module_index = _build_python_module_index(paths)
+    graph = {path: set() for path in paths}
+
+    for path_in_script, content in entries:
+        path = _normalize(path_in_script)
+        directory = posixpath.dirname(path)
+        for kind, level, name in _get_imports(path, content):
+            targets = []
+            if kind == 'py':
+                if level:
+                    base = directory
+                    for _ in range(level - 1):
+                        base = posixpath.dirname(base)
+                    rel = name.replace('.', '/') if name else ''
+                    candidate = posixpath.join(base, rel) if rel else base
+                    for suffix in ('.py', '/__init__.py'):
+                        if candidate + suffix in paths:
+                            targets.append(candidate + suffix)
+                            break
+                else:
+                    targets = module_index.get(name, [])
+            else:
+                candidate = posixpath.normpath(posixpath.join(directory, name))
+                for suffix in _JS_RESOLVE_SUFFIXES:
+                    if candidate + suffix in paths:
+                        targets.append(candidate + suffix)
+                        break
+            for target in targets:
+                if target != path:
+                    graph[path].add(target)
+    return graph
+
+def _query_scores(entries, query):
+    words = {w.lower() for w in _QUERY_WORD_RE.findall(query or '')}
+    if not words:
+        return {}
+    scores = {}
+    for path_in_script, content in entries:
+        path = _normalize(path_in_script)
+        lowered_path = path.lower()
+        lowered_content = content.lower()
+        score = 0
+        for word in words:
+            if word in lowered_path: score += 10
+            score += min(lowered_content.count(word), 20)
+        if score:
+            scores[path] = score
+    return scores
+
+def rank_entries(entries, seeds=(), query=None, max_query_seeds=5):
+    """
+    Orders context entries by relevance.
+    Seed files (explicit, plus the best matches for 'query') come first, then files by their
+    distance to a seed in the import graph (following imports in both directions), then the rest.
+    Ties are broken by query score and then by size, so smaller files pack first.
+    Returns (ranked_entries, distances) where distances maps normalized paths to graph distance.
+    """
+    graph = build_dependency_graph(entries)
+    query_scores = _query_scores(entries, query)
+
+    undirected = {path: set(targets) for path, targets in graph.items()}
+    for path, targets in graph.items():
+        for target in targets:
+            undirected[target].add(path)
+
+    seed_paths = [_normalize(s.strip()) for s in seeds if s and s.strip()]
+    seed_paths = [s for s in seed_paths if s in graph]
+    # A seed may also be a directory: every file inside it becomes a seed.
+    for s in [_normalize(s.strip()).rstrip('/') for s in seeds if s and s.strip()]:
+        if s not in graph:
+            seed_paths.extend(path for path in graph if path.startswith(s + '/'))
+    seed_paths.extend(path for path, _ in sorted(query_scores.items(), key=lambda item: -item[1])[:max_query_seeds])
+
+    distances = {}
+    queue = deque()
+    for s in seed_paths:
+        if s not in distances:
+            distances[s] = 0
+            queue.append(s)
+    while queue:
+        current = queue.popleft()
+        for neighbor in undirected[current]:
+            if neighbor not in distances:
+                distances[neighbor] = distances[current] + 1
+                queue.append(neighbor)
+
+    def sort_key(entry):
+        path = _normalize(entry[0])
+        return (distances.get(path, float('inf')), -query_scores.get(path, 0), len(entry[1]), path)
+
+    return sorted(entries, key=sort_key), distances
+
+def select_entries_within_budget(entries, budget, size_fn=len, seeds=(), query=None, sizes=None):
+    """
+    Packs the most relevant entries into 'budget' (measured with size_fn, e.g. chars or tokens).
+    sizes: optional { path_in_script: size } already known (e.g. cached per-file token counts);
+    only the other entries are measured with size_fn.
+    Returns (selected_entries, omitted_entries); selected entries keep their original order.
+    """
+    ranked, _ = rank_entries(entries, seeds=seeds, query=query)
+    selected_paths = set()
+    used = 0
+    for path_in_script, content in ranked:
+        size = sizes[path_in_script] if sizes and path_in_script in sizes else size_fn(content)
+        if used + size <= budget:
+            selected_paths.add(path_in_script)
+            used += size
+    selected = [entry for entry in entries if entry[0] in selected_paths]
+    omitted = [entry for entry in entries if entry[0] not in selected_paths]
+    return selected, omitted
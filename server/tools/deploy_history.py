@@ -0,0 +1,256 @@
+import os
+import shlex
+import time
+from .utils import here_doc_value
+from .history_manager import get_history_dir, clear_stack, get_sorted_stack_timestamps, get_snapshot_dir, remove_snapshots
+from .snapshot import snapshot_file
+from .script_executor import iter_script_operations, run_operations, split_script_lines, coalesce_writes, execute_script
+from . import metrics
+
+# Number of deploys kept on the undo stack.
+MAX_HISTORY_ENTRIES = 10
+# Pending redo scripts untouched for this long belong to deploys that never finished.
+STALE_PENDING_SECONDS = 3600
+
+def new_history_timestamp(project_paths):
+    """A timestamp for a new undo entry; two deploys within the same millisecond must not share one, and the new one must sort last."""
+    timestamp = str(int(time.time() * 1000))
+    existing_timestamps = get_sorted_stack_timestamps(project_paths, 'undo')
+    if existing_timestamps and int(existing_timestamps[-1]) >= int(timestamp):
+        timestamp = str(int(existing_timestamps[-1]) + 1)
+    return timestamp
+
+class RollbackRecorder:
+    """
+    Builds the undo script of a deploy while it runs: capture(op) is called right before each ScriptOperation
+    executes and records how to revert it. Files that get overwritten or removed are snapshotted byte-exact
+    (reflink or copy) into snapshot_dir; the undo script restores them by name.
+    Raises ValueError/OSError for unsafe paths or failed snapshots.
+    """
+
+    def __init__(self, resolver, snapshot_dir):
+        self.resolver = resolver
+        self.snapshot_dir = snapshot_dir
+        self.snapshots = 0
+        self.elapsed = 0.0
+        self._commands = []  # In execution order of the deploy; the undo script runs them backwards.
+
+    @property
+    def rollback_commands(self):
+        return self._commands[::-1]
+
+    def _snapshot(self, full_path, raw_path):
+        snapshot_name = str(len(self._commands))
+        snapshot_file(full_path, os.path.join(self.snapshot_dir, snapshot_name))
+        self.snapshots += 1
+        return f"restore {snapshot_name} {shlex.quote(raw_path)}"
+
+    def capture(self, op):
+        started = time.perf_counter()
+        try:
+            self._capture(op)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    def _capture(self, op):
+        check_safety_and_get_path = self.resolver.resolve_safe
+        # 'patch' edits are rolled back like 'cat >' writes: by restoring the whole original file.
+        if op.kind in ('write', 'patch'):
+            full_path = check_safety_and_get_path(op.raw_path)
+            if os.path.isfile(full_path):
+                self._commands.append(self._snapshot(full_path, op.raw_path))
+            else:
+                self._commands.append(f"rm -f {shlex.quote(op.raw_path)}")
+            return
+        if op.kind != 'command':
+            return  # Invalid operations fail without touching anything.
+
+        try:
+            parts = shlex.split(op.line)
+        except ValueError: return # Malformed lines fail in execute_operation().
+        if not parts: return
+        command, args = parts[0], parts[1:]
+
+        if command == 'mkdir':
+            paths_to_create = [arg for arg in args if arg != '-p']
+            for arg in paths_to_create:
+                full_path = check_safety_and_get_path(arg)
+                if not os.path.isdir(full_path):
+                    self._commands.append(f"rmdir {shlex.quote(arg)}")
+        elif command == 'rm':
+            file_paths = [arg for arg in args if not arg.startswith('-')]
+            for relative_path_arg in file_paths:
+                full_path = check_safety_and_get_path(relative_path_arg)
+                if os.path.isfile(full_path):
+                    self._commands.append(self._snapshot(full_path, relative_path_arg))
+        elif command == 'rmdir':
+            for arg in args:
+                full_path = check_safety_and_get_path(arg)
+                if os.path.isdir(full_path):
+                    self._commands.append(f"mkdir {shlex.quote(arg)}")
+        elif command == 'mv':
+            if len(args) == 2:
+                src, dest = args[0], args[1]
+                self._commands.append(f"mv {shlex.quote(dest)} {shlex.quote(src)}")
+
+def _sweep_pending_entries(project_paths, undo_stack_dir):
+    """Removes what deploys that never finished (the server was killed) left behind: their pending redo script and snapshots."""
+    for name in os.listdir(undo_stack_dir):
+        if not (name.startswith('.pending-') and name.endswith('.redo')):
+            continue
+        path = os.path.join(undo_stack_dir, name)
+        try:
+            # A deploy of another process (the CLI) may still be writing it.
+            if time.time() - os.path.getmtime(path) < STALE_PENDING_SECONDS:
+                continue
+            os.remove(path)
+        except OSError: continue
+        remove_snapshots(project_paths, name[len('.pending-'):-len('.redo')])
+
+def _trim_history(project_paths, undo_stack_dir):
+    all_undo_timestamps = get_sorted_stack_timestamps(project_paths, 'undo')
+    if len(all_undo_timestamps) > MAX_HISTORY_ENTRIES:
+        for old_ts in all_undo_timestamps[:-MAX_HISTORY_ENTRIES]:
+            try:
+                os.remove(os.path.join(undo_stack_dir, f"{old_ts}.sh"))
+                os.remove(os.path.join(undo_stack_dir, f"{old_ts}.redo"))
+            except OSError: pass
+            remove_snapshots(project_paths, old_ts)
+    _sweep_pending_entries(project_paths, undo_stack_dir)
+
+def _pending_redo_path(undo_stack_dir, timestamp):
+    # Not named '<timestamp>.*' until complete, so a crash never leaves a half-written history entry.
+    return os.path.join(undo_stack_dir, f".pending-{timestamp}.redo")
+
+def _save_entry(project_paths, undo_stack_dir, timestamp, recorder):
+    """Turns a deploy's pending redo script and its recorded rollback into an entry on the undo stack."""
+    clear_stack(project_paths, 'redo')
+    with open(os.path.join(undo_stack_dir, f"{timestamp}.sh"), 'w', encoding='utf-8') as f: f.write("\n".join(recorder.rollback_commands))
+    os.replace(_pending_redo_path(undo_stack_dir, timestamp), os.path.join(undo_stack_dir, f"{timestamp}.redo"))
+
+def _roll_back(project_paths, resolver, undo_stack_dir, timestamp, recorder):
+    """
+    Reverts what a deploy that failed midway has applied, newest first. If all of it could be reverted, its history
+    entry is discarded; otherwise the entry is saved, so the rest can still be undone. Returns the rollback's errors.
+    """
+    _, error_log = execute_script("\n".join(recorder.rollback_commands), project_paths, tolerate_errors=True, snapshot_dir=recorder.snapshot_dir, resolver=resolver)
+    if error_log:
+        _save_entry(project_paths, undo_stack_dir, timestamp, recorder)
+    else:
+        discard_history_entry(project_paths, timestamp)
+    return error_log
+
+def _rollback_note(rollback_errors):
+    if not rollback_errors:
+        return "The changes applied before the error were rolled back."
+    return (f"Rolling back the changes applied before the error failed for {len(rollback_errors)} operation(s); "
+            "they were kept on the undo stack:\n" + "\n".join(rollback_errors))
+
+def _tee_lines(lines, f):
+    """Passes lines through, writing them to f joined by newlines (the redo script)."""
+    separator = ""
+    for line in lines:
+        f.write(separator + line)
+        separator = "\n"
+        yield line
+
+def run_deploy(project_paths, lines, resolver, delimiter=here_doc_value, tolerate_errors=False, add_empty_line=True, record_history=True):
+    """
+    Executes a deploy script given as lines (any iterable, consumed lazily, e.g. a request body as it arrives)
+    and records it on the undo stack. Operations run as soon as their heredoc closes; each one's rollback is
+    captured right before it runs, and the script is written to the redo file as it is read, so neither the
+    script nor its undo data is ever held in memory as a whole.
+    The caller holds the projects' write lock. Returns (output_log, error_log). On an error that is not tolerated
+    (or when reading the lines fails), the operations already applied are rolled back and the error re-raised.
+    """
+    if not record_history:
+        return run_operations(iter_script_operations(lines, delimiter), resolver, tolerate_errors, add_empty_line)
+
+    timestamp = new_history_timestamp(project_paths)
+    recorder = RollbackRecorder(resolver, get_snapshot_dir(project_paths, timestamp))
+    undo_stack_dir = get_history_dir(project_paths, 'undo')
+    try:
+        with open(_pending_redo_path(undo_stack_dir, timestamp), 'w', encoding='utf-8') as redo_file:
+            operations = iter_script_operations(_tee_lines(lines, redo_file), delimiter)
+            output_log, error_log = run_operations(operations, resolver, tolerate_errors, add_empty_line, before_execute=recorder.capture)
+    except BaseException as e:
+        rollback_errors = _roll_back(project_paths, resolver, undo_stack_dir, timestamp, recorder)
+        if isinstance(e, Exception):
+            raise type(e)(f"{e}\n{_rollback_note(rollback_errors)}") from e
+        raise
+    finally:
+        metrics.record_stage('rollback', recorder.elapsed)
+        metrics.count('snapshots', recorder.snapshots)
+
+    _save_entry(project_paths, undo_stack_dir, timestamp, recorder)
+    _trim_history(project_paths, undo_stack_dir)
+    return output_log, error_log
+
+def _redo_lines(operations, delimiter):
+    """Lines of a script that replays operations, each one complete on its own."""
+    for op in operations:
+        if op.kind == 'invalid':
+            continue  # Changed nothing when it failed.
+        yield op.original_line
+        if op.kind in ('write', 'patch'):
+            yield from op.body
+            yield delimiter
+
+def run_batch_deploy(project_paths, scripts, resolver, delimiter=here_doc_value, tolerate_errors=False, add_empty_line=True, entry_per_script=False):
+    """
+    Executes several deploy scripts, in order, as one transaction. Their operations are merged into one plan
+    in which a file written several times is written once, with its final content (see coalesce_writes()).
+    The batch is recorded as one undo entry, or with entry_per_script as one entry per script; operations are
+    then only coalesced within a script, so that each entry undoes exactly its own script.
+    An entry's redo script is its coalesced plan, one complete command per operation.
+    The caller holds the projects' write lock. Returns (output_log, error_log, number of coalesced operations).
+    On an error that is not tolerated, everything the batch changed is rolled back and the error re-raised.
+    """
+    plans = [list(iter_script_operations(split_script_lines(script), delimiter)) for script in scripts]
+    groups = [[i] for i in range(len(scripts))] if entry_per_script else [list(range(len(scripts)))]
+
+    output_log, error_log = [], []
+    coalesced = 0
+    recorders = []  # (timestamp, RollbackRecorder) per history entry
+    timestamp = int(new_history_timestamp(project_paths))
+    undo_stack_dir = get_history_dir(project_paths, 'undo')
+    try:
+        for group in groups:
+            recorder = RollbackRecorder(resolver, get_snapshot_dir(project_paths, timestamp))
+            recorders.append((str(timestamp), recorder))
+            operations, dropped = coalesce_writes((op for script_index in group for op in plans[script_index]), resolver)
+            coalesced += dropped
+            # Redo replays the plan, not the joined scripts: an unterminated heredoc would swallow the next script.
+            with open(_pending_redo_path(undo_stack_dir, timestamp), 'w', encoding='utf-8') as f:
+                f.write("\n".join(_redo_lines(operations, delimiter)))
+            timestamp += 1
+            kept = set(map(id, operations))
+            for script_index in group:
+                script_operations = [op for op in plans[script_index] if id(op) in kept]
+                script_output, script_errors = run_operations(script_operations, resolver, tolerate_errors, add_empty_line,
+                                                              before_execute=recorder.capture, error_prefix=f"Script {script_index + 1}: ")
+                output_log.extend(script_output)
+                error_log.extend(script_errors)
+    except Exception as e:
+        rollback_errors = []
+        for entry_timestamp, recorder in reversed(recorders):
+            rollback_errors += _roll_back(project_paths, resolver, undo_stack_dir, entry_timestamp, recorder)
+        raise type(e)(f"{e}\n{_rollback_note(rollback_errors)}") from e
+    finally:
+        metrics.record_stage('rollback', sum(recorder.elapsed for _, recorder in recorders))
+        metrics.count('snapshots', sum(recorder.snapshots for _, recorder in recorders))
+    metrics.count('coalesced_writes', coalesced)
+
+    for entry_timestamp, recorder in recorders:
+        _save_entry(project_paths, undo_stack_dir, entry_timestamp, recorder)
+    _trim_history(project_paths, undo_stack_dir)
+    return output_log, error_log, coalesced
+
+def discard_history_entry(project_paths, timestamp):
+    """Removes a history entry (scripts, pending redo script and snapshots) again, e.g. when its deploy was rolled back."""
+    undo_stack_dir = get_history_dir(project_paths, 'undo')
+    for path in (os.path.join(undo_stack_dir, f"{timestamp}.sh"), os.path.join(undo_stack_dir, f"{timestamp}.redo"), _pending_redo_path(undo_stack_dir, timestamp)):
+        try:
+            os.remove(path)
+        except OSError: pass
+    remove_snapshots(project_paths, timestamp)
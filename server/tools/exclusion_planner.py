@@ -0,0 +1,120 @@
+import fnmatch
+
+# Directory names that almost never belong in an LLM context (dependencies, build output, caches).
+VENDORED_DIR_NAMES = {
+    'node_modules', 'bower_components', 'vendor', 'third_party', 'third-party', 'external',
+    'venv', '.venv', 'env', 'site-packages', '.tox', '.nox', '__pycache__', '.mypy_cache',
+    '.pytest_cache', '.ruff_cache', '.gradle', '.idea', '.vscode', '.git', '.hg', '.svn',
+}
+GENERATED_DIR_NAMES = {
+    'dist', 'build', 'out', 'target', 'bin', 'obj', '.next', '.nuxt', '.cache', '.parcel-cache',
+    'coverage', 'htmlcov', '.angular', '.svelte-kit', 'generated', 'gen', 'tmp', 'temp', 'logs',
+}
+LOCKFILE_NAMES = {
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock', 'Pipfile.lock', 'Cargo.lock',
+    'composer.lock', 'Gemfile.lock', 'go.sum', 'uv.lock', 'bun.lockb', 'flake.lock', 'mix.lock',
+}
+GENERATED_FILE_PATTERNS = (
+    '*.min.js', '*.min.css', '*.map', '*.bundle.js', '*.chunk.js', '*.log', '*.csv', '*.tsv',
+    '*.sql', '*.dump', '*.svg', '*.pb.go', '*_pb2.py', '*.generated.*', '*.snap', '*.ipynb',
+)
+
+def _classify(path, is_dir):
+    """Returns the heuristic reason a path is a likely exclusion candidate, or None."""
+    name = path.rsplit('/', 1)[-1]
+    if is_dir:
+        if name in VENDORED_DIR_NAMES or name.endswith('.egg-info'): return 'vendored'
+        if name in GENERATED_DIR_NAMES: return 'generated'
+        return None
+    if name in LOCKFILE_NAMES or name.endswith('.lock'): return 'lockfile'
+    if any(fnmatch.fnmatch(name, pat) for pat in GENERATED_FILE_PATTERNS): return 'generated'
+    return None
+
+def plan_exclusions(file_stats, budget, metric='chars', protected_paths=()):
+    """
+    Picks a small set of exclude patterns that brings the total size under 'budget'.
+
+    file_stats: { rel_path: {'chars': .., 'lines': .., 'tokens': ..} } as returned by collect_file_stats().
+    metric: which stat the budget is measured in ('chars' or 'tokens').
+    protected_paths: directories that must never be excluded as a whole (e.g. multi-project roots).
+
+    Candidates are ranked in two tiers: first paths that look vendored, generated or like lockfiles
+    (largest first), then ordinary directories and files. Within the second tier the smallest
+    candidate that covers the whole remaining excess is preferred, so large but useful directories
+    are only excluded when nothing smaller is enough.
+
+    Returns (plan, remaining_total), where plan is a list of
+    {'path', 'pattern', 'size', 'reason'} dicts in the order they were chosen.
+    """
+    # Sizes of every file and every directory (a directory's size is the sum of the files below it).
+    sizes = {}
+    is_dir = {}
+    for path, stats in file_stats.items():
+        size = stats.get(metric, 0)
+        sizes[path] = size
+        is_dir[path] = False
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            dir_path = '/'.join(parts[:i])
+            sizes[dir_path] = sizes.get(dir_path, 0) + size
+            is_dir[dir_path] = True
+
+    total = sum(stats.get(metric, 0) for stats in file_stats.values())
+    protected = set(p.strip('/') for p in protected_paths)
+    plan = []
+    if total <= budget:
+        return plan, total
+
+    excluded = []  # paths already chosen
+    def is_covered(path):
+        return any(path == e or path.startswith(e + '/') for e in excluded)
+
+    def effective_size(path):
+        # Subtract parts already removed by earlier (nested) choices.
+        size = sizes[path]
+        for e in excluded:
+            if e.startswith(path + '/'):
+                size -= sizes[e]
+        return size
+
+    def _choose(path, size, reason):
+        # A directory chosen later replaces the entries already chosen inside it.
+        nested = [e for e in excluded if e.startswith(path + '/')]
+        for e in nested: excluded.remove(e)
+        plan[:] = [entry for entry in plan if entry['path'] not in nested]
+        if nested: size = sizes[path]
+        excluded.append(path)
+        plan.append({'path': path, 'pattern': path + '/' if is_dir[path] else path, 'size': size, 'reason': reason})
+
+    candidates = [p for p in sizes if p not in protected and sizes[p] > 0]
+    reasons = {p: _classify(p, is_dir[p]) for p in candidates}
+    heuristic_candidates = sorted((p for p in candidates if reasons[p]), key=lambda p: (-sizes[p], p))
+    plain_candidates = [p for p in candidates if not reasons[p]]
+
+    remaining = total
+    for path in heuristic_candidates:
+        if remaining <= budget: break
+        if is_covered(path): continue
+        size = effective_size(path)
+        if size <= 0: continue
+        _choose(path, size, reasons[path])
+        remaining -= size
+
+    while remaining > budget:
+        excess = remaining - budget
+        best_cover, best_largest = None, None
+        for path in plain_candidates:
+            if is_covered(path): continue
+            size = effective_size(path)
+            if size <= 0: continue
+            if size >= excess and (best_cover is None or size < best_cover[1] or (size == best_cover[1] and path < best_cover[0])):
+                best_cover = (path, size)
+            if best_largest is None or size > best_largest[1]:
+                best_largest = (path, size)
+        chosen = best_cover or best_largest
+        if chosen is None: break
+        path, size = chosen
+        _choose(path, size, 'size')
+        remaining -= size
+
+    return plan, remaining
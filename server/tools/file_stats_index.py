@@ -0,0 +1,214 @@
+import os
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from .context_generator import is_binary, _walk_files, _is_file_excluded
+from .token_estimator import get_estimator, count_file_tokens
+from .project_locks import get_project_generation
+from .large_files import get_max_file_size
+from . import metrics
+
+# Seconds an index is reused before the project is walked again. Deploys, undo and redo
+# through the server invalidate it right away; this only bounds how long outside edits go unseen.
+DEFAULT_INDEX_MAX_AGE = 10.0
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Indexes kept in memory (one per project and pattern set).
+MAX_CACHED_INDEXES = 16
+
+class FileStatsIndex:
+    """
+    Sorted stats of the text files of one project, for one include/exclude pattern set.
+    paths, sizes and lines are parallel lists; lines are estimated from the size (size / 35, as in the extension).
+    """
+
+    def __init__(self, project_path, include_patterns, exclude_patterns):
+        self.project_path = project_path
+        self.include_patterns = list(include_patterns)
+        self.exclude_patterns = list(exclude_patterns)
+        self.paths = []
+        self.sizes = []
+        self.lines = []
+        self.built_at = 0.0
+        self.generation = -1
+        # rel_path -> (size, mtime_ns, is_binary) of every file seen, so unchanged files are not sniffed again.
+        self._sniffed = {}
+        self.lock = threading.Lock()
+
+    def is_fresh(self, max_age):
+        return (time.monotonic() - self.built_at) < max_age and self.generation == get_project_generation(self.project_path)
+
+    def refresh(self, check_cancelled=None):
+        """Walks the project again. check_cancelled, if given, is called once per file and may raise to abandon the walk."""
+        started = time.perf_counter()
+        generation = get_project_generation(self.project_path)
+        processed_exclude_patterns = [p + '*' if p.endswith('/') else p for p in self.exclude_patterns]
+        processed_include_patterns = [p + '*' if p.endswith('/') else p for p in self.include_patterns]
+
+        sniffed = {}
+        entries = []
+        sniffs = 0
+        for rel_path, full_path in _walk_files(self.project_path, processed_exclude_patterns, processed_include_patterns, self.include_patterns):
+            if check_cancelled is not None: check_cancelled()
+            if processed_exclude_patterns and _is_file_excluded(rel_path, rel_path.rsplit('/', 1)[-1], processed_exclude_patterns, processed_include_patterns):
+                continue
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            previous = self._sniffed.get(rel_path)
+            if previous is not None and previous[0] == st.st_size and previous[1] == st.st_mtime_ns:
+                binary = previous[2]
+            else:
+                binary = is_binary(full_path)
+                sniffs += 1
+            sniffed[rel_path] = (st.st_size, st.st_mtime_ns, binary)
+            if not binary:
+                entries.append((rel_path, st.st_size))
+
+        entries.sort()
+        self.paths = [rel_path for rel_path, _ in entries]
+        self.sizes = [size for _, size in entries]
+        self.lines = [(size + 34) // 35 if size > 0 else 0 for size in self.sizes]
+        self._sniffed = sniffed
+        self.built_at = time.monotonic()
+        self.generation = generation
+        metrics.record_stage('stats_index', time.perf_counter() - started)
+        metrics.count('binary_sniffs', sniffs)
+
+    def directory_range(self, rel_dir):
+        """(start, end) of the files under rel_dir ('' for the whole project) in the sorted lists."""
+        if not rel_dir:
+            return 0, len(self.paths)
+        # '0' is the character after '/', so [rel_dir + '/', rel_dir + '0') holds exactly the paths under rel_dir.
+        return bisect.bisect_left(self.paths, rel_dir + '/'), bisect.bisect_left(self.paths, rel_dir + '0')
+
+# (abspath, include, exclude) -> FileStatsIndex, least recently used first.
+_indexes = OrderedDict()
+_indexes_guard = threading.Lock()
+
+def get_stats_index(project_path, include_patterns=(), exclude_patterns=(), max_age=DEFAULT_INDEX_MAX_AGE, check_cancelled=None):
+    """
+    Returns the stats index of a project for a pattern set, walking the project only if the cached one is stale.
+    check_cancelled: see FileStatsIndex.refresh(); an abandoned walk leaves the previous index in place.
+    """
+    key = (os.path.abspath(project_path), tuple(include_patterns), tuple(exclude_patterns))
+    with _indexes_guard:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = FileStatsIndex(key[0], include_patterns, exclude_patterns)
+        _indexes.move_to_end(key)
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    with index.lock:
+        if index.is_fresh(max_age):
+            metrics.count('stats_index_hits')
+        else:
+            index.refresh(check_cancelled)
+    return index
+
+def _join(prefix, rel_path):
+    return f"{prefix}/{rel_path}" if prefix else rel_path
+
+def _file_item(index, i, prefix, estimator):
+    item = {"path": _join(prefix, index.paths[i]), "chars": index.sizes[i], "lines": index.lines[i]}
+    if estimator is not None:
+        item["tokens"] = count_file_tokens(os.path.join(index.project_path, index.paths[i].replace('/', os.sep)), estimator=estimator, max_file_size=get_max_file_size())
+    return item
+
+def _scopes(projects, directory):
+    """Yields (project_number, index, prefix, rel_dir) for every project that has files under 'directory'."""
+    directory = directory.strip('/')
+    for number, (index, prefix) in enumerate(projects):
+        if not prefix:
+            yield number, index, prefix, directory
+        elif not directory:
+            yield number, index, prefix, ''
+        elif directory == prefix or directory.startswith(prefix + '/'):
+            yield number, index, prefix, directory[len(prefix) + 1:]
+
+def _parse_cursor(cursor):
+    """Cursors are '<project number>:<path of the last item returned>'."""
+    if not cursor:
+        return None
+    number, _, path = cursor.partition(':')
+    if not number.isdigit():
+        raise ValueError(f"Invalid cursor: '{cursor}'")
+    return int(number), path
+
+def list_file_stats(projects, directory='', cursor=None, page_size=DEFAULT_PAGE_SIZE, count_tokens=False):
+    """
+    One page of file stats under 'directory' (a path as shown in the tree, with the project prefix if there
+    are several projects; '' for everything). projects: [(FileStatsIndex, prefix or None), ...].
+    Returns {"items": [...], "nextCursor": str or None, "totalFiles": int, "totalChars": int};
+    page_size=None returns all files in one page.
+    """
+    if page_size is not None: page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    after = _parse_cursor(cursor)
+    estimator = get_estimator() if count_tokens else None
+    items = []
+    last_key = None
+    has_more = False
+    total_files = 0
+    total_chars = 0
+    for number, index, prefix, rel_dir in _scopes(projects, directory):
+        start, end = index.directory_range(rel_dir)
+        total_files += end - start
+        total_chars += sum(index.sizes[start:end])
+        if has_more or (after is not None and number < after[0]):
+            continue
+        if after is not None and number == after[0]:
+            start = max(start, bisect.bisect_right(index.paths, after[1], start, end))
+        for i in range(start, end):
+            if page_size is not None and len(items) == page_size:
+                has_more = True
+                break
+            items.append(_file_item(index, i, prefix, estimator))
+            last_key = (number, index.paths[i])
+    next_cursor = f"{last_key[0]}:{last_key[1]}" if has_more else None
+    return {"items": items, "nextCursor": next_cursor, "totalFiles": total_files, "totalChars": total_chars}
+
+def aggregate_directory(projects, directory='', cursor=None, page_size=DEFAULT_PAGE_SIZE, count_tokens=False):
+    """
+    The direct children of 'directory': sub-directories with the summed stats of all files below them
+    ({"path", "isDir": true, "chars", "lines", "files"}) and files ({"path", "chars", "lines"}), sorted by path.
+    With several projects and no directory, the children are the projects themselves.
+    Paginated like list_file_stats(); the cursor is the path of the last child returned.
+    """
+    if page_size is not None: page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    estimator = get_estimator() if count_tokens else None
+    directory = directory.strip('/')
+    children = {}
+    total_files = 0
+    total_chars = 0
+    for _, index, prefix, rel_dir in _scopes(projects, directory):
+        start, end = index.directory_range(rel_dir)
+        total_files += end - start
+        offset = len(rel_dir) + 1 if rel_dir else 0
+        for i in range(start, end):
+            total_chars += index.sizes[i]
+            if prefix and not directory:
+                child_path, is_dir = prefix, True
+            else:
+                name, separator, _ = index.paths[i][offset:].partition('/')
+                child_path, is_dir = _join(prefix, index.paths[i][:offset] + name), bool(separator)
+            if not is_dir:
+                children[child_path] = _file_item(index, i, prefix, estimator)
+                continue
+            child = children.get(child_path)
+            if child is None:
+                child = children[child_path] = {"path": child_path, "isDir": True, "chars": 0, "lines": 0, "files": 0}
+                if estimator is not None: child["tokens"] = 0
+            child["chars"] += index.sizes[i]
+            child["lines"] += index.lines[i]
+            child["files"] += 1
+            if estimator is not None:
+                child["tokens"] += count_file_tokens(os.path.join(index.project_path, index.paths[i].replace('/', os.sep)), estimator=estimator, max_file_size=get_max_file_size())
+
+    ordered_paths = sorted(children)
+    start = bisect.bisect_right(ordered_paths, cursor) if cursor else 0
+    end = len(ordered_paths) if page_size is None else min(start + page_size, len(ordered_paths))
+    page_paths = ordered_paths[start:end]
+    next_cursor = page_paths[-1] if end < len(ordered_paths) else None
+    return {"items": [children[p] for p in page_paths], "nextCursor": next_cursor, "totalFiles": total_files, "totalChars": total_chars}
@@ -1,4 +1,5 @@
 import os
+import shutil
 from .utils import get_justcode_root, get_project_id
 
 def get_history_dir(project_path, stack_type):
@@ -9,10 +10,21 @@ def get_history_dir(project_path, stack_type):
     os.makedirs(history_dir, exist_ok=True)
     return history_dir
 
+def get_snapshot_dir(project_path, timestamp):
+    """Gets the directory holding the original files snapshotted for one history entry."""
+    justcode_root = get_justcode_root()
+    project_id = get_project_id(project_path)
+    return os.path.join(justcode_root, ".justcode", project_id, "snapshots", str(timestamp))
+
+def remove_snapshots(project_path, timestamp):
+    shutil.rmtree(get_snapshot_dir(project_path, timestamp), ignore_errors=True)
+
 def clear_stack(project_path, stack_type):
-    """Deletes all scripts in a given stack for a specific project."""
+    """Deletes all scripts (and their snapshots) in a given stack for a specific project."""
     stack_dir = get_history_dir(project_path, stack_type)
     if os.path.exists(stack_dir):
+        for timestamp in get_sorted_stack_timestamps(project_path, stack_type):
+            remove_snapshots(project_path, timestamp)
         for f in os.listdir(stack_dir):
             os.remove(os.path.join(stack_dir, f))
 
@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import signal
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOB_WORKERS = 4
+# Context scripts run on their own workers: a /getcontext request waits for them, so they must never
+# queue behind long post-deploy scripts.
+DEFAULT_CONTEXT_SCRIPT_JOB_WORKERS = 2
+MAX_FINISHED_JOBS = 100
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = 'queued', 'running', 'succeeded', 'failed', 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """
+    A unit of background work. The job function receives the Job and reports through it:
+    job.log(text) appends output, job.check_cancelled() raises JobCancelled once a cancel was requested.
+    """
+
+    def __init__(self, kind, description='', project=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.description = description
+        self.project = project
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._log_chunks = []
+        self._cancel_event = threading.Event()
+        self._changed = threading.Condition()
+        self._process = None
+
+    def log(self, text):
+        if not text: return
+        with self._changed:
+            self._log_chunks.append(text)
+            self._changed.notify_all()
+
+    def get_logs(self, offset=0):
+        """Returns (log_text_from_offset, next_offset); offsets count log chunks."""
+        with self._changed:
+            chunks = self._log_chunks[offset:]
+            return "".join(chunks), offset + len(chunks)
+
+    def wait_for_change(self, offset, timeout):
+        """Blocks until there is log output past 'offset', the job has finished, or 'timeout' passed."""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self._log_chunks) > offset or self.finished, timeout)
+
+    def wait(self, timeout=None):
+        with self._changed:
+            return self._changed.wait_for(lambda: self.finished, timeout)
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        """Requests cancellation. A queued job never starts; a running subprocess is terminated."""
+        self._cancel_event.set()
+        process = self._process
+        if process is not None and process.poll() is None:
+            _terminate(process)
+        with self._changed:
+            if self.status == QUEUED:
+                self._set_status(CANCELLED)
+
+    def _set_status(self, status):
+        # Caller holds self._changed.
+        self.status = status
+        if status == RUNNING: self.started_at = time.time()
+        if status in FINISHED_STATES: self.finished_at = time.time()
+        self._changed.notify_all()
+
+    def to_dict(self, include_logs=False, log_offset=0):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'project': self.project,
+            'status': self.status,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+            'error': self.error,
+        }
+        if self.finished and isinstance(self.result, (str, int, float, bool, dict, list)):
+            data['result'] = self.result
+        if include_logs:
+            data['logs'], data['logOffset'] = self.get_logs(log_offset)
+        return data
+
+def _terminate(process):
+    try:
+        if os.name == 'nt':
+            process.terminate()
+        else:
+            os.killpg(process.pid, signal.SIGTERM)
+    except (OSError, ProcessLookupError): pass
+
+class JobQueue:
+    """
+    A small in-process scheduler: a fixed worker pool plus a registry of recent jobs.
+    dedicated_workers: { kind: workers } for kinds of job that get a pool of their own instead of the shared one.
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, dedicated_workers=None):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._dedicated_executors = {
+            kind: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f'job-{kind}')
+            for kind, count in (dedicated_workers or {}).items()
+        }
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, description='', project=None, **kwargs):
+        """Queues fn(job, *args, **kwargs); its return value becomes job.result. Returns the Job."""
+        job = Job(kind, description, project)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._dedicated_executors.get(kind, self._executor).submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with job._changed:
+            if job.status != QUEUED: return  # Cancelled while waiting.
+            job._set_status(RUNNING)
+        try:
+            job.check_cancelled()
+            result = fn(job, *args, **kwargs)
+            with job._changed:
+                job.result = result
+                job._set_status(CANCELLED if job.cancel_requested else SUCCEEDED)
+        except JobCancelled:
+            with job._changed:
+                job._set_status(CANCELLED)
+        except Exception as e:
+            with job._changed:
+                job.error = str(e)
+                job._set_status(CANCELLED if job.cancel_requested else FAILED)
+
+    def _prune(self):
+        # Caller holds self._lock. Forget the oldest finished jobs.
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self):
+        for job in self.list():
+            if not job.finished: job.cancel()
+        for executor in [self._executor, *self._dedicated_executors.values()]:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def run_shell_job(job, command, cwd, timeout=None):
+    """
+    Job function running a shell command. Output is streamed into the job log line by line.
+    Returns the exit code; raises if the command fails, times out or is cancelled.
+    """
+    popen_kwargs = {'start_new_session': True} if os.name != 'nt' else {}
+    process = subprocess.Popen(
+        command, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        text=True, errors='replace', bufsize=1, **popen_kwargs
+    )
+    job._process = process
+    if job.cancel_requested: _terminate(process)
+
+    timer = None
+    timed_out = threading.Event()
+    if timeout:
+        def on_timeout():
+            timed_out.set()
+            _terminate(process)
+        timer = threading.Timer(timeout, on_timeout)
+        timer.daemon = True
+        timer.start()
+    try:
+        for line in process.stdout:
+            job.log(line)
+        returncode = process.wait()
+    finally:
+        if timer: timer.cancel()
+        process.stdout.close()
+
+    job.check_cancelled()
+    if timed_out.is_set():
+        raise TimeoutError(f"Command timed out after {timeout} seconds.")
+    if returncode != 0:
+        raise RuntimeError(f"Command exited with code {returncode}.")
+    return returncode
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """
+    Returns the process-wide job queue, creating it on first use: JUSTCODE_JOB_WORKERS shared workers,
+    plus JUSTCODE_CONTEXT_SCRIPT_JOB_WORKERS reserved for context scripts.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(
+                workers=int(os.getenv('JUSTCODE_JOB_WORKERS', DEFAULT_JOB_WORKERS)),
+                dedicated_workers={'context_script': int(os.getenv('JUSTCODE_CONTEXT_SCRIPT_JOB_WORKERS', DEFAULT_CONTEXT_SCRIPT_JOB_WORKERS))}
+            )
+        return _job_queue
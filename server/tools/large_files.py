@@ -0,0 +1,65 @@
+import os
+import re
+import mmap
+
+# Text files larger than this many bytes are cut to their head and tail in the context. 0 (the default) disables the cap.
+DEFAULT_MAX_FILE_SIZE = 0
+# Bytes kept from the start and from the end of an oversized file (cut back to whole lines).
+TRUNCATED_HEAD_BYTES = 48 * 1024
+TRUNCATED_TAIL_BYTES = 16 * 1024
+# Newlines are counted over a memory map in slices of this size, never line by line.
+_COUNT_CHUNK_SIZE = 4 * 1024 * 1024
+# The line between the head and the tail of an excerpt.
+_MARKER_PREFIX = "[TRUNCATED BY JUSTCODE: "
+_MARKER_RE = re.compile(r'^\[TRUNCATED BY JUSTCODE: [\d,]+ bytes in full, [\d,]+ bytes \([\d,]+ lines\) omitted here\. Do not rewrite this file from this excerpt\.\]$', re.M)
+
+def get_max_file_size():
+    """The per-file cap from JUSTCODE_MAX_FILE_SIZE (bytes), or the default."""
+    return int(os.getenv('JUSTCODE_MAX_FILE_SIZE', DEFAULT_MAX_FILE_SIZE))
+
+def is_oversized(size, max_file_size):
+    """Whether a file of 'size' bytes is sent as an excerpt. A file the excerpt would hold whole never is."""
+    return bool(max_file_size) and size > max(max_file_size, TRUNCATED_HEAD_BYTES + TRUNCATED_TAIL_BYTES)
+
+def tree_note(size):
+    """Suffix for the tree line of a file that is truncated in the context."""
+    return f"[truncated: {size:,} bytes]"
+
+def _count_newlines(mapped, start, end):
+    newlines = 0
+    for offset in range(start, end, _COUNT_CHUNK_SIZE):
+        newlines += mapped[offset:min(offset + _COUNT_CHUNK_SIZE, end)].count(b'\n')
+    return newlines
+
+def _decode(data):
+    # Same result as reading in text mode: errors ignored, universal newlines.
+    return data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+def read_text_file(file_path, max_file_size=0):
+    """
+    Reads a text file for the context. Returns (content, file_size, truncated).
+    A file over max_file_size is not read as a whole: its first and last lines (about TRUNCATED_HEAD_BYTES
+    and TRUNCATED_TAIL_BYTES) are taken from a memory map, with a marker line in between.
+    """
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not is_oversized(size, max_file_size):
+            return _decode(f.read()), size, False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            head_end = mapped.rfind(b'\n', 0, TRUNCATED_HEAD_BYTES) + 1 or TRUNCATED_HEAD_BYTES
+            tail_start = mapped.find(b'\n', size - TRUNCATED_TAIL_BYTES) + 1 or size - TRUNCATED_TAIL_BYTES
+            tail_start = max(tail_start, head_end)
+            head, tail = mapped[:head_end], mapped[tail_start:]
+            omitted_lines = _count_newlines(mapped, head_end, tail_start)
+
+    # The marker is always a line of its own, even when the head had to be cut inside a line.
+    line_break = "" if head.endswith(b'\n') else "\n"
+    marker = (f"{line_break}{_MARKER_PREFIX}{size:,} bytes in full, {tail_start - head_end:,} bytes ({omitted_lines:,} lines) "
+              f"omitted here. Do not rewrite this file from this excerpt.]\n")
+    return _decode(head) + marker + _decode(tail), size, True
+
+def is_truncated(content):
+    """True for an excerpt returned by read_text_file(), which must never be emitted as a deployable 'cat >' block."""
+    # The marker follows the head, so only the start of the text is searched.
+    end = TRUNCATED_HEAD_BYTES + 1024
+    return content.find(_MARKER_PREFIX, 0, end) != -1 and _MARKER_RE.search(content, 0, end) is not None
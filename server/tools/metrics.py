@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import threading
+import traceback
+from contextlib import contextmanager
+
+# Request duration histogram buckets, in seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DEFAULT_SLOW_REQUEST_MS = 5000
+
+_local = threading.local()
+_lock = threading.Lock()
+# Process-wide aggregates rendered by /metrics.
+_requests = {}            # (endpoint, method, status) -> count
+_durations = {}           # endpoint -> [bucket counts..., +Inf count, sum]
+_stage_totals = {}        # stage -> [seconds, calls]
+_counters = {}            # name -> value
+_exceptions = {}          # endpoint -> count
+
+class RequestMetrics:
+    """Stage durations and counters of the request running on the current thread."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}    # stage -> [seconds, calls], in first-seen order
+        self.counters = {}
+
+    def server_timing(self):
+        """Formats the stages (and counters, as descriptions) for a Server-Timing header."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, (seconds, _) in self.stages.items()]
+        parts.extend(f'{name};desc="{value}"' for name, value in self.counters.items())
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+def start_request():
+    _local.current = RequestMetrics()
+    return _local.current
+
+def end_request():
+    current = getattr(_local, 'current', None)
+    _local.current = None
+    return current
+
+def record_stage(name, seconds, calls=1):
+    """Adds time spent in a stage. Outside a request only the process-wide totals are updated."""
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        entry = current.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+    with _lock:
+        entry = _stage_totals.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += calls
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+def count(name, value=1):
+    """Increments a counter such as files_scanned, bytes_read or a cache hit counter."""
+    if not value: return
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current.counters[name] = current.counters.get(name, 0) + value
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def record_request(endpoint, method, status, seconds):
+    with _lock:
+        key = (endpoint, method, status)
+        _requests[key] = _requests.get(key, 0) + 1
+        histogram = _durations.setdefault(endpoint, [0] * (len(DURATION_BUCKETS) + 1) + [0.0])
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound: histogram[i] += 1
+        histogram[len(DURATION_BUCKETS)] += 1
+        histogram[-1] += seconds
+
+def record_exception(endpoint):
+    with _lock:
+        _exceptions[endpoint] = _exceptions.get(endpoint, 0) + 1
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render_prometheus():
+    """Returns all aggregates in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        lines.append("# HELP justcode_requests_total HTTP requests by endpoint, method and status.")
+        lines.append("# TYPE justcode_requests_total counter")
+        for (endpoint, method, status), value in sorted(_requests.items()):
+            lines.append(f'justcode_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",status="{status}"}} {value}')
+
+        lines.append("# HELP justcode_request_duration_seconds Request duration by endpoint.")
+        lines.append("# TYPE justcode_request_duration_seconds histogram")
+        for endpoint, histogram in sorted(_durations.items()):
+            label = f'endpoint="{_escape(endpoint)}"'
+            for i, bound in enumerate(DURATION_BUCKETS):
+                lines.append(f'justcode_request_duration_seconds_bucket{{{label},le="{bound}"}} {histogram[i]}')
+            lines.append(f'justcode_request_duration_seconds_bucket{{{label},le="+Inf"}} {histogram[len(DURATION_BUCKETS)]}')
+            lines.append(f'justcode_request_duration_seconds_sum{{{label}}} {histogram[-1]:.6f}')
+            lines.append(f'justcode_request_duration_seconds_count{{{label}}} {histogram[len(DURATION_BUCKETS)]}')
+
+        lines.append("# HELP justcode_stage_seconds_total Time spent per processing stage.")
+        lines.append("# TYPE justcode_stage_seconds_total counter")
+        for name, (seconds, _) in sorted(_stage_totals.items()):
+            lines.append(f'justcode_stage_seconds_total{{stage="{_escape(name)}"}} {seconds:.6f}')
+        lines.append("# HELP justcode_stage_calls_total Number of times each stage ran.")
+        lines.append("# TYPE justcode_stage_calls_total counter")
+        for name, (_, calls) in sorted(_stage_totals.items()):
+            lines.append(f'justcode_stage_calls_total{{stage="{_escape(name)}"}} {calls}')
+
+        lines.append("# HELP justcode_events_total Work counters (files scanned, bytes read, cache hits, ...).")
+        lines.append("# TYPE justcode_events_total counter")
+        for name, value in sorted(_counters.items()):
+            lines.append(f'justcode_events_total{{event="{_escape(name)}"}} {value}')
+
+        lines.append("# HELP justcode_exceptions_total Unhandled exceptions by endpoint.")
+        lines.append("# TYPE justcode_exceptions_total counter")
+        for endpoint, value in sorted(_exceptions.items()):
+            lines.append(f'justcode_exceptions_total{{endpoint="{_escape(endpoint)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+def _log_slow_request(log_path, entry):
+    line = json.dumps(entry)
+    if not log_path:
+        print(f"Slow request: {line}")
+        return
+    try:
+        with open(log_path, 'a', encoding='utf-8') as f: f.write(line + "\n")
+    except OSError as e:
+        print(f"Warning: could not write slow request log '{log_path}': {e}\nSlow request: {line}")
+
+def init_metrics(app):
+    """
+    Registers per-request stage timing (returned in a Server-Timing header), the /metrics endpoint
+    and the slow-request log. JUSTCODE_SLOW_REQUEST_MS sets the threshold (0 disables it) and
+    JUSTCODE_SLOW_REQUEST_LOG a file for JSON lines (default: printed to the console).
+    """
+    from flask import request, Response, got_request_exception
+
+    slow_request_ms = float(os.getenv('JUSTCODE_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS))
+    slow_request_log = os.getenv('JUSTCODE_SLOW_REQUEST_LOG', '')
+
+    @app.before_request
+    def start_request_metrics():
+        start_request()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        current = end_request()
+        if current is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        elapsed = time.perf_counter() - current.started
+        response.headers['Server-Timing'] = current.server_timing()
+        record_request(endpoint, request.method, response.status_code, elapsed)
+
+        if slow_request_ms and elapsed * 1000 >= slow_request_ms:
+            _log_slow_request(slow_request_log, {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'method': request.method,
+                'endpoint': endpoint,
+                'paths': request.args.getlist('path'),
+                'status': response.status_code,
+                'ms': round(elapsed * 1000, 1),
+                'stages': {name: round(seconds * 1000, 1) for name, (seconds, _) in current.stages.items()},
+                'counters': current.counters,
+            })
+        return response
+
+    def on_exception(sender, exception, **extra):
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        record_exception(endpoint)
+        print(f"Unhandled exception in {request.method} {endpoint}:\n{''.join(traceback.format_exception(exception))}")
+
+    got_request_exception.connect(on_exception, app, weak=False)
+
+    def metrics_endpoint():
+        return Response(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint, methods=['GET'])
@@ -0,0 +1,121 @@
+import re
+import ast
+import copy
+import fnmatch
+import hashlib
+import threading
+from . import metrics
+
+DEFAULT_OUTLINE_THRESHOLD = 4000
+# Starts the first line of every outline (after the comment marker); see is_outline().
+OUTLINE_HEADER = '[OUTLINE ONLY:'
+
+_PYTHON_EXTENSIONS = ('.py', '.pyi')
+_JS_EXTENSIONS = ('.js', '.mjs', '.cjs', '.jsx', '.ts', '.tsx')
+_MAX_ASSIGNMENT_LENGTH = 120
+
+_JS_OUTLINE_RES = [
+    re.compile(r'^\s*import\s'),
+    re.compile(r'^\s*export\s'),
+    re.compile(r'^\s*(?:async\s+)?function\*?\s+[\w$]+\s*\('),
+    re.compile(r'^\s*(?:abstract\s+)?class\s+[\w$]+'),
+    re.compile(r'^\s*(?:interface|type|enum|declare)\s+[\w$]+'),
+    re.compile(r'^\s*(?:const|let|var)\s+[\w$]+\s*=\s*(?:async\s*)?(?:function\b|\([^)]*\)\s*=>|[\w$]+\s*=>)'),
+    # Class members: 'name(...) {', 'async name(...) {', 'static get name() {'
+    re.compile(r'^\s+(?:(?:public|private|protected|static|async|readonly|get|set)\s+)*#?[\w$]+\s*\([^)]*\)\s*(?::\s*[^{]+)?\{\s*$'),
+]
+_JS_CONTROL_KEYWORDS = re.compile(r'^\s*(?:if|for|while|switch|catch|with|return|else)\b')
+
+# Cached outlines: { (path, content_hash): outline_or_None }
+_outline_cache = {}
+_outline_cache_lock = threading.Lock()
+_OUTLINE_CACHE_MAX_ENTRIES = 50000
+
+def _outline_python_body(body):
+    """Returns a copy of a module/class body with function bodies replaced by their docstring and '...'."""
+    outlined = []
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            node = copy.copy(node)
+            docstring = ast.get_docstring(node, clean=False)
+            node.body = ([ast.Expr(ast.Constant(docstring))] if docstring else []) + [ast.Expr(ast.Constant(Ellipsis))]
+            outlined.append(node)
+        elif isinstance(node, ast.ClassDef):
+            node = copy.copy(node)
+            node.body = _outline_python_body(node.body) or [ast.Expr(ast.Constant(Ellipsis))]
+            outlined.append(node)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            outlined.append(node)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            if len(ast.unparse(node)) > _MAX_ASSIGNMENT_LENGTH:
+                node = copy.copy(node)
+                node.value = ast.Constant(Ellipsis)
+            outlined.append(node)
+        elif isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            outlined.append(node)  # Module and class docstrings.
+    return outlined
+
+def outline_python(content):
+    """Class and def signatures with docstrings, plus imports and short module-level assignments."""
+    try:
+        tree = ast.parse(content)
+    except (SyntaxError, ValueError):
+        return None
+    tree.body = _outline_python_body(tree.body)
+    return ast.unparse(tree)
+
+def outline_js(content):
+    """Imports, exported symbols, top-level functions/classes and class member signatures."""
+    lines = []
+    for line in content.split('\n'):
+        if _JS_CONTROL_KEYWORDS.match(line): continue
+        if any(pattern.match(line) for pattern in _JS_OUTLINE_RES):
+            stripped = line.rstrip()
+            if stripped.endswith('{'):
+                stripped = stripped[:-1].rstrip() + ' { ... }'
+            lines.append(stripped)
+    return "\n".join(lines)
+
+def get_outline(path, content):
+    """Returns the outline text for a supported file type, or None if the file cannot be outlined."""
+    key = (path, hashlib.sha1(content.encode('utf-8', errors='surrogateescape')).hexdigest())
+    with _outline_cache_lock:
+        if key in _outline_cache:
+            metrics.count('outline_cache_hits')
+            return _outline_cache[key]
+
+    if path.endswith(_PYTHON_EXTENSIONS):
+        outline, comment = outline_python(content), '#'
+    elif path.endswith(_JS_EXTENSIONS):
+        outline, comment = outline_js(content), '//'
+    else:
+        outline, comment = None, None
+
+    if outline is not None:
+        header = f"{comment} {OUTLINE_HEADER} bodies omitted ({len(content):,} chars in full). Ask for the full file before editing it.]"
+        outline = f"{header}\n{outline}"
+
+    with _outline_cache_lock:
+        if len(_outline_cache) >= _OUTLINE_CACHE_MAX_ENTRIES:
+            _outline_cache.clear()
+        _outline_cache[key] = outline
+    return outline
+
+def is_outline(content):
+    """True for text returned by get_outline(), which must never be emitted as a deployable 'cat >' block."""
+    first_line = content.split('\n', 1)[0]
+    return first_line.startswith(('# ' + OUTLINE_HEADER, '// ' + OUTLINE_HEADER))
+
+def should_outline(rel_path, content, threshold=DEFAULT_OUTLINE_THRESHOLD, outline_patterns=(), full_patterns=()):
+    """
+    Files matching full_patterns (e.g. the files being edited) are always sent in full.
+    Otherwise a file is outlined if it matches outline_patterns or is longer than 'threshold' chars.
+    """
+    filename = rel_path.rsplit('/', 1)[-1]
+    full_patterns = [p + '*' if p.endswith('/') else p for p in full_patterns]
+    outline_patterns = [p + '*' if p.endswith('/') else p for p in outline_patterns]
+    if any(fnmatch.fnmatch(rel_path, pat) or fnmatch.fnmatch(filename, pat) for pat in full_patterns):
+        return False
+    if any(fnmatch.fnmatch(rel_path, pat) or fnmatch.fnmatch(filename, pat) for pat in outline_patterns):
+        return True
+    return threshold is not None and len(content) > threshold
@@ -0,0 +1,99 @@
+import os
+
+_TERMINAL = object()  # Trie key holding the project base path for a complete prefix.
+
+class UnsafePathError(PermissionError):
+    """A script path that escapes its project or matches none. Never tolerated: it rejects the whole script."""
+
+class PathResolver:
+    """
+    Maps script paths ('./src/app.py', './1/src/app.py', './myproject/src/app.py') to absolute paths.
+    Built once per request: project prefixes go into a trie keyed by path segment, the
+    isdir/isfile/abspath work on the project paths is done once, and results are memoized per raw path.
+    """
+
+    def __init__(self, project_paths, use_numeric_prefixes=False):
+        self.project_paths = list(project_paths)
+        self.use_numeric_prefixes = use_numeric_prefixes
+        self._is_file = {p: os.path.isfile(p) for p in self.project_paths}
+        # Directory that confines paths resolved inside a project (a file project is confined to its folder).
+        self._safety_base = {
+            p: os.path.abspath(os.path.dirname(p) if self._is_file[p] else p) for p in self.project_paths
+        }
+        self._resolved = {}
+        self._safe = {}
+
+        self.prefixes = []
+        if len(self.project_paths) > 1:
+            if use_numeric_prefixes:
+                for i, p_path in enumerate(self.project_paths): self.prefixes.append((str(i), p_path))
+            else:
+                for p_path in self.project_paths:
+                    if self._is_file[p_path]: self.prefixes.append((f"{os.path.basename(os.path.dirname(p_path))}/{os.path.basename(p_path)}", p_path))
+                    elif os.path.isdir(p_path): self.prefixes.append((os.path.basename(p_path), p_path))
+            self.prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+
+        self._trie = {}
+        for prefix, base_path in self.prefixes:
+            node = self._trie
+            for segment in prefix.split('/'):
+                node = node.setdefault(segment, {})
+            node.setdefault(_TERMINAL, base_path)  # First project wins on duplicate names.
+
+    @property
+    def main_dir(self):
+        """Working directory for commands run 'in the project': the first project (or its folder)."""
+        main_path = self.project_paths[0]
+        return os.path.dirname(main_path) if self._is_file[main_path] else main_path
+
+    def has_duplicate_names(self):
+        """True if two projects would get the same name prefix (only possible without numeric prefixes)."""
+        names = [prefix for prefix, _ in self.prefixes]
+        return len(names) != len(set(names))
+
+    def resolve(self, raw_path):
+        """Returns (full_path, owning_project_path). Raises ValueError if no project matches."""
+        result = self._resolved.get(raw_path)
+        if result is None:
+            result = self._resolve_uncached(raw_path)
+            self._resolved[raw_path] = result
+        return result
+
+    def _resolve_uncached(self, raw_path):
+        path = raw_path[2:] if raw_path.startswith('./') else raw_path
+        if len(self.project_paths) == 1:
+            base_path = self.project_paths[0]
+            if self._is_file[base_path]:
+                if os.path.basename(base_path) == path: return base_path, base_path
+                else: raise ValueError(f"Script path mismatch.")
+            return os.path.join(base_path, path.replace('/', os.sep)), base_path
+
+        # Longest prefix that ends on a segment boundary.
+        segments = path.split('/')
+        node = self._trie
+        match = None
+        for depth, segment in enumerate(segments, 1):
+            node = node.get(segment)
+            if node is None: break
+            if _TERMINAL in node: match = (depth, node[_TERMINAL])
+        if match is None:
+            known_prefixes = [p[0] for p in self.prefixes]
+            raise ValueError(f"Could not find matching project for path '{raw_path}'. Prefixes: {known_prefixes}")
+
+        depth, base_path = match
+        if depth == len(segments): return base_path, base_path
+        if self._is_file[base_path]: raise ValueError(f"Cannot resolve path inside file.")
+        script_relative_path = '/'.join(segments[depth:])
+        return os.path.join(base_path, script_relative_path.replace('/', os.sep)), base_path
+
+    def resolve_safe(self, raw_path):
+        """Like resolve(), but returns only the full path and raises UnsafePathError if it escapes or matches no project."""
+        full_path = self._safe.get(raw_path)
+        if full_path is None:
+            try:
+                full_path, owning_project_path = self.resolve(raw_path)
+            except ValueError as e: raise UnsafePathError(str(e)) from e
+            if not os.path.abspath(full_path).startswith(self._safety_base[owning_project_path]):
+                raise UnsafePathError(f"Path traversal attempt detected: {raw_path}")
+            self._safe[raw_path] = full_path
+        return full_path
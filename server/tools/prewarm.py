@@ -0,0 +1,86 @@
+import os
+import threading
+from .job_queue import get_job_queue
+from .project_locks import project_read_lock, has_waiting_writer
+from .context_generator import get_project_prefixes
+from .context_pack import get_context_pack, get_pack_projects
+from .file_stats_index import get_stats_index
+from .large_files import get_max_file_size
+
+# The prewarm of the profile announced last; a new announcement cancels it.
+_current_job = None
+_current_job_lock = threading.Lock()
+
+class _WriterWaiting(Exception):
+    """A write to the project queued while the prewarm holds its read lock."""
+
+def _warm_caches(job, check_cancelled, project_paths, include_patterns, exclude_patterns, delimiter, use_numeric_prefixes, use_git, use_context_pack):
+    result = {'statsFiles': 0}
+    for p_path in project_paths:
+        check_cancelled()
+        index = get_stats_index(p_path, check_cancelled=check_cancelled)
+        result['statsFiles'] += len(index.paths)
+        job.log(f"Stats index: {len(index.paths)} files in {p_path}\n")
+
+    if not use_context_pack or not delimiter:
+        return result
+    all_prefixes = get_project_prefixes(project_paths, use_numeric_prefixes) if len(project_paths) > 1 else []
+    if len(all_prefixes) != len(set(all_prefixes)):
+        job.log("Context pack skipped: project paths result in the same name.\n")
+        return result
+    projects = get_pack_projects(project_paths, all_prefixes, include_patterns, exclude_patterns)
+    pack = get_context_pack(project_paths, projects, delimiter, use_git, max_file_size=get_max_file_size(), check_cancelled=check_cancelled)
+    pack.file.close()
+    job.log(f"Context pack: {pack.size} bytes, {pack.rebuilt_entries} files read\n")
+    result['packBytes'] = pack.size
+    result['packFilesRead'] = pack.rebuilt_entries
+    return result
+
+def _prewarm_job(job, project_paths, *args):
+    def check_cancelled():
+        job.check_cancelled()
+        # Waiting writers block new readers: a deploy must not wait for the rest of the prewarm, nor every /getcontext behind it.
+        if has_waiting_writer(project_paths):
+            raise _WriterWaiting()
+
+    while True:
+        try:
+            # The read lock /getcontext takes, so nothing is cached from a half-written tree.
+            with project_read_lock(project_paths):
+                return _warm_caches(job, check_cancelled, project_paths, *args)
+        except _WriterWaiting:
+            # Taking the read lock again waits until the write is done; the caches are then checked from the start.
+            job.log("Paused for a write to the project; starting over after it.\n")
+
+def start_prewarm(project_paths, include_patterns, exclude_patterns, delimiter=None, use_numeric_prefixes=False, use_git=None, use_context_pack=None):
+    """
+    Warms the caches the next /getcontext and Context Manager requests of a profile will use: the stats index
+    and, given the profile's delimiter, the context pack of its full context.
+    Cancels the prewarm started before (a pack build stops after the current file) and returns the new Job,
+    or None if a path is not a directory.
+    """
+    global _current_job
+    project_paths = [os.path.abspath(p) for p in project_paths]
+    if use_git is None:
+        use_git = os.getenv('JUSTCODE_USE_GIT_INDEX', 'false').lower() == 'true'
+    if use_context_pack is None:
+        use_context_pack = os.getenv('JUSTCODE_CONTEXT_PACK', 'true').lower() == 'true'
+
+    with _current_job_lock:
+        if _current_job is not None and not _current_job.finished:
+            _current_job.cancel()
+        _current_job = None
+        # Same condition as the pack path of /getcontext: every path must be a directory.
+        if not project_paths or not all(os.path.isdir(p) for p in project_paths):
+            return None
+        _current_job = get_job_queue().submit(
+            'prewarm', _prewarm_job, project_paths, include_patterns, exclude_patterns, delimiter, use_numeric_prefixes, use_git, use_context_pack,
+            description=', '.join(project_paths), project=project_paths[0]
+        )
+        return _current_job
+
+def cancel_prewarm():
+    """Cancels the running prewarm, if any."""
+    with _current_job_lock:
+        if _current_job is not None and not _current_job.finished:
+            _current_job.cancel()
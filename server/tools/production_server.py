@@ -0,0 +1,100 @@
+import queue
+import signal
+import threading
+import time
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+DEFAULT_WORKERS = 16
+DEFAULT_KEEPALIVE_TIMEOUT = 15
+DEFAULT_SHUTDOWN_TIMEOUT = 10
+
+class PooledRequestHandler(WSGIRequestHandler):
+    """
+    Request handler that keeps HTTP/1.1 connections alive for a limited idle time.
+    WebSocket upgrades (flask_sock '/ws') are long-lived, so their sockets have the idle timeout removed.
+    """
+    protocol_version = "HTTP/1.1"
+    timeout = DEFAULT_KEEPALIVE_TIMEOUT
+
+    def run_wsgi(self):
+        if self.headers.get('Upgrade', '').lower() == 'websocket':
+            self.connection.settimeout(None)
+        return super().run_wsgi()
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    A pure-Python WSGI server with a bounded pool of worker threads.
+    Unlike the development server it never spawns a thread per connection:
+    accepted connections are queued and handled by 'workers' long-lived threads.
+    Each open connection (including an idle keep-alive one or a WebSocket) occupies one worker.
+    """
+    multithread = True
+    multiprocess = False
+
+    def __init__(self, host, port, app, workers=DEFAULT_WORKERS, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT):
+        handler = type('ConfiguredRequestHandler', (PooledRequestHandler,), {'timeout': keepalive_timeout})
+        super().__init__(host, port, app, handler=handler)
+        self._connections = queue.Queue()
+        self._workers = []
+        for i in range(max(1, workers)):
+            worker = threading.Thread(target=self._worker_loop, name=f"justcode-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        self._connections.put((request, client_address))
+
+    def _worker_loop(self):
+        while True:
+            item = self._connections.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def drain(self, timeout=DEFAULT_SHUTDOWN_TIMEOUT):
+        """
+        Stops the workers after they finish the connections already accepted.
+        Returns False if some workers were still busy when the timeout expired.
+        """
+        for _ in self._workers:
+            self._connections.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        return not any(worker.is_alive() for worker in self._workers)
+
+def run_production_server(app, host, port, workers=DEFAULT_WORKERS, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT, shutdown_timeout=DEFAULT_SHUTDOWN_TIMEOUT, on_shutdown=None):
+    """
+    Serves the app until SIGINT/SIGTERM, then shuts down gracefully:
+    stops accepting connections, calls on_shutdown (e.g. to close WebSockets)
+    and waits up to shutdown_timeout seconds for in-flight requests to finish.
+    """
+    server = PooledWSGIServer(host, port, app, workers=workers, keepalive_timeout=keepalive_timeout)
+
+    def handle_signal(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so it must not run on the serving thread.
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, handle_signal)
+
+    print(f"JustCode: Production server listening on http://{host}:{port} ({workers} workers, keep-alive {keepalive_timeout}s)")
+    try:
+        server.serve_forever()
+    finally:
+        print("JustCode: Shutting down...")
+        server.server_close()
+        if on_shutdown:
+            try:
+                on_shutdown()
+            except Exception as e:
+                print(f"JustCode: Error during shutdown hook: {e}")
+        if not server.drain(shutdown_timeout):
+            print(f"JustCode: Some requests did not finish within {shutdown_timeout}s and were abandoned.")
@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+import functools
+from contextlib import contextmanager, ExitStack
+from . import metrics
+
+class ReadWriteLock:
+    """
+    Any number of readers or one writer. Waiting writers block new readers,
+    so a steady stream of context requests cannot starve a deploy.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._cond:
+            self._cond.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers: self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                self._cond.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @property
+    def has_waiting_writers(self):
+        with self._cond:
+            return bool(self._waiting_writers)
+
+# One lock per project path: { abspath: ReadWriteLock }
+_locks = {}
+_locks_guard = threading.Lock()
+# Called with the list of project paths after every write.
+_write_listeners = []
+# Number of completed writes per project path.
+_generations = {}
+
+def _normalize(project_paths):
+    if isinstance(project_paths, str): project_paths = [project_paths]
+    # Sorted, so that requests locking several projects always acquire them in the same order.
+    return sorted({os.path.abspath(p.strip()) for p in project_paths if p and p.strip()})
+
+def _get_lock(path):
+    with _locks_guard:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = ReadWriteLock()
+        return lock
+
+@contextmanager
+def project_read_lock(project_paths):
+    """Shared access to the given projects (e.g. building a context). Reads run in parallel."""
+    with ExitStack() as stack:
+        for path in _normalize(project_paths):
+            lock = _get_lock(path)
+            lock.acquire_read()
+            stack.callback(lock.release_read)
+        yield
+
+@contextmanager
+def project_write_lock(project_paths):
+    """
+    Exclusive access to the given projects and their history (deploy, undo, redo).
+    Registered write listeners are notified when the lock is released, so caches can be dropped.
+    """
+    paths = _normalize(project_paths)
+    with ExitStack() as stack:
+        for path in paths:
+            lock = _get_lock(path)
+            lock.acquire_write()
+            stack.callback(lock.release_write)
+        try:
+            yield
+        finally:
+            with _locks_guard:
+                for path in paths:
+                    _generations[path] = _generations.get(path, 0) + 1
+            for listener in list(_write_listeners):
+                try:
+                    listener(paths)
+                except Exception as e:
+                    print(f"Warning: cache invalidation after write failed: {e}")
+
+def has_waiting_writer(project_paths):
+    """
+    True if a write (deploy, undo, redo) is waiting for one of the projects. Long-running readers check it
+    between files and step aside, since the writer, and every reader after it, waits for them.
+    """
+    with _locks_guard:
+        locks = [_locks.get(path) for path in _normalize(project_paths)]
+    return any(lock is not None and lock.has_waiting_writers for lock in locks)
+
+def register_write_listener(listener):
+    """Registers listener(project_paths), called after every write to those projects."""
+    _write_listeners.append(listener)
+
+def get_project_generation(project_path):
+    """Number of writes made through project_write_lock(); a cheap cache key that changes on every deploy/undo/redo."""
+    with _locks_guard:
+        return _generations.get(os.path.abspath(project_path), 0)
+
+def locked_endpoint(write_methods=('POST',)):
+    """
+    Decorator for endpoints that take projects as 'path' query args: requests with a method in
+    write_methods hold the projects' write lock, all others a read lock.
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            from flask import request
+            project_paths = request.args.getlist('path')
+            lock = project_write_lock if request.method in write_methods else project_read_lock
+            with ExitStack() as stack:
+                started = time.perf_counter()
+                stack.enter_context(lock(project_paths))
+                metrics.record_stage('lock_wait', time.perf_counter() - started)
+                return endpoint(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -2,203 +2,294 @@ import os
 import re
 import shlex
 import stat
+import time
 from .utils import is_safe_path, here_doc_value
+from .search_replace import parse_search_replace_blocks, apply_search_replace
+from .snapshot import write_file, restore_file
+from .path_resolver import PathResolver, UnsafePathError
+from . import metrics
 
 def resolve_path(raw_path, project_paths, use_numeric_prefixes=False):
-    path = re.sub(r'^\./', '', raw_path)
-    if len(project_paths) == 1:
-        base_path = project_paths[0]
-        script_relative_path = path
-        if os.path.isfile(base_path):
-            if os.path.basename(base_path) == script_relative_path: return base_path, base_path
-            else: raise ValueError(f"Script path mismatch.")
-        full_path = os.path.join(base_path, script_relative_path.replace('/', os.sep))
-        return full_path, base_path
-
-    prefix_map = []
-    if use_numeric_prefixes:
-        for i, p_path in enumerate(project_paths): prefix_map.append((str(i), p_path))
-    else:
-        for p_path in project_paths:
-            if os.path.isdir(p_path): prefix_map.append((os.path.basename(p_path), p_path))
-            elif os.path.isfile(p_path): prefix_map.append((f"{os.path.basename(os.path.dirname(p_path))}/{os.path.basename(p_path)}", p_path))
-    prefix_map.sort(key=lambda item: len(item[0]), reverse=True)
-    
-    for prefix, base_path in prefix_map:
-        if path == prefix: return base_path, base_path
-        if path.startswith(prefix + '/'):
-            script_relative_path = path[len(prefix) + 1:]
-            if os.path.isfile(base_path): raise ValueError(f"Cannot resolve path inside file.")
-            full_path = os.path.join(base_path, script_relative_path.replace('/', os.sep))
-            return full_path, base_path
-    
-    known_prefixes = [p[0] for p in prefix_map]
-    raise ValueError(f"Could not find matching project for path '{raw_path}'. Prefixes: {known_prefixes}")
-
-
-def execute_script(script_content, project_paths, tolerate_errors=False, use_numeric_prefixes=False, add_empty_line=True, delimiter=None):
-    """Parses and executes a deployment script, returning logs and errors."""
-    
-    # Auto-detect delimiter if not provided (Crucial for Undo/Redo operations)
-    if delimiter is None:
-        # Look for the pattern: cat > path << 'DELIMITER'
-        # Matches quoted or unquoted paths
-        match = re.search(r"cat >\s+(?:'[^']+'|\"[^\"]+\"|[^\s]+)\s+<<\s+'([^']+)'", script_content)
-        if match:
-            delimiter = match.group(1)
-        else:
-            delimiter = here_doc_value
+    """One-off resolution. Code resolving many paths should build a PathResolver once and reuse it."""
+    return PathResolver(project_paths, use_numeric_prefixes).resolve(raw_path)
 
-    lines = script_content.replace('\r\n', '\n').split('\n')
-    i = 0
-    output_log = []
-    error_log = []
 
-    # Safe regex pattern for the delimiter
+class ScriptOperation:
+    """
+    One command of a script. kind is 'write' ('cat >'), 'patch', 'command' (mkdir, rm, mv, ...) or
+    'invalid' (a malformed or unterminated 'cat'/'patch'; 'error' holds what to report when it is run).
+    'body' holds the heredoc lines of 'write' and 'patch'.
+    """
+    __slots__ = ('line_num', 'original_line', 'line', 'kind', 'raw_path', 'body', 'error')
+
+    def __init__(self, line_num, original_line, kind, raw_path=None, body=None, error=None):
+        self.line_num = line_num
+        self.original_line = original_line
+        self.line = original_line.strip()
+        self.kind = kind
+        self.raw_path = raw_path
+        self.body = body
+        self.error = error
+
+def split_script_lines(script_content):
+    return script_content.replace('\r\n', '\n').split('\n')
+
+def iter_script_lines(text_stream):
+    """Lines of a script read from a text stream opened with newline='\\n', split like split_script_lines()."""
+    for raw_line in text_stream:
+        if raw_line.endswith('\n'):
+            raw_line = raw_line[:-2] if raw_line.endswith('\r\n') else raw_line[:-1]
+        yield raw_line
+
+def detect_delimiter(script_content):
+    """The heredoc delimiter a script uses (undo/redo scripts are stored without it), or the default."""
+    # Look for the pattern: cat > path << 'DELIMITER' (or: patch path << 'DELIMITER')
+    # Matches quoted or unquoted paths
+    match = re.search(r"(?:cat >|patch)\s+(?:'[^']+'|\"[^\"]+\"|[^\s]+)\s+<<\s+'([^']+)'", script_content)
+    return match.group(1) if match else here_doc_value
+
+def iter_script_operations(lines, delimiter=here_doc_value):
+    """
+    Parses script lines (any iterable; consumed lazily) into ScriptOperations. Each operation is yielded as
+    soon as its heredoc closes, so a script can be executed while the rest of it is still being read.
+    """
     delim_pattern = re.escape(delimiter)
-    
-    while i < len(lines):
-        line = lines[i].strip()
-        original_line_ref = lines[i]
-        line_num_for_error = i + 1
-        
-        try:
-            if not line or line.startswith('#'):
-                i += 1
+    numbered_lines = enumerate(lines, 1)
+    for line_num, original_line in numbered_lines:
+        line = original_line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        if line.startswith('cat >') or line.startswith('patch '):
+            command = 'cat' if line.startswith('cat >') else 'patch'
+            command_pattern = r"cat >" if command == 'cat' else r"patch"
+            match = re.match(command_pattern + r"\s+(?P<path>.*?)\s+<<\s+'" + delim_pattern + r"'", line)
+            if not match:
+                # Check for mismatch logic to provide helpful error
+                if re.search((r"cat >" if command == 'cat' else r"patch ") + r".*<<\s+'EO.*'", line):
+                    error = ValueError(f"Delimiter mismatch (Expected '{delimiter}'): {line}")
+                else:
+                    error = ValueError(f"Invalid '{command}' command format")
+                yield ScriptOperation(line_num, original_line, 'invalid', error=error)
                 continue
-            
-            if line.startswith('cat >'):
-                match = re.match(r"cat >\s+(?P<path>.*?)\s+<<\s+'" + delim_pattern + r"'", line)
-                
-                if not match:
-                    # Check for mismatch logic to provide helpful error
-                    if re.search(r"cat >.*<<\s+'EO.*'", line):
-                         raise ValueError(f"Delimiter mismatch (Expected '{delimiter}'): {line}")
-                    raise ValueError(f"Invalid 'cat' command format")
-                
-                raw_path_for_command = match.group('path').strip("'\"")
-                full_path, owning_project_path = resolve_path(raw_path_for_command, project_paths, use_numeric_prefixes)
-                
-                base_dir_for_safety = os.path.dirname(owning_project_path) if os.path.isfile(owning_project_path) else owning_project_path
-                if not os.path.abspath(full_path).startswith(os.path.abspath(base_dir_for_safety)):
-                    raise PermissionError(f"Path traversal attempt detected: {raw_path_for_command}")
-                
-                content_lines = []
-                heredoc_found = False
-                
-                content_start_index = i + 1
-                temp_i = content_start_index
-                while temp_i < len(lines):
-                    if lines[temp_i].startswith(delimiter):
-                        heredoc_found = True
-                        content_lines = lines[content_start_index:temp_i]
-                        i = temp_i + 1
-                        break
-                    temp_i += 1
-                
-                if not heredoc_found:
-                    i += 1
-                    raise ValueError(f"Unterminated heredoc for file '{raw_path_for_command}'")
-                
-                file_content = "\n".join(content_lines)
-                if add_empty_line:
-                    file_content += "\n"
-                
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                with open(full_path, 'w', encoding='utf-8') as f: f.write(file_content)
-                output_log.append(f"Wrote file: {raw_path_for_command}")
+
+            raw_path = match.group('path').strip("'\"")
+            body = []
+            heredoc_found = False
+            for _, body_line in numbered_lines:
+                if body_line.startswith(delimiter):
+                    heredoc_found = True
+                    break
+                body.append(body_line)
+            if not heredoc_found:
+                target = f"file '{raw_path}'" if command == 'cat' else f"patch '{raw_path}'"
+                yield ScriptOperation(line_num, original_line, 'invalid', raw_path, error=ValueError(f"Unterminated heredoc for {target}"))
                 continue
-            
+            yield ScriptOperation(line_num, original_line, 'write' if command == 'cat' else 'patch', raw_path, body)
+            continue
+
+        yield ScriptOperation(line_num, original_line, 'command')
+
+def _touched_paths(op, resolver):
+    """Full paths a 'command' operation may touch (directories cover everything below them), or None if unknown."""
+    try:
+        parts = shlex.split(op.line)
+        return [resolver.resolve_safe(arg) for arg in parts[1:] if not arg.startswith('-')]
+    except (ValueError, OSError):
+        return None
+
+def coalesce_writes(operations, resolver):
+    """
+    Drops the 'write' and 'patch' operations whose result a later 'write' of the same file replaces before
+    any command touches that file, so only the final content is written. Dropped operations are never run,
+    so they report no errors either. Returns (kept operations in order, number dropped).
+    """
+    operations = list(operations)
+    dropped = set()
+    superseded = {}  # full_path -> indexes of the writes/patches since the file was last touched otherwise
+    for i, op in enumerate(operations):
+        if op.kind in ('write', 'patch'):
             try:
-                parts = shlex.split(line)
-            except ValueError as e: raise ValueError(f"Invalid command format: {line}") from e
-            
-            if not parts:
-                i += 1
+                full_path = resolver.resolve_safe(op.raw_path)
+            except (ValueError, OSError):
+                continue  # Fails when run; left as it is.
+            if op.kind == 'write':
+                dropped.update(superseded.get(full_path, ()))
+                superseded[full_path] = [i]
+            else:
+                superseded.setdefault(full_path, []).append(i)
+        elif op.kind == 'command':
+            touched = _touched_paths(op, resolver)
+            if touched is None:
+                superseded.clear()
                 continue
-            
-            command, args = parts[0], parts[1:]
-
-            def check_safety_for_arg(arg):
-                full_path, owning_project_path = resolve_path(arg, project_paths, use_numeric_prefixes)
-                base_dir = os.path.dirname(owning_project_path) if os.path.isfile(owning_project_path) else owning_project_path
-                if not os.path.abspath(full_path).startswith(os.path.abspath(base_dir)):
-                    raise PermissionError(f"Path traversal attempt detected: {arg}")
-                return full_path
-            
-            if command == 'mkdir':
-                use_p_flag = '-p' in args
-                paths_to_create = [arg for arg in args if arg != '-p']
-                for arg in paths_to_create:
-                    full_path = check_safety_for_arg(arg)
-                    if use_p_flag:
-                        os.makedirs(full_path, exist_ok=True)
-                        output_log.append(f"Created directory (with -p): {arg}")
-                    else:
-                        os.mkdir(full_path)
-                        output_log.append(f"Created directory: {arg}")
-            elif command == 'rm':
-                use_f_flag = '-f' in args
-                file_paths = [p for p in args if not p.startswith('-')]
-                if any(p.startswith('-') and p != '-f' for p in args): raise ValueError("Unsupported flag for rm")
-                for path in file_paths:
-                    full_path = check_safety_for_arg(path)
-                    try:
-                        if os.path.isdir(full_path): raise IsADirectoryError(f"Cannot 'rm' a directory: {path}")
-                        os.remove(full_path)
-                        output_log.append(f"Removed file: {path}")
-                    except FileNotFoundError:
-                        if use_f_flag or tolerate_errors: output_log.append(f"Skipped removal (not found): {path}")
-                        else: raise
-            elif command == 'rmdir':
-                 for arg in args:
-                    full_path = check_safety_for_arg(arg)
-                    try:
-                        os.rmdir(full_path)
-                        output_log.append(f"Removed directory: {arg}")
-                    except OSError as e:
-                        if tolerate_errors: output_log.append(f"Skipped rmdir for '{arg}', ignoring error: {e}")
-                        else: raise OSError(f"Could not rmdir '{arg}': {e}") from e
-            elif command == 'mv':
-                if len(args) != 2: raise ValueError("'mv' requires two arguments.")
-                full_src = check_safety_for_arg(args[0])
-                full_dest = check_safety_for_arg(args[1])
-                os.makedirs(os.path.dirname(full_dest), exist_ok=True)
-                os.rename(full_src, full_dest)
-                output_log.append(f"Moved: {args[0]} to {args[1]}")
-            elif command == 'touch':
-                for arg in args:
-                    full_path = check_safety_for_arg(arg)
-                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                    with open(full_path, 'a'): os.utime(full_path, None)
-                    output_log.append(f"Touched file: {arg}")
-            elif command == 'chmod':
-                if len(args) < 2: raise ValueError("'chmod' requires a mode and at least one file.")
-                mode_str, file_paths = args[0], args[1:]
-                for relative_path_arg in file_paths:
-                    full_path = check_safety_for_arg(relative_path_arg)
-                    if not os.path.exists(full_path): raise FileNotFoundError(f"chmod: cannot access '{relative_path_arg}': No such file or directory")
-                    new_mode = 0
-                    if mode_str.isdigit(): new_mode = int(mode_str, 8)
-                    else:
-                        current_mode = os.stat(full_path).st_mode
-                        if mode_str == '+x': new_mode = current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
-                        else: raise ValueError(f"Unsupported chmod mode: '{mode_str}'. Only octal and '+x' are supported.")
-                    os.chmod(full_path, new_mode)
-                    output_log.append(f"Changed mode of {relative_path_arg} to {mode_str}")
+            for full_path in list(superseded):
+                if any(full_path == t or full_path.startswith(t.rstrip(os.sep) + os.sep) for t in touched):
+                    del superseded[full_path]
+    return [op for i, op in enumerate(operations) if i not in dropped], len(dropped)
+
+def execute_operation(op, resolver, output_log, tolerate_errors=False, add_empty_line=True, snapshot_dir=None):
+    """Runs one ScriptOperation, appending to output_log. Raises on failure (tolerated skips are logged instead)."""
+    if op.kind == 'invalid':
+        raise op.error
+
+    if op.kind == 'write':
+        full_path = resolver.resolve_safe(op.raw_path)
+        file_content = "\n".join(op.body)
+        if add_empty_line:
+            file_content += "\n"
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        write_file(full_path, file_content)
+        output_log.append(f"Wrote file: {op.raw_path}")
+        return
+
+    if op.kind == 'patch':
+        full_path = resolver.resolve_safe(op.raw_path)
+        blocks = parse_search_replace_blocks(op.body)
+        if os.path.isfile(full_path):
+            with open(full_path, 'r', encoding='utf-8', newline='') as f: original_content = f.read()
+        elif all(not any(l.strip() for l in search) for search, _ in blocks):
+            original_content = ''  # Only empty SEARCH sections: creates the file.
+        else:
+            raise FileNotFoundError(f"Cannot patch missing file: {op.raw_path}")
+
+        # Match against LF line endings, then write back with the file's original line endings.
+        uses_crlf = '\r\n' in original_content
+        new_content = apply_search_replace(original_content.replace('\r\n', '\n'), blocks)
+        if uses_crlf:
+            new_content = new_content.replace('\n', '\r\n')
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        write_file(full_path, new_content, newline='')
+        output_log.append(f"Patched file: {op.raw_path} ({len(blocks)} block(s))")
+        return
+
+    try:
+        parts = shlex.split(op.line)
+    except ValueError as e: raise ValueError(f"Invalid command format: {op.line}") from e
+    if not parts:
+        return
+
+    command, args = parts[0], parts[1:]
+    check_safety_for_arg = resolver.resolve_safe
+
+    if command == 'mkdir':
+        use_p_flag = '-p' in args
+        paths_to_create = [arg for arg in args if arg != '-p']
+        for arg in paths_to_create:
+            full_path = check_safety_for_arg(arg)
+            if use_p_flag:
+                os.makedirs(full_path, exist_ok=True)
+                output_log.append(f"Created directory (with -p): {arg}")
+            else:
+                os.mkdir(full_path)
+                output_log.append(f"Created directory: {arg}")
+    elif command == 'rm':
+        use_f_flag = '-f' in args
+        file_paths = [p for p in args if not p.startswith('-')]
+        if any(p.startswith('-') and p != '-f' for p in args): raise ValueError("Unsupported flag for rm")
+        for path in file_paths:
+            full_path = check_safety_for_arg(path)
+            try:
+                if os.path.isdir(full_path): raise IsADirectoryError(f"Cannot 'rm' a directory: {path}")
+                os.remove(full_path)
+                output_log.append(f"Removed file: {path}")
+            except FileNotFoundError:
+                if use_f_flag or tolerate_errors: output_log.append(f"Skipped removal (not found): {path}")
+                else: raise
+    elif command == 'rmdir':
+         for arg in args:
+            full_path = check_safety_for_arg(arg)
+            try:
+                os.rmdir(full_path)
+                output_log.append(f"Removed directory: {arg}")
+            except OSError as e:
+                if tolerate_errors: output_log.append(f"Skipped rmdir for '{arg}', ignoring error: {e}")
+                else: raise OSError(f"Could not rmdir '{arg}': {e}") from e
+    elif command == 'mv':
+        if len(args) != 2: raise ValueError("'mv' requires two arguments.")
+        full_src = check_safety_for_arg(args[0])
+        full_dest = check_safety_for_arg(args[1])
+        os.makedirs(os.path.dirname(full_dest), exist_ok=True)
+        os.rename(full_src, full_dest)
+        output_log.append(f"Moved: {args[0]} to {args[1]}")
+    elif command == 'touch':
+        for arg in args:
+            full_path = check_safety_for_arg(arg)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'a'): os.utime(full_path, None)
+            output_log.append(f"Touched file: {arg}")
+    elif command == 'chmod':
+        if len(args) < 2: raise ValueError("'chmod' requires a mode and at least one file.")
+        mode_str, file_paths = args[0], args[1:]
+        for relative_path_arg in file_paths:
+            full_path = check_safety_for_arg(relative_path_arg)
+            if not os.path.exists(full_path): raise FileNotFoundError(f"chmod: cannot access '{relative_path_arg}': No such file or directory")
+            new_mode = 0
+            if mode_str.isdigit(): new_mode = int(mode_str, 8)
             else:
-                raise ValueError(f"Unsupported command: '{command}'")
-            
-            i += 1
+                current_mode = os.stat(full_path).st_mode
+                if mode_str == '+x': new_mode = current_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+                else: raise ValueError(f"Unsupported chmod mode: '{mode_str}'. Only octal and '+x' are supported.")
+            os.chmod(full_path, new_mode)
+            output_log.append(f"Changed mode of {relative_path_arg} to {mode_str}")
+    elif command == 'restore' and snapshot_dir:
+        if len(args) != 2: raise ValueError("'restore' requires a snapshot name and a path.")
+        snapshot_name, target = args
+        if os.path.basename(snapshot_name) != snapshot_name or snapshot_name in ('.', '..'):
+            raise PermissionError(f"Invalid snapshot name: {snapshot_name}")
+        snapshot_path = os.path.join(snapshot_dir, snapshot_name)
+        if not os.path.isfile(snapshot_path): raise FileNotFoundError(f"Snapshot '{snapshot_name}' is missing for: {target}")
+        full_path = check_safety_for_arg(target)
+        restore_file(snapshot_path, full_path)
+        output_log.append(f"Restored file: {target}")
+    else:
+        raise ValueError(f"Unsupported command: '{command}'")
 
+def run_operations(operations, resolver, tolerate_errors=False, add_empty_line=True, snapshot_dir=None, before_execute=None, error_prefix=""):
+    """
+    Executes ScriptOperations in order and returns (output_log, error_log).
+    before_execute(op), if given, runs right before each operation (e.g. to capture its rollback); if it
+    raises, the operation is not executed and fails like any other error.
+    error_prefix is put in front of error messages (e.g. which script of a batch failed).
+    A path outside the projects (UnsafePathError) is raised even when errors are tolerated.
+    """
+    started = time.perf_counter()
+    hook_time = 0.0
+    output_log = []
+    error_log = []
+    for op in operations:
+        try:
+            if before_execute is not None:
+                hook_started = time.perf_counter()
+                try:
+                    before_execute(op)
+                finally:
+                    hook_time += time.perf_counter() - hook_started
+            execute_operation(op, resolver, output_log, tolerate_errors, add_empty_line, snapshot_dir)
         except Exception as e:
-            error_message = f"Error on line {line_num_for_error}: '{original_line_ref}'\n  -> {str(e)}"
-            if tolerate_errors:
+            error_message = f"{error_prefix}Error on line {op.line_num}: '{op.original_line}'\n  -> {str(e)}"
+            if tolerate_errors and not isinstance(e, UnsafePathError):
                 error_log.append(error_message)
                 print(f"Warning (Tolerated): {error_message}")
-                if i < line_num_for_error:
-                    i = line_num_for_error
             else:
                 raise type(e)(error_message) from e
 
-    return output_log, error_log
\ No newline at end of file
+    metrics.record_stage('execute_script', time.perf_counter() - started - hook_time)
+    metrics.count('script_actions', len(output_log))
+    metrics.count('script_errors', len(error_log))
+    return output_log, error_log
+
+def execute_script(script_content, project_paths, tolerate_errors=False, use_numeric_prefixes=False, add_empty_line=True, delimiter=None, snapshot_dir=None, resolver=None):
+    """
+    Parses and executes a deployment script, returning logs and errors.
+    snapshot_dir enables the 'restore <snapshot> <path>' command used by undo scripts; it is never set for deploy scripts.
+    resolver: a PathResolver for project_paths, to share one across the request (built here if omitted).
+    """
+    if resolver is None:
+        resolver = PathResolver(project_paths, use_numeric_prefixes)
+    # Auto-detect delimiter if not provided (Crucial for Undo/Redo operations)
+    if delimiter is None:
+        delimiter = detect_delimiter(script_content)
+    operations = iter_script_operations(split_script_lines(script_content), delimiter)
+    return run_operations(operations, resolver, tolerate_errors, add_empty_line, snapshot_dir)
@@ -0,0 +1,105 @@
+SEARCH_MARKER = '<<<<<<< SEARCH'
+DIVIDER_MARKER = '======='
+REPLACE_MARKER = '>>>>>>> REPLACE'
+
+def parse_search_replace_blocks(lines):
+    """
+    Parses the body of a 'patch' heredoc into a list of (search_lines, replace_lines) blocks:
+
+        <<<<<<< SEARCH
+        lines to find
+        =======
+        lines to put instead
+        >>>>>>> REPLACE
+    """
+    blocks = []
+    i = 0
+    while i < len(lines):
+        if lines[i].strip() == '':
+            i += 1
+            continue
+        if lines[i].rstrip() != SEARCH_MARKER:
+            raise ValueError(f"Expected '{SEARCH_MARKER}' in patch, got: {lines[i]}")
+        i += 1
+        search_lines = []
+        while i < len(lines) and lines[i].rstrip() != DIVIDER_MARKER:
+            search_lines.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise ValueError(f"Missing '{DIVIDER_MARKER}' in patch block.")
+        i += 1
+        replace_lines = []
+        while i < len(lines) and lines[i].rstrip() != REPLACE_MARKER:
+            replace_lines.append(lines[i])
+            i += 1
+        if i >= len(lines):
+            raise ValueError(f"Missing '{REPLACE_MARKER}' in patch block.")
+        i += 1
+        blocks.append((search_lines, replace_lines))
+    if not blocks:
+        raise ValueError("Patch contains no SEARCH/REPLACE blocks.")
+    return blocks
+
+def _leading_whitespace(line):
+    return line[:len(line) - len(line.lstrip())]
+
+def _find_line_matches(file_lines, search_lines, normalize):
+    normalized_search = [normalize(l) for l in search_lines]
+    normalized_file = [normalize(l) for l in file_lines]
+    n = len(search_lines)
+    return [start for start in range(len(file_lines) - n + 1) if normalized_file[start:start + n] == normalized_search]
+
+def _reindent(replace_lines, search_lines, matched_lines):
+    """Shifts the replacement by the indentation difference between the SEARCH text and the matched file text."""
+    for search_line, matched_line in zip(search_lines, matched_lines):
+        if search_line.strip():
+            search_indent = _leading_whitespace(search_line)
+            file_indent = _leading_whitespace(matched_line)
+            break
+    else:
+        return replace_lines
+
+    if file_indent.endswith(search_indent):
+        extra = file_indent[:len(file_indent) - len(search_indent)]
+        return [extra + l if l.strip() else l for l in replace_lines]
+    if search_indent.endswith(file_indent):
+        surplus = search_indent[:len(search_indent) - len(file_indent)]
+        return [l[len(surplus):] if l.startswith(surplus) else l for l in replace_lines]
+    return replace_lines
+
+def apply_search_replace(content, blocks):
+    """
+    Applies SEARCH/REPLACE blocks to file content, in order.
+    Each SEARCH must match exactly one run of whole lines. Matching is tried exactly first, then ignoring
+    trailing whitespace, then ignoring indentation (the replacement is re-indented to fit).
+    An empty SEARCH appends the replacement to the end of the file.
+    Raises ValueError if a block matches nowhere or more than once.
+    """
+    for block_num, (search_lines, replace_lines) in enumerate(blocks, 1):
+        if not any(l.strip() for l in search_lines):
+            if content and not content.endswith('\n'):
+                content += '\n'
+            content += '\n'.join(replace_lines) + '\n'
+            continue
+
+        has_trailing_newline = content.endswith('\n')
+        file_lines = content.split('\n')
+        if has_trailing_newline:
+            file_lines = file_lines[:-1]
+
+        # Every tier matches whole lines only, so a SEARCH line never matches part of a longer file line.
+        for normalize, reindent in ((lambda l: l, False), (lambda l: l.rstrip(), False), (lambda l: l.strip(), True)):
+            matches = _find_line_matches(file_lines, search_lines, normalize)
+            if len(matches) > 1:
+                raise ValueError(f"Patch block {block_num}: SEARCH text matches {len(matches)} places; add more context lines.")
+            if len(matches) == 1:
+                start = matches[0]
+                end = start + len(search_lines)
+                new_lines = _reindent(replace_lines, search_lines, file_lines[start:end]) if reindent else replace_lines
+                file_lines[start:end] = new_lines
+                content = '\n'.join(file_lines) + ('\n' if has_trailing_newline else '')
+                break
+        else:
+            preview = next((l.strip() for l in search_lines if l.strip()), '')
+            raise ValueError(f"Patch block {block_num}: SEARCH text not found (starting with '{preview[:80]}').")
+    return content
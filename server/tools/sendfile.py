@@ -0,0 +1,57 @@
+import ssl
+
+# Chunk size when a file response has to be iterated (compressed, TLS, test client, ...).
+FILE_CHUNK_SIZE = 1024 * 1024
+
+class FileWrapper:
+    """wsgi.file_wrapper for servers without one (the werkzeug servers): iterates a file in large chunks."""
+
+    def __init__(self, file, block_size=FILE_CHUNK_SIZE):
+        self.file = file
+        self.block_size = max(block_size, FILE_CHUNK_SIZE)
+
+    def __iter__(self):
+        while True:
+            data = self.file.read(self.block_size)
+            if not data:
+                return
+            yield data
+
+    def close(self):
+        self.file.close()
+
+class SendfileMiddleware:
+    """
+    Sends file responses (flask.send_file) with socket.sendfile(), straight from the page cache to the client,
+    when the app runs on a werkzeug server. Only untouched responses qualify: a plain socket, a Content-Length,
+    and no Content-Encoding (a compressed body is no longer a FileWrapper and is iterated as usual).
+    WSGI servers with their own wsgi.file_wrapper (gunicorn, uWSGI, ...) keep theirs.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        environ.setdefault('wsgi.file_wrapper', FileWrapper)
+        started = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            started['headers'] = headers
+            started['write'] = start_response(status, headers, exc_info)
+            return started['write']
+
+        app_iter = self.app(environ, capture_start_response)
+        sock = environ.get('werkzeug.socket')
+        if not isinstance(app_iter, FileWrapper) or sock is None or isinstance(sock, ssl.SSLSocket) or 'write' not in started:
+            return app_iter
+        headers = {key.lower(): value for key, value in started['headers']}
+        if 'content-length' not in headers or 'content-encoding' in headers or 'transfer-encoding' in headers:
+            return app_iter
+
+        try:
+            # An empty write makes the server send the status line and headers; the body follows on the raw socket.
+            started['write'](b"")
+            sock.sendfile(app_iter.file, 0, int(headers['content-length']))
+        finally:
+            app_iter.close()
+        return []
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl request number of FICLONE (_IOW(0x94, 9, int)) on Linux.
+FICLONE = 0x40049409
+
+def _reflink(src, dest):
+    """Clones src into dest (which must not exist) sharing data blocks. Raises OSError if unsupported."""
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, 'rb') as src_f, open(dest, 'xb') as dest_f:
+        try:
+            fcntl.ioctl(dest_f.fileno(), FICLONE, src_f.fileno())
+        except OSError:
+            dest_f.close()
+            os.remove(dest)
+            raise
+    shutil.copymode(src, dest)
+
+def snapshot_file(src, dest):
+    """
+    Takes a byte-exact snapshot of 'src' at 'dest': a reflink (copy-on-write clone, e.g. btrfs/XFS)
+    where the filesystem supports it, else a plain copy. Returns the method used: 'reflink' or 'copy'.
+    Never a hardlink: the snapshot must not change when the project file is later written in place.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    try:
+        _reflink(src, dest)
+        return 'reflink'
+    except OSError: pass
+    shutil.copy2(src, dest)
+    return 'copy'
+
+def _temp_path_next_to(path):
+    fd, temp_path = tempfile.mkstemp(prefix='.justcode-', suffix='.tmp', dir=os.path.dirname(path) or '.')
+    os.close(fd)
+    return temp_path
+
+def restore_file(snapshot_path, dest):
+    """
+    Restores a snapshot over 'dest' with an atomic rename. The snapshot itself is kept
+    (the file is reflinked or copied next to 'dest' first), so the same history entry can be undone again after a redo.
+    """
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    temp_path = _temp_path_next_to(dest)
+    try:
+        os.remove(temp_path)
+        try:
+            _reflink(snapshot_path, temp_path)
+        except OSError:
+            shutil.copy2(snapshot_path, temp_path)
+        os.replace(temp_path, dest)
+    except BaseException:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        raise
+
+def write_file(path, content, newline=None):
+    """Writes text to 'path' in place, so its inode, owner, links and extended attributes are kept."""
+    with open(path, 'w', encoding='utf-8', newline=newline) as f: f.write(content)
@@ -0,0 +1,144 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from . import metrics
+from .large_files import read_text_file
+
+# Heuristic approximating a byte-pair tokenizer (cl100k-style) using only C-level regex scans:
+# every word is at least one token and long words split roughly every 7 letters,
+# numbers split into groups of up to 3 digits, every other symbol is its own token
+# and runs of whitespace (indentation, blank lines) collapse into one token each.
+_WORD_RE = re.compile(r'[A-Za-z]+')
+_LONG_WORD_PART_RE = re.compile(r'[A-Za-z]{7}')
+_NUMBER_RE = re.compile(r'\d{1,3}')
+_SYMBOL_RE = re.compile(r'[^\sA-Za-z\d]')
+_WHITESPACE_RUN_RE = re.compile(r'\s{2,}')
+
+def estimate_tokens_heuristic(text):
+    """Fast, dependency-free token estimate for a string."""
+    if not text:
+        return 0
+    return (
+        len(_WORD_RE.findall(text))
+        + len(_LONG_WORD_PART_RE.findall(text))
+        + len(_NUMBER_RE.findall(text))
+        + len(_SYMBOL_RE.findall(text))
+        + len(_WHITESPACE_RUN_RE.findall(text))
+    )
+
+# Where tiktoken downloads the vocabulary of an encoding from (and the name of its cached copy).
+_TIKTOKEN_BLOB_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+def _is_tiktoken_vocabulary_cached(encoding_name):
+    """True if tiktoken can load the encoding from its local cache, without a download (same lookup as tiktoken.load)."""
+    cache_dir = os.environ.get('TIKTOKEN_CACHE_DIR', os.environ.get('DATA_GYM_CACHE_DIR'))
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'data-gym-cache')
+    if not cache_dir:
+        return False  # Caching disabled: every load downloads.
+    cache_key = hashlib.sha1(_TIKTOKEN_BLOB_URL.format(encoding_name).encode()).hexdigest()
+    return os.path.isfile(os.path.join(cache_dir, cache_key))
+
+def _make_tiktoken_estimator(local_only=False):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    encoding_name = os.getenv('JUSTCODE_TIKTOKEN_ENCODING', 'cl100k_base')
+    # tiktoken downloads its vocabulary on first use; 'auto' only uses a vocabulary that is already on disk.
+    if local_only and not _is_tiktoken_vocabulary_cached(encoding_name):
+        return None
+    try:
+        encoding = tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        print(f"Warning: tiktoken is installed but its encoding could not be loaded: {e}")
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+# Registered estimators: { name: callable(text) -> int }
+_estimators = {'heuristic': estimate_tokens_heuristic}
+_estimators_lock = threading.Lock()
+_optional_estimator_factories = {'tiktoken': _make_tiktoken_estimator}
+# One per optional estimator: loading one (maybe a download) never holds _estimators_lock.
+_optional_estimator_locks = {name: threading.Lock() for name in _optional_estimator_factories}
+# (name, local_only) of optional estimators that failed to load, so they are not retried on every request.
+_unavailable_estimators = set()
+
+def register_estimator(name, estimate_fn):
+    """Registers a custom token estimator (callable taking a string and returning an int)."""
+    with _estimators_lock:
+        _estimators[name] = estimate_fn
+
+def _load_optional_estimator(name, local_only):
+    with _optional_estimator_locks[name]:
+        with _estimators_lock:
+            if name in _estimators:
+                return _estimators[name]
+            if (name, local_only) in _unavailable_estimators:
+                return None
+        estimate_fn = _optional_estimator_factories[name](local_only)
+        with _estimators_lock:
+            if estimate_fn is None:
+                _unavailable_estimators.add((name, local_only))
+            else:
+                _estimators[name] = estimate_fn
+        return estimate_fn
+
+def get_estimator(name=None):
+    """
+    Returns (name, estimate_fn) for the requested estimator.
+    'auto' (the default, or JUSTCODE_TOKENIZER) uses an exact tokenizer when one is installed with its
+    vocabulary on disk (it never downloads one) and falls back to the heuristic otherwise.
+    """
+    if name is None:
+        name = os.getenv('JUSTCODE_TOKENIZER', 'auto').lower()
+
+    local_only = name == 'auto'
+    candidates = list(_optional_estimator_factories) + ['heuristic'] if local_only else [name]
+    for candidate in candidates:
+        with _estimators_lock:
+            estimate_fn = _estimators.get(candidate)
+        if estimate_fn is None and candidate in _optional_estimator_factories:
+            estimate_fn = _load_optional_estimator(candidate, local_only)
+        if estimate_fn is not None:
+            return candidate, estimate_fn
+    raise ValueError(f"Unknown or unavailable tokenizer: '{name}'")
+
+# Per-file cache: { (abs_path, size, mtime_ns, estimator_name, max_file_size): token_count }
+_file_token_cache = {}
+_file_token_cache_lock = threading.Lock()
+_FILE_TOKEN_CACHE_MAX_ENTRIES = 200000
+
+def count_file_tokens(file_path, content=None, estimator=None, max_file_size=0):
+    """
+    Returns the token count of a text file, cached by its (size, mtime) fingerprint.
+    If the caller has already read the file, passing 'content' avoids reading it again.
+    Files over max_file_size are counted as their head/tail excerpt (see large_files.py).
+    """
+    name, estimate_fn = estimator or get_estimator()
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return estimate_fn(content) if content is not None else 0
+
+    key = (os.path.abspath(file_path), st.st_size, st.st_mtime_ns, name, max_file_size)
+    with _file_token_cache_lock:
+        cached = _file_token_cache.get(key)
+    if cached is not None:
+        metrics.count('token_cache_hits')
+        return cached
+
+    if content is None:
+        try:
+            content, _, _ = read_text_file(file_path, max_file_size)
+        except OSError:
+            return 0
+    tokens = estimate_fn(content)
+
+    with _file_token_cache_lock:
+        if len(_file_token_cache) >= _FILE_TOKEN_CACHE_MAX_ENTRIES:
+            _file_token_cache.clear()
+        _file_token_cache[key] = tokens
+    return tokens
@@ -2,9 +2,12 @@ import os
 import traceback
 import shutil
 from flask import request, Response
-from .tools.history_manager import get_sorted_stack_timestamps, get_history_dir
+from .tools.history_manager import get_sorted_stack_timestamps, get_history_dir, get_snapshot_dir
 from .tools.script_executor import execute_script
+from .tools.path_resolver import PathResolver
+from .tools.project_locks import locked_endpoint
 
+@locked_endpoint()
 def undo(): # This is the UNDO action
     paths = request.args.getlist('path')
     if not paths or not any(p.strip() for p in paths):
@@ -24,13 +27,9 @@ def undo(): # This is the UNDO action
         use_numeric_prefixes = request.args.get('useNumericPrefixes', 'false').lower() == 'true'
         add_empty_line = request.args.get('addEmptyLine', 'true').lower() == 'true'
 
-        if not use_numeric_prefixes and len(project_paths) > 1:
-            names_to_check = []
-            for p in project_paths:
-                if os.path.isdir(p): names_to_check.append(os.path.basename(p))
-                elif os.path.isfile(p): names_to_check.append(f"{os.path.basename(os.path.dirname(p))}/{os.path.basename(p)}")
-            if len(names_to_check) != len(set(names_to_check)):
-                return Response("Error: Multiple project paths have the same name. Please enable 'Name by order number' in profile settings.", status=400)
+        resolver = PathResolver(project_paths, use_numeric_prefixes)
+        if resolver.has_duplicate_names():
+            return Response("Error: Multiple project paths have the same name. Please enable 'Name by order number' in profile settings.", status=400)
 
         all_undo_timestamps = get_sorted_stack_timestamps(project_paths, 'undo')
         if not all_undo_timestamps:
@@ -51,7 +50,7 @@ def undo(): # This is the UNDO action
             script_content = f.read()
         
         try:
-            output_log, error_log = execute_script(script_content, project_paths, tolerate_errors, use_numeric_prefixes, add_empty_line)
+            output_log, error_log = execute_script(script_content, project_paths, tolerate_errors, use_numeric_prefixes, add_empty_line, resolver=resolver, snapshot_dir=get_snapshot_dir(project_paths, latest_timestamp))
             
             # Move the script pair to the redo stack
             shutil.move(undo_script_path, os.path.join(redo_stack_dir, f"{latest_timestamp}.sh"))
@@ -0,0 +1,28 @@
+import pytest
+from server.tools import utils, history_manager, context_manifest, context_pack
+from server.tools.path_resolver import PathResolver
+
+@pytest.fixture(autouse=True)
+def justcode_root(tmp_path, monkeypatch):
+    """Keeps history, snapshots, manifests and packs out of the repository's own .justcode/."""
+    root = tmp_path / "justcode_root"
+    root.mkdir()
+    for module in (utils, history_manager, context_manifest, context_pack):
+        monkeypatch.setattr(module, 'get_justcode_root', lambda: str(root))
+    return root
+
+@pytest.fixture
+def project(tmp_path):
+    path = tmp_path / "project"
+    path.mkdir()
+    return path
+
+@pytest.fixture
+def resolver(project):
+    return PathResolver([str(project)])
+
+@pytest.fixture
+def client():
+    """Test client of the server app, with every endpoint routed as in production."""
+    from app import app
+    return app.test_client()
@@ -0,0 +1,33 @@
+import os
+from server.tools.history_manager import get_history_dir, get_snapshot_dir, get_sorted_stack_timestamps
+from server.tools.script_executor import execute_script
+
+def write(project, rel_path, content):
+    path = project / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding='utf-8')
+
+def read_tree(project):
+    """{rel_path: content} of every file in the project."""
+    tree = {}
+    for dirpath, _, filenames in os.walk(project):
+        for filename in filenames:
+            full_path = os.path.join(dirpath, filename)
+            tree[os.path.relpath(full_path, project).replace(os.sep, '/')] = open(full_path, encoding='utf-8').read()
+    return tree
+
+def undo_timestamps(project):
+    return get_sorted_stack_timestamps([str(project)], 'undo')
+
+def undo_latest(project):
+    """Runs the newest undo script, as POST /undo does (without moving it to the redo stack)."""
+    project_paths = [str(project)]
+    timestamp = undo_timestamps(project)[-1]
+    with open(os.path.join(get_history_dir(project_paths, 'undo'), f"{timestamp}.sh"), encoding='utf-8') as f:
+        script = f.read()
+    execute_script(script, project_paths, snapshot_dir=get_snapshot_dir(project_paths, timestamp))
+    for extension in ('sh', 'redo'):
+        os.remove(os.path.join(get_history_dir(project_paths, 'undo'), f"{timestamp}.{extension}"))
+
+def heredoc(rel_path, content, delimiter='EOF'):
+    return f"cat > {rel_path} << '{delimiter}'\n{content}\n{delimiter}\n"
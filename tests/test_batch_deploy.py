@@ -0,0 +1,98 @@
+import pytest
+from server.tools.deploy_history import run_batch_deploy
+from server.tools.script_executor import coalesce_writes, iter_script_operations, split_script_lines
+from .helpers import write, read_tree, undo_timestamps, undo_latest, heredoc
+
+PATCH_C1_TO_C2 = "patch c.txt << 'EOF'\n<<<<<<< SEARCH\nc1\n=======\nc2\n>>>>>>> REPLACE\nEOF\n"
+
+def operations(script):
+    return list(iter_script_operations(split_script_lines(script), 'EOF'))
+
+def kept_lines(script, resolver):
+    kept, dropped = coalesce_writes(operations(script), resolver)
+    return [op.line_num for op in kept], dropped
+
+def test_coalesce_drops_writes_replaced_by_a_later_write(resolver):
+    script = heredoc('a.txt', 'a1') + heredoc('b.txt', 'b') + heredoc('a.txt', 'a2')
+    assert kept_lines(script, resolver) == ([4, 7], 1)
+
+def test_coalesce_drops_the_whole_write_patch_chain(resolver):
+    script = heredoc('c.txt', 'c1') + PATCH_C1_TO_C2 + heredoc('c.txt', 'c3')
+    assert kept_lines(script, resolver) == ([11], 2)
+
+def test_coalesce_keeps_writes_a_command_touches_in_between(resolver):
+    script = heredoc('a.txt', 'a1') + "mv a.txt b.txt\n" + heredoc('a.txt', 'a2')
+    assert kept_lines(script, resolver) == ([1, 4, 5], 0)
+
+def test_coalesce_keeps_writes_under_a_touched_directory(resolver):
+    script = heredoc('d/a.txt', 'a1') + "mv d e\n" + heredoc('d/a.txt', 'a2')
+    assert kept_lines(script, resolver) == ([1, 4, 5], 0)
+
+def test_coalesce_keeps_a_write_read_by_a_later_patch(resolver):
+    script = heredoc('c.txt', 'c1') + PATCH_C1_TO_C2
+    assert kept_lines(script, resolver) == ([1, 4], 0)
+
+def test_coalesce_keeps_unsafe_paths_so_they_fail(resolver):
+    script = heredoc('../x.txt', 'x1') + heredoc('../x.txt', 'x2')
+    assert kept_lines(script, resolver) == ([1, 4], 0)
+
+SCRIPTS = [
+    heredoc('a.txt', 'a1') + heredoc('c.txt', 'c1'),
+    heredoc('a.txt', 'a2') + PATCH_C1_TO_C2,
+    heredoc('a.txt', 'a3') + "mv c.txt d.txt\n" + heredoc('c.txt', 'c3'),
+]
+FINAL_TREE = {'a.txt': 'a3\n', 'b.txt': 'keep\n', 'c.txt': 'c3\n', 'd.txt': 'c2\n'}
+
+def test_batch_writes_final_content_as_one_entry(project, resolver):
+    write(project, 'a.txt', 'old\n')
+    write(project, 'b.txt', 'keep\n')
+    output_log, error_log, coalesced = run_batch_deploy([str(project)], SCRIPTS, resolver, 'EOF')
+    assert read_tree(project) == FINAL_TREE
+    assert (error_log, coalesced) == ([], 2)
+    assert output_log.count("Wrote file: a.txt") == 1
+    assert len(undo_timestamps(project)) == 1
+
+    undo_latest(project)
+    assert read_tree(project) == {'a.txt': 'old\n', 'b.txt': 'keep\n'}
+
+def test_batch_with_an_entry_per_script_undoes_one_script_at_a_time(project, resolver):
+    write(project, 'a.txt', 'old\n')
+    write(project, 'b.txt', 'keep\n')
+    _, _, coalesced = run_batch_deploy([str(project)], SCRIPTS, resolver, 'EOF', entry_per_script=True)
+    assert read_tree(project) == FINAL_TREE
+    assert coalesced == 0  # No script writes a file twice.
+    assert len(undo_timestamps(project)) == 3
+
+    undo_latest(project)
+    assert read_tree(project) == {'a.txt': 'a2\n', 'b.txt': 'keep\n', 'c.txt': 'c2\n'}
+    undo_latest(project)
+    assert read_tree(project) == {'a.txt': 'a1\n', 'b.txt': 'keep\n', 'c.txt': 'c1\n'}
+    undo_latest(project)
+    assert read_tree(project) == {'a.txt': 'old\n', 'b.txt': 'keep\n'}
+
+@pytest.mark.parametrize('entry_per_script', [False, True])
+def test_failed_batch_rolls_back_every_script(project, resolver, entry_per_script):
+    write(project, 'a.txt', 'old\n')
+    failing = heredoc('a.txt', 'zz') + "rm missing.txt\n"
+    with pytest.raises(FileNotFoundError, match=r"(?s)^Script 2: .*rolled back"):
+        run_batch_deploy([str(project)], [SCRIPTS[0], failing], resolver, 'EOF', entry_per_script=entry_per_script)
+    assert read_tree(project) == {'a.txt': 'old\n'}
+    assert undo_timestamps(project) == []
+
+@pytest.mark.parametrize('entry_per_script', [False, True])
+def test_redo_replays_what_the_batch_applied(client, project, entry_per_script):
+    unterminated = heredoc('a.txt', 'a1') + "cat > b.txt << 'EOF'\nnever closed\n"
+    scripts = [unterminated, heredoc('c.txt', 'c1'), heredoc('d.txt', 'd1')]
+    args = {'path': str(project), 'delimiter': 'EOF', 'tolerateErrors': 'true', 'historyPerScript': str(entry_per_script).lower()}
+    response = client.post('/deploycode/batch', query_string=args, json={'scripts': scripts})
+    assert response.status_code == 200
+    applied = read_tree(project)
+    assert applied == {'a.txt': 'a1\n', 'c.txt': 'c1\n', 'd.txt': 'd1\n'}
+
+    entries = len(undo_timestamps(project))
+    for _ in range(entries):
+        assert client.post('/undo', query_string={'path': str(project)}).status_code == 200
+    assert read_tree(project) == {}
+    for _ in range(entries):
+        assert client.post('/redo', query_string={'path': str(project)}).status_code == 200
+    assert read_tree(project) == applied
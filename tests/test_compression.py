@@ -0,0 +1,53 @@
+import gzip
+import zlib
+import pytest
+from flask import Flask, Response
+from server.tools.compression import init_compression
+
+BODY = "line of context\n" * 1000
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('JUSTCODE_COMPRESSION', 'auto')
+    app = Flask(__name__)
+    init_compression(app)
+    app.add_url_rule('/text', 'text', lambda: Response(BODY, mimetype='text/plain'))
+    app.add_url_rule('/small', 'small', lambda: Response("tiny", mimetype='text/plain'))
+    app.add_url_rule('/binary', 'binary', lambda: Response(BODY, mimetype='application/octet-stream'))
+    return app.test_client()
+
+REMOTE = {'REMOTE_ADDR': '192.168.1.20'}
+
+def test_gzip_is_negotiated_for_remote_clients(client):
+    response = client.get('/text', headers={'Accept-Encoding': 'gzip'}, environ_base=REMOTE)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).decode() == BODY
+
+def test_deflate_is_the_zlib_container(client):
+    response = client.get('/text', headers={'Accept-Encoding': 'deflate'}, environ_base=REMOTE)
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(response.data).decode() == BODY
+
+def test_client_preference_is_respected(client):
+    response = client.get('/text', headers={'Accept-Encoding': 'gzip;q=0.5, deflate;q=1'}, environ_base=REMOTE)
+    assert response.headers['Content-Encoding'] == 'deflate'
+
+@pytest.mark.parametrize('path, headers, environ', [
+    ('/text', {'Accept-Encoding': 'gzip'}, {'REMOTE_ADDR': '127.0.0.1'}),  # Loopback in auto mode.
+    ('/text', {}, REMOTE),
+    ('/text', {'Accept-Encoding': 'identity'}, REMOTE),
+    ('/small', {'Accept-Encoding': 'gzip'}, REMOTE),
+    ('/binary', {'Accept-Encoding': 'gzip'}, REMOTE),
+])
+def test_responses_left_uncompressed(client, path, headers, environ):
+    response = client.get(path, headers=headers, environ_base=environ)
+    assert 'Content-Encoding' not in response.headers
+
+def test_on_mode_compresses_for_loopback_clients(monkeypatch):
+    monkeypatch.setenv('JUSTCODE_COMPRESSION', 'on')
+    app = Flask(__name__)
+    init_compression(app)
+    app.add_url_rule('/text', 'text', lambda: Response(BODY, mimetype='text/plain'))
+    response = app.test_client().get('/text', headers={'Accept-Encoding': 'gzip'}, environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert gzip.decompress(response.data).decode() == BODY
@@ -0,0 +1,52 @@
+from server.tools.context_manifest import build_manifest, diff_manifests, get_manifest_scope, load_manifest, save_manifest, OMITTED
+from .helpers import write
+
+def test_diff_reports_changed_and_deleted_paths():
+    old = build_manifest([('./a', 'a'), ('./b', 'b'), ('./c', 'c')])
+    new = build_manifest([('./a', 'a'), ('./b', 'B'), ('./d', 'd')])
+    assert diff_manifests(old, new) == (['./b', './d'], ['./c'])
+
+def test_omitted_files_are_neither_sent_nor_deleted():
+    old = build_manifest([('./a', 'a'), ('./b', 'b')])
+    new = build_manifest([('./a', 'a')], omitted_paths=['./b'])
+    assert new['./b'] == OMITTED
+    assert diff_manifests(old, new) == ([], [])
+    # Once it fits the budget again, the omitted file is sent.
+    assert diff_manifests(new, old) == (['./b'], [])
+
+def test_token_only_applies_to_its_scope(project):
+    scope = get_manifest_scope(['*.py'], ['build/'])
+    token = save_manifest([str(project)], {'./a': 'x'}, scope)
+    assert load_manifest([str(project)], token, scope) == {'./a': 'x'}
+    assert load_manifest([str(project)], token, get_manifest_scope(['*.py'], [])) is None
+    assert load_manifest([str(project)], token, get_manifest_scope(['*.py'], ['build/'], use_git=True)) is None
+    assert load_manifest([str(project)], 'unknown', scope) is None
+
+def get_context(client, project, **args):
+    return client.get('/getcontext', query_string={'path': str(project), **args})
+
+def test_delta_context_sends_only_changes(client, project):
+    write(project, 'a.txt', 'a\n')
+    write(project, 'b.txt', 'b\n')
+    write(project, 'c.txt', 'c\n')
+    first = get_context(client, project, since='')
+    assert first.headers['X-JustCode-Context-Mode'] == 'full'
+    token = first.headers['X-JustCode-Context-Token']
+
+    write(project, 'b.txt', 'B\n')
+    (project / 'c.txt').unlink()
+    delta = get_context(client, project, since=token)
+    body = delta.get_data(as_text=True)
+    assert delta.headers['X-JustCode-Context-Mode'] == 'delta'
+    assert "cat > ./b.txt" in body and "cat > ./a.txt" not in body
+    assert "rm -f ./c.txt" in body
+
+def test_delta_with_other_patterns_falls_back_to_a_full_context(client, project):
+    write(project, 'a.txt', 'a\n')
+    write(project, 'b.txt', 'b\n')
+    token = get_context(client, project, since='').headers['X-JustCode-Context-Token']
+
+    response = get_context(client, project, since=token, exclude='b.txt')
+    body = response.get_data(as_text=True)
+    assert response.headers['X-JustCode-Context-Mode'] == 'full'
+    assert "cat > ./a.txt" in body and "rm -f" not in body
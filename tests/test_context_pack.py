@@ -0,0 +1,100 @@
+import os
+import pytest
+from server.tools import context_pack
+from server.tools.context_pack import get_context_pack, get_pack_projects
+from server.tools.context_generator import generate_context_from_path
+from .helpers import write
+
+def build(project, **kwargs):
+    project_paths = [str(project)]
+    projects = get_pack_projects(project_paths, [], [], ['*.log'])
+    pack = get_context_pack(project_paths, projects, 'EOF', **kwargs)
+    try:
+        return pack.read().decode('utf-8'), pack.rebuilt_entries
+    finally:
+        pack.file.close()
+
+def touch(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+@pytest.fixture
+def files(project):
+    write(project, 'a.txt', 'a\n')
+    write(project, 'src/b.py', 'b = 1\n')
+    write(project, 'skip.log', 'excluded\n')
+    return project
+
+def test_pack_matches_the_generated_context(files):
+    body, rebuilt = build(files)
+    assert rebuilt == 2
+    assert body == generate_context_from_path(str(files), [], ['*.log'], delimiter='EOF')
+
+def test_unchanged_project_is_served_without_reading_files(files):
+    first, _ = build(files)
+    second, rebuilt = build(files)
+    assert (second, rebuilt) == (first, 0)
+
+def test_only_files_with_new_stats_are_read_again(files):
+    build(files)
+    write(files, 'a.txt', 'changed\n')
+    touch(files / 'a.txt', 10**18)
+    body, rebuilt = build(files)
+    assert rebuilt == 1
+    assert "changed\n" in body
+    assert body == generate_context_from_path(str(files), [], ['*.log'], delimiter='EOF')
+
+def test_same_size_rewrite_is_detected_by_mtime(files):
+    build(files)
+    write(files, 'a.txt', 'A\n')
+    touch(files / 'a.txt', 10**18)
+    body, rebuilt = build(files)
+    assert rebuilt == 1 and "A\n" in body
+
+def test_added_and_removed_files_rebuild_the_tree(files):
+    build(files)
+    write(files, 'src/c.py', 'c = 3\n')
+    (files / 'a.txt').unlink()
+    body, rebuilt = build(files)
+    assert rebuilt == 1
+    assert body == generate_context_from_path(str(files), [], ['*.log'], delimiter='EOF')
+    assert "a.txt" not in body
+
+def test_unreadable_files_are_left_out_without_rebuilding_every_time(files, monkeypatch):
+    unreadable = str(files / 'a.txt')
+    is_readable = context_pack._is_readable
+    monkeypatch.setattr(context_pack, '_is_readable', lambda path: path != unreadable and is_readable(path))
+
+    body, _ = build(files)
+    assert "a.txt" not in body and "src/b.py" in body
+    _, rebuilt = build(files)
+    assert rebuilt == 0
+
+    # Readable again (e.g. permissions fixed): same stats, but the pack is rebuilt with it.
+    monkeypatch.setattr(context_pack, '_is_readable', is_readable)
+    body, rebuilt = build(files)
+    assert rebuilt == 1 and "cat > ./a.txt" in body
+
+def test_cancelled_build_keeps_the_previous_pack(files):
+    first, _ = build(files)
+    write(files, 'a.txt', 'changed\n')
+    touch(files / 'a.txt', 10**18)
+    class Stop(Exception): pass
+    calls = []
+    def check_cancelled():
+        calls.append(1)
+        if len(calls) > 3: raise Stop()
+    with pytest.raises(Stop):
+        build(files, check_cancelled=check_cancelled)
+    pack_dir = context_pack.get_pack_dir([str(files)])
+    assert not [name for name in os.listdir(pack_dir) if name.endswith('.tmp')]
+    [pack_name] = [name for name in os.listdir(pack_dir) if name.endswith('.pack')]
+    with open(os.path.join(pack_dir, pack_name), encoding='utf-8') as f:
+        assert f.read() == first
+    body, _ = build(files)
+    assert "changed\n" in body
+
+def test_getcontext_serves_the_same_text_with_and_without_a_pack(client, files):
+    args = {'path': str(files), 'exclude': '*.log', 'delimiter': 'EOF'}
+    packed = client.get('/getcontext', query_string=args).get_data(as_text=True)
+    walked = client.get('/getcontext', query_string={**args, 'pack': 'false'}).get_data(as_text=True)
+    assert packed == walked
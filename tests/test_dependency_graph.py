@@ -0,0 +1,50 @@
+from server.tools.dependency_graph import build_dependency_graph, rank_entries, select_entries_within_budget
+from .helpers import write
+
+ENTRIES = [
+    ('./app/main.py', "from app import models\nfrom .util import helper\n"),
+    ('./app/models.py', "import app.db\n"),
+    ('./app/db.py', "import os\n"),
+    ('./app/util.py', "def helper(): pass\n"),
+    ('./web/index.js', "import { api } from './api';\nconst x = require('../app/none');\n"),
+    ('./web/api.js', "export const api = 1;\n"),
+    ('./docs/readme.md', "nothing imported\n"),
+]
+
+def test_graph_resolves_python_and_js_imports():
+    graph = build_dependency_graph(ENTRIES)
+    assert graph['app/main.py'] == {'app/models.py', 'app/util.py'}
+    assert graph['app/models.py'] == {'app/db.py'}
+    assert graph['web/index.js'] == {'web/api.js'}
+    assert graph['docs/readme.md'] == set()
+
+def test_entries_rank_by_distance_to_the_seeds():
+    ranked, distances = rank_entries(ENTRIES, seeds=['app/models.py'])
+    assert [path for path, _ in ranked[:2]] == ['./app/models.py', './app/db.py']
+    assert distances['app/main.py'] == 1 and distances['app/util.py'] == 2
+    assert 'web/api.js' not in distances
+
+def test_selection_keeps_the_most_relevant_entries_in_order():
+    selected, omitted = select_entries_within_budget(ENTRIES, 90, seeds=['app/main.py'])
+    assert [path for path, _ in selected] == ['./app/main.py', './app/models.py', './app/util.py']
+    assert len(selected) + len(omitted) == len(ENTRIES)
+
+def test_known_sizes_are_not_measured_again():
+    measured = []
+    def size_fn(content):
+        measured.append(content)
+        return 1
+    sizes = {path: 1 for path, _ in ENTRIES[1:]}
+    selected, _ = select_entries_within_budget(ENTRIES, 100, size_fn=size_fn, sizes=sizes)
+    assert len(selected) == len(ENTRIES)
+    assert measured == [ENTRIES[0][1]]
+
+def test_token_budget_selection_through_the_endpoint(client, project):
+    write(project, 'main.py', "import helper\n" + "x = 1\n" * 50)
+    write(project, 'helper.py', "y = 2\n" * 50)
+    write(project, 'other.py', "z = 3\n" * 400)
+    response = client.get('/getcontext', query_string={'path': str(project), 'limit_tokens': 700, 'seed': 'main.py'})
+    body = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert "cat > ./main.py" in body and "cat > ./helper.py" in body
+    assert "cat > ./other.py" not in body
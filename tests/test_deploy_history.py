@@ -0,0 +1,65 @@
+import os
+import shutil
+import pytest
+from server.tools.deploy_history import run_deploy
+from server.tools.history_manager import get_history_dir, get_snapshot_dir
+from .helpers import write, read_tree, undo_timestamps, heredoc
+
+def deploy(project, resolver, script, **kwargs):
+    return run_deploy([str(project)], script.split('\n'), resolver, 'EOF', **kwargs)
+
+def test_failed_deploy_rolls_back_applied_operations(project, resolver):
+    write(project, 'a.txt', 'old\n')
+    with pytest.raises(FileNotFoundError, match="rolled back"):
+        deploy(project, resolver, heredoc('a.txt', 'new') + heredoc('b.txt', 'b') + "rm missing.txt")
+    assert read_tree(project) == {'a.txt': 'old\n'}
+    assert undo_timestamps(project) == []
+    assert os.listdir(get_history_dir([str(project)], 'undo')) == []
+
+def test_stream_failure_rolls_back_applied_operations(project, resolver):
+    write(project, 'a.txt', 'old\n')
+    def lines():
+        yield from heredoc('a.txt', 'new').split('\n')
+        raise OSError("client disconnected")
+    with pytest.raises(OSError, match="client disconnected"):
+        run_deploy([str(project)], lines(), resolver, 'EOF')
+    assert read_tree(project) == {'a.txt': 'old\n'}
+    assert undo_timestamps(project) == []
+
+def test_tolerated_errors_keep_the_deploy(project, resolver):
+    output_log, error_log = deploy(project, resolver, heredoc('a.txt', 'a') + "rm missing.txt\nmv missing.txt b.txt", tolerate_errors=True)
+    assert read_tree(project) == {'a.txt': 'a\n'}
+    assert len(error_log) == 1  # The 'mv'; 'rm' of a missing file is only skipped when errors are tolerated.
+    assert len(undo_timestamps(project)) == 1
+
+@pytest.mark.parametrize('path', ['../escape.txt', '/etc/escape.txt'])
+def test_unsafe_path_rejects_the_deploy_even_when_errors_are_tolerated(project, resolver, path):
+    write(project, 'a.txt', 'old\n')
+    with pytest.raises(PermissionError, match="rolled back"):
+        deploy(project, resolver, heredoc('a.txt', 'new') + heredoc(path, 'x'), tolerate_errors=True)
+    assert read_tree(project) == {'a.txt': 'old\n'}
+    assert not os.path.exists(project.parent / 'escape.txt')
+    assert undo_timestamps(project) == []
+
+def test_entry_is_kept_when_the_rollback_fails(project, resolver):
+    write(project, 'a.txt', 'old\n')
+    snapshots_root = os.path.dirname(get_snapshot_dir([str(project)], 0))
+    def lines():
+        yield from heredoc('a.txt', 'new').split('\n')
+        shutil.rmtree(snapshots_root)  # The snapshot that would restore a.txt is gone.
+        raise OSError("boom")
+    with pytest.raises(OSError, match="kept on the undo stack"):
+        run_deploy([str(project)], lines(), resolver, 'EOF')
+    assert read_tree(project) == {'a.txt': 'new\n'}
+    assert len(undo_timestamps(project)) == 1
+
+def test_stale_pending_entries_are_swept(project, resolver):
+    undo_stack_dir = get_history_dir([str(project)], 'undo')
+    stale = os.path.join(undo_stack_dir, '.pending-123.redo')
+    open(stale, 'w').close()
+    os.utime(stale, (0, 0))
+    os.makedirs(get_snapshot_dir([str(project)], '123'))
+
+    deploy(project, resolver, "touch a.txt")
+    assert not os.path.exists(stale)
+    assert not os.path.exists(get_snapshot_dir([str(project)], '123'))
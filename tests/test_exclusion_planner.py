@@ -0,0 +1,40 @@
+from server.tools.exclusion_planner import plan_exclusions
+
+def stats(**sizes):
+    """{path: {'chars': size}} from keyword arguments, with '__' standing for '/'."""
+    return {path.replace('__', '/'): {'chars': size, 'lines': 1, 'tokens': size // 4} for path, size in sizes.items()}
+
+def patterns(plan):
+    return [entry['pattern'] for entry in plan]
+
+def test_nothing_is_planned_under_budget():
+    assert plan_exclusions(stats(a=10, b=20), 30) == ([], 30)
+
+def test_vendored_and_generated_paths_go_first():
+    file_stats = stats(src__app=500, node_modules__lib=300, dist__bundle=200, package_lock=0)
+    plan, remaining = plan_exclusions(file_stats, 600)
+    assert patterns(plan) == ['node_modules/', 'dist/']
+    assert [entry['reason'] for entry in plan] == ['vendored', 'generated']
+    assert remaining == 500
+
+def test_smallest_plain_candidate_covering_the_excess_is_preferred():
+    file_stats = stats(docs__big=400, docs__small=60, src__a=300, data=100)
+    plan, remaining = plan_exclusions(file_stats, 800)
+    assert patterns(plan) == ['docs/small']
+    assert remaining == 800
+
+def test_largest_candidates_are_taken_when_none_covers_the_excess():
+    file_stats = stats(a=100, b=90, c=80)
+    plan, remaining = plan_exclusions(file_stats, 100)
+    assert patterns(plan) == ['a', 'c']
+    assert remaining == 90
+
+def test_protected_directories_are_never_excluded_whole():
+    file_stats = stats(proj__a=100, proj__b=100)
+    plan, _ = plan_exclusions(file_stats, 150, protected_paths=['proj/'])
+    assert patterns(plan) == ['proj/a']
+
+def test_budget_can_be_in_tokens():
+    plan, remaining = plan_exclusions(stats(a=400, b=40), 20, metric='tokens')
+    assert patterns(plan) == ['a']
+    assert remaining == 10
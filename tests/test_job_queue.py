@@ -0,0 +1,80 @@
+import threading
+import time
+import pytest
+from server.tools.job_queue import JobQueue, run_shell_job, get_job_queue
+from .helpers import write
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(workers=1, dedicated_workers={'context_script': 1})
+    yield queue
+    queue.shutdown()
+
+def test_job_result_and_logs(queue):
+    def work(job, value):
+        job.log("working\n")
+        return value * 2
+    job = queue.submit('test', work, 21)
+    assert job.wait(5)
+    assert (job.status, job.result, job.get_logs()) == ('succeeded', 42, ("working\n", 1))
+
+def test_failed_job_keeps_the_error(queue):
+    def fail(job):
+        raise RuntimeError("broken")
+    job = queue.submit('test', fail)
+    job.wait(5)
+    assert (job.status, job.error) == ('failed', "broken")
+
+def test_cancelled_queued_job_never_starts(queue):
+    release = threading.Event()
+    blocker = queue.submit('test', lambda job: release.wait(5))
+    started = []
+    queued = queue.submit('test', lambda job: started.append(True))
+    queued.cancel()
+    release.set()
+    blocker.wait(5)
+    assert queued.status == 'cancelled'
+    time.sleep(0.05)
+    assert started == []
+
+def test_cancel_terminates_a_running_command(queue, tmp_path):
+    job = queue.submit('test', run_shell_job, "echo started; sleep 30", str(tmp_path))
+    while "started" not in job.get_logs()[0]:
+        time.sleep(0.01)
+    began = time.monotonic()
+    job.cancel()
+    assert job.wait(5)
+    assert job.status == 'cancelled'
+    assert time.monotonic() - began < 5
+
+def test_command_timeout_fails_the_job(queue, tmp_path):
+    job = queue.submit('test', run_shell_job, "sleep 30", str(tmp_path), timeout=0.2)
+    assert job.wait(5)
+    assert job.status == 'failed' and "timed out" in job.error
+
+def test_context_scripts_do_not_queue_behind_other_jobs(queue):
+    release = threading.Event()
+    blocker = queue.submit('post_deploy_script', lambda job: release.wait(5))
+    context_job = queue.submit('context_script', lambda job: "output")
+    try:
+        assert context_job.wait(2)
+        assert context_job.result == "output"
+        assert not blocker.finished
+    finally:
+        release.set()
+
+def test_getcontext_stops_waiting_for_a_slow_context_script(client, project):
+    write(project, 'a.txt', 'a\n')
+    began = time.monotonic()
+    response = client.get('/getcontext', query_string={
+        'path': str(project), 'gather_context': 'true', 'context_script': 'sleep 2', 'context_script_wait': 0.2,
+    })
+    body = response.get_data(as_text=True)
+    job = get_job_queue().get(response.headers['X-JustCode-Job-Id'])
+    try:
+        assert time.monotonic() - began < 1.5
+        assert "cat > ./a.txt" in body
+        assert f"keeps running as job {job.id}" in body
+        assert not job.finished
+    finally:
+        job.cancel()
@@ -0,0 +1,84 @@
+import pytest
+from server.tools.large_files import read_text_file, is_truncated, is_oversized, get_max_file_size, TRUNCATED_HEAD_BYTES, TRUNCATED_TAIL_BYTES
+from server.tools.context_generator import format_context_entry, generate_context_from_path, generate_tree_with_char_counts
+from server.tools.context_pack import get_context_pack, get_pack_projects
+from server.tools.script_executor import iter_script_operations, split_script_lines
+from .helpers import write
+
+EXCERPT_BYTES = TRUNCATED_HEAD_BYTES + TRUNCATED_TAIL_BYTES
+
+def numbered_lines(count):
+    return "".join(f"line {i:06d}\n" for i in range(count))  # 12 bytes per line.
+
+def test_truncation_is_off_by_default(monkeypatch):
+    monkeypatch.delenv('JUSTCODE_MAX_FILE_SIZE', raising=False)
+    assert get_max_file_size() == 0
+    assert not is_oversized(10**9, 0)
+
+def test_files_the_excerpt_would_hold_whole_are_not_cut(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("x" * (EXCERPT_BYTES - 1) + "\n")
+    content, size, truncated = read_text_file(str(path), max_file_size=1024)
+    assert (truncated, size, len(content)) == (False, EXCERPT_BYTES, EXCERPT_BYTES)
+
+def test_oversized_file_keeps_whole_head_and_tail_lines(tmp_path):
+    path = tmp_path / "big.txt"
+    text = numbered_lines(20000)
+    path.write_text(text)
+    content, size, truncated = read_text_file(str(path), max_file_size=100000)
+    head, rest = content.split('\n[TRUNCATED BY JUSTCODE: ', 1)
+    marker, tail = rest.split('\n', 1)
+    assert truncated and size == len(text)
+    assert text.startswith(head + '\n') and text.endswith(tail)
+    assert len(head) <= TRUNCATED_HEAD_BYTES and len(tail) <= TRUNCATED_TAIL_BYTES
+    omitted = len(text) - len(head) - 1 - len(tail)
+    assert marker.startswith(f"{len(text):,} bytes in full, {omitted:,} bytes ({omitted // 12:,} lines) omitted here.")
+    assert is_truncated(content)
+
+def test_marker_is_a_line_of_its_own_when_the_head_has_no_newline(tmp_path):
+    path = tmp_path / "minified.js"
+    path.write_text("x" * (EXCERPT_BYTES * 2))
+    content, _, truncated = read_text_file(str(path), max_file_size=1)
+    assert truncated
+    assert "\n[TRUNCATED BY JUSTCODE: " in content
+    assert is_truncated(content)
+
+def test_ordinary_text_mentioning_the_marker_is_not_an_excerpt():
+    assert not is_truncated('marker = f"[TRUNCATED BY JUSTCODE: {size:,} bytes in full"\n')
+
+def test_excerpt_is_not_deployable():
+    content = "head\n[TRUNCATED BY JUSTCODE: 2,000,000 bytes in full, 1,900,000 bytes (1,000 lines) omitted here. Do not rewrite this file from this excerpt.]\ntail"
+    block = format_context_entry('./big.txt', content, 'EOF')
+    assert block.startswith("# TRUNCATED: ./big.txt (not deployable")
+    assert "cat >" not in block
+    assert all(line.startswith('#') for line in block.strip().split('\n'))
+    assert list(iter_script_operations(split_script_lines(block), 'EOF')) == []
+
+@pytest.fixture
+def big_project(project):
+    write(project, 'big.txt', numbered_lines(20000))
+    write(project, 'small.txt', 'small\n')
+    return project
+
+def test_pack_and_walk_label_and_format_excerpts_alike(big_project):
+    project_paths = [str(big_project)]
+    pack = get_context_pack(project_paths, get_pack_projects(project_paths, [], [], []), 'EOF', max_file_size=100000)
+    try:
+        packed = pack.read().decode('utf-8')
+    finally:
+        pack.file.close()
+    walked = generate_context_from_path(str(big_project), [], [], delimiter='EOF', max_file_size=100000)
+    assert packed == walked
+    assert "big.txt [truncated: 240,000 bytes]" in walked
+    assert "# TRUNCATED: ./big.txt" in walked and "cat > ./small.txt" in walked
+
+    stats_tree, _, _ = generate_tree_with_char_counts(str(big_project), [], [], max_file_size=100000)
+    assert stats_tree.split('\n')[1].endswith(" [truncated: 240,000 bytes]")
+
+def test_getcontext_sends_files_whole_by_default(client, big_project, monkeypatch):
+    monkeypatch.delenv('JUSTCODE_MAX_FILE_SIZE', raising=False)
+    body = client.get('/getcontext', query_string={'path': str(big_project)}).get_data(as_text=True)
+    assert "TRUNCATED" not in body and "line 019999\n" in body
+
+    body = client.get('/getcontext', query_string={'path': str(big_project), 'max_file_size': 100000}).get_data(as_text=True)
+    assert "# TRUNCATED: ./big.txt" in body and "line 019999\n" in body and "line 010000\n" not in body
@@ -0,0 +1,55 @@
+import time
+import threading
+from server.tools import prewarm
+from server.tools.project_locks import project_write_lock, has_waiting_writer
+from server.tools.context_pack import get_context_pack, get_pack_projects
+from server.tools.large_files import get_max_file_size
+from .helpers import write
+
+def test_prewarm_builds_the_context_pack(project):
+    write(project, 'a.txt', 'a\n')
+    job = prewarm.start_prewarm([str(project)], [], [], delimiter='EOF', use_git=False, use_context_pack=True)
+    assert job.wait(5)
+    assert job.status == 'succeeded'
+    assert job.result['statsFiles'] == 1 and job.result['packFilesRead'] == 1
+
+    pack = get_context_pack([str(project)], get_pack_projects([str(project)], [], [], []), 'EOF', max_file_size=get_max_file_size())
+    pack.file.close()
+    assert pack.rebuilt_entries == 0
+
+def test_prewarm_steps_aside_for_a_waiting_deploy(project, monkeypatch):
+    for i in range(20):
+        write(project, f'f{i}.txt', f'{i}\n')
+    project_paths = [str(project)]
+    writer_done = threading.Event()
+    reading = threading.Event()
+    release_reader = threading.Event()
+
+    # Stand in for a large project: the first file read blocks until a deploy is queued behind the prewarm.
+    real_warm = prewarm._warm_caches
+    def slow_warm(job, check_cancelled, *args):
+        def check():
+            if not writer_done.is_set():
+                reading.set()
+                release_reader.wait(5)
+            check_cancelled()
+        return real_warm(job, check, *args)
+    monkeypatch.setattr(prewarm, '_warm_caches', slow_warm)
+
+    job = prewarm.start_prewarm(project_paths, [], [], delimiter='EOF', use_git=False, use_context_pack=True)
+    assert reading.wait(5)
+
+    def deploy():
+        with project_write_lock(project_paths):
+            writer_done.set()
+    writer = threading.Thread(target=deploy)
+    writer.start()
+    while not has_waiting_writer(project_paths): time.sleep(0.001)
+    release_reader.set()
+
+    # The deploy gets the lock after the current file, not after the whole prewarm.
+    writer.join(5)
+    assert writer_done.is_set()
+    assert job.wait(5)
+    assert job.status == 'succeeded'
+    assert "starting over" in job.get_logs()[0]
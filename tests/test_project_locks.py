@@ -0,0 +1,64 @@
+import threading
+import time
+from server.tools.project_locks import ReadWriteLock, project_read_lock, project_write_lock, register_write_listener, get_project_generation, _write_listeners
+
+def start(fn):
+    thread = threading.Thread(target=fn, daemon=True)
+    thread.start()
+    return thread
+
+def test_readers_share_the_lock():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    acquired = threading.Event()
+    start(lambda: (lock.acquire_read(), acquired.set()))
+    assert acquired.wait(1)
+
+def test_writer_waits_for_readers_and_excludes_them():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    writing = threading.Event()
+    start(lambda: (lock.acquire_write(), writing.set()))
+    assert not writing.wait(0.1)
+    lock.release_read()
+    assert writing.wait(1)
+
+    reading = threading.Event()
+    start(lambda: (lock.acquire_read(), reading.set()))
+    assert not reading.wait(0.1)
+    lock.release_write()
+    assert reading.wait(1)
+
+def test_waiting_writer_goes_before_new_readers():
+    lock = ReadWriteLock()
+    lock.acquire_read()
+    order = []
+    start(lambda: (lock.acquire_write(), order.append('writer'), lock.release_write()))
+    time.sleep(0.05)  # The writer is now waiting for the first reader.
+    late_reader = start(lambda: (lock.acquire_read(), order.append('reader'), lock.release_read()))
+    time.sleep(0.05)
+    assert order == []
+    lock.release_read()
+    late_reader.join(1)
+    assert order == ['writer', 'reader']
+
+def test_projects_are_locked_independently(tmp_path):
+    a, b = str(tmp_path / "a"), str(tmp_path / "b")
+    acquired = threading.Event()
+    def read_b():
+        with project_read_lock([b]):
+            acquired.set()
+    with project_write_lock([a]):
+        start(read_b)
+        assert acquired.wait(1)
+
+def test_write_notifies_listeners_and_bumps_the_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr('server.tools.project_locks._write_listeners', list(_write_listeners))
+    notified = []
+    register_write_listener(notified.append)
+    project = str(tmp_path)
+    generation = get_project_generation(project)
+    with project_write_lock([project]):
+        pass
+    assert notified == [[project]]
+    assert get_project_generation(project) == generation + 1
@@ -0,0 +1,35 @@
+import pytest
+from server.tools.search_replace import apply_search_replace, parse_search_replace_blocks
+
+def test_exact_match_replaces_whole_lines_only():
+    content = "x = 1\nreturn ab\nreturn a\n"
+    assert apply_search_replace(content, [(["return a"], ["return b"])]) == "x = 1\nreturn ab\nreturn b\n"
+
+def test_search_never_matches_part_of_a_line():
+    with pytest.raises(ValueError, match="not found"):
+        apply_search_replace("return ab\n", [(["return a"], ["return b"])])
+
+def test_multiple_matches_are_rejected():
+    with pytest.raises(ValueError, match="matches 2 places"):
+        apply_search_replace("a\nb\na\n", [(["a"], ["c"])])
+
+def test_trailing_whitespace_is_ignored():
+    assert apply_search_replace("a  \nb\n", [(["a"], ["c"])]) == "c\nb\n"
+
+def test_indentation_is_ignored_and_replacement_reindented():
+    content = "def f():\n    if x:\n        return 1\n"
+    blocks = [(["if x:", "    return 1"], ["if y:", "    return 2"])]
+    assert apply_search_replace(content, blocks) == "def f():\n    if y:\n        return 2\n"
+
+def test_empty_search_appends():
+    assert apply_search_replace("a", [([], ["b"])]) == "a\nb\n"
+
+def test_empty_replace_removes_the_lines():
+    assert apply_search_replace("a\nb\nc\n", [(["b"], [])]) == "a\nc\n"
+
+def test_blocks_apply_in_order():
+    blocks = parse_search_replace_blocks([
+        "<<<<<<< SEARCH", "a", "=======", "b", ">>>>>>> REPLACE",
+        "<<<<<<< SEARCH", "b", "=======", "c", ">>>>>>> REPLACE",
+    ])
+    assert apply_search_replace("a\n", blocks) == "c\n"
@@ -0,0 +1,46 @@
+import os
+from server.tools.deploy_history import run_deploy
+from server.tools.history_manager import get_snapshot_dir
+from server.tools.snapshot import snapshot_file, restore_file
+from .helpers import write, read_tree, undo_timestamps, undo_latest, heredoc
+
+def deploy(project, resolver, script):
+    return run_deploy([str(project)], script.split('\n'), resolver, 'EOF')
+
+def test_snapshot_is_independent_of_the_source(tmp_path):
+    src, snapshot = tmp_path / "a.txt", tmp_path / "snap" / "a.txt"
+    src.write_text("old\n")
+    assert snapshot_file(str(src), str(snapshot)) in ('reflink', 'copy')
+    with open(src, 'w') as f: f.write("edited in place\n")
+    assert snapshot.read_text() == "old\n"
+    assert os.stat(src).st_ino != os.stat(snapshot).st_ino
+
+def test_restore_keeps_the_snapshot(tmp_path):
+    snapshot, dest = tmp_path / "snap.txt", tmp_path / "dir" / "a.txt"
+    snapshot.write_text("saved\n")
+    restore_file(str(snapshot), str(dest))
+    restore_file(str(snapshot), str(dest))
+    assert dest.read_text() == "saved\n" and snapshot.read_text() == "saved\n"
+
+def test_undo_restores_overwritten_patched_and_removed_files(project, resolver):
+    write(project, 'a.txt', 'a\n')
+    write(project, 'b.txt', 'b\n')
+    write(project, 'c.txt', 'c\n')
+    patch = "patch b.txt << 'EOF'\n<<<<<<< SEARCH\nb\n=======\nB\n>>>>>>> REPLACE\nEOF\n"
+    deploy(project, resolver, heredoc('a.txt', 'new') + patch + "rm c.txt\n" + "mkdir -p sub\n" + heredoc('sub/d.txt', 'd') + "mv a.txt sub/a.txt")
+    assert read_tree(project) == {'sub/a.txt': 'new\n', 'sub/d.txt': 'd\n', 'b.txt': 'B\n'}
+    assert os.listdir(get_snapshot_dir([str(project)], undo_timestamps(project)[-1]))
+
+    undo_latest(project)
+    assert read_tree(project) == {'a.txt': 'a\n', 'b.txt': 'b\n', 'c.txt': 'c\n'}
+
+def test_deploy_writes_in_place_and_keeps_hardlinks(project, resolver, tmp_path):
+    write(project, 'a.txt', 'old\n')
+    outside = tmp_path / "link.txt"
+    os.link(project / 'a.txt', outside)
+    deploy(project, resolver, heredoc('a.txt', 'new'))
+    assert outside.read_text() == "new\n"
+
+    # The snapshot was not a hardlink, so it still holds the original.
+    undo_latest(project)
+    assert (project / 'a.txt').read_text() == "old\n"
@@ -0,0 +1,80 @@
+import os
+import sys
+import types
+import hashlib
+import pytest
+from server.tools import token_estimator
+from server.tools.token_estimator import estimate_tokens_heuristic, count_file_tokens, get_estimator, _TIKTOKEN_BLOB_URL
+
+@pytest.fixture(autouse=True)
+def fresh_estimators(monkeypatch):
+    """Loaded and failed estimators are module state; every test starts from the built-in heuristic only."""
+    monkeypatch.setattr(token_estimator, '_estimators', {'heuristic': estimate_tokens_heuristic})
+    monkeypatch.setattr(token_estimator, '_unavailable_estimators', set())
+    monkeypatch.setattr(token_estimator, '_file_token_cache', {})
+    monkeypatch.delenv('JUSTCODE_TOKENIZER', raising=False)
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch, tmp_path):
+    """A tiktoken stand-in counting one token per character; records the encodings it was asked to load."""
+    module = types.ModuleType('tiktoken')
+    module.loaded = []
+    def get_encoding(name):
+        module.loaded.append(name)
+        return types.SimpleNamespace(encode=lambda text, disallowed_special=(): list(text))
+    module.get_encoding = get_encoding
+    monkeypatch.setitem(sys.modules, 'tiktoken', module)
+    cache_dir = tmp_path / "tiktoken_cache"
+    cache_dir.mkdir()
+    monkeypatch.setenv('TIKTOKEN_CACHE_DIR', str(cache_dir))
+    module.cache_dir = cache_dir
+    return module
+
+def cache_vocabulary(cache_dir, encoding_name='cl100k_base'):
+    (cache_dir / hashlib.sha1(_TIKTOKEN_BLOB_URL.format(encoding_name).encode()).hexdigest()).write_text('')
+
+def test_heuristic_counts_words_numbers_symbols_and_whitespace_runs():
+    assert estimate_tokens_heuristic("") == 0
+    assert estimate_tokens_heuristic("def f(x):") == 6  # def, f, (, x, ), :
+    assert estimate_tokens_heuristic("1234567") == 3
+    assert estimate_tokens_heuristic("a\n\n    b") == 3
+    assert estimate_tokens_heuristic("internationalization") == 1 + 2
+
+def test_auto_without_tiktoken_uses_the_heuristic(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'tiktoken', None)  # Import fails.
+    assert get_estimator('auto')[0] == 'heuristic'
+
+def test_auto_never_downloads_a_vocabulary(fake_tiktoken):
+    assert get_estimator('auto')[0] == 'heuristic'
+    assert fake_tiktoken.loaded == []
+
+def test_auto_uses_a_cached_vocabulary(fake_tiktoken):
+    cache_vocabulary(fake_tiktoken.cache_dir)
+    name, estimate_fn = get_estimator('auto')
+    assert (name, estimate_fn("abc")) == ('tiktoken', 3)
+
+def test_explicit_tiktoken_may_download(fake_tiktoken):
+    assert get_estimator('tiktoken')[0] == 'tiktoken'
+    assert fake_tiktoken.loaded == ['cl100k_base']
+
+def test_unknown_tokenizer_is_an_error():
+    with pytest.raises(ValueError, match="Unknown or unavailable tokenizer"):
+        get_estimator('nope')
+
+def test_file_counts_are_cached_by_fingerprint(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("one two three")
+    calls = []
+    def estimate(text):
+        calls.append(text)
+        return len(text.split())
+    estimator = ('words', estimate)
+
+    assert count_file_tokens(str(path), estimator=estimator) == 3
+    assert count_file_tokens(str(path), estimator=estimator) == 3
+    assert len(calls) == 1
+
+    path.write_text("one two three four")
+    os.utime(path, ns=(0, 10**9))
+    assert count_file_tokens(str(path), estimator=estimator) == 4
+    assert len(calls) == 2